@@ -0,0 +1,75 @@
+import contextlib
+import websockets
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response
+import metrics
+import server
+
+#the relay from server.py as an ASGI app, this is what render.yaml starts:
+#uvicorn asgi:app --host 0.0.0.0 --port $PORT --loop uvloop --http httptools --ws-max-size 16384
+#(--ws-max-size is server.MAX_FRAME, the handler checks it again). Matches,
+#outboxes and the tick loop are server.py's, only the sockets are uvicorn's.
+#GET /metrics has the counters for Prometheus
+
+class Connection:
+    #the part of a websockets connection server.handler uses, on a starlette
+    #WebSocket. Closing shows up as the same exceptions websockets raises
+    def __init__(self, websocket):
+        self.websocket = websocket
+
+    async def recv(self):
+        message = await self.websocket.receive()
+        if message['type'] == 'websocket.disconnect':
+            #a client closing on purpose says 1000 or 1001. uvicorn reports a
+            #lost connection as 1005 or 1006, the server holds that player's seat
+            if message.get('code', 1000) in (1000, 1001):
+                raise websockets.exceptions.ConnectionClosedOK(None, None)
+            raise websockets.exceptions.ConnectionClosedError(None, None)
+        text = message.get('text')
+        return text if text is not None else message.get('bytes')
+
+    async def send(self, message):
+        try:
+            if isinstance(message, str):
+                await self.websocket.send_text(message)
+            else:
+                await self.websocket.send_bytes(message)
+        except (WebSocketDisconnect, RuntimeError, OSError):
+            #RuntimeError: starlette after the close, OSError: uvicorn's ClientDisconnected
+            raise websockets.exceptions.ConnectionClosedError(None, None)
+
+    async def close(self, code=1000, reason=''):
+        with contextlib.suppress(RuntimeError, OSError):
+            await self.websocket.close(code, reason)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.recv()
+        except websockets.exceptions.ConnectionClosedOK:
+            raise StopAsyncIteration
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    print(f"Server started under uvicorn ({server.modeName()} mode), metrics on /metrics")
+    tasks = server.startBackgroundTasks()
+    yield
+    for task in tasks:
+        task.cancel()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.websocket("/")
+async def play(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        await server.handler(Connection(websocket))
+    finally:
+        with contextlib.suppress(WebSocketDisconnect, RuntimeError, OSError):
+            await websocket.close()
+
+@app.get("/metrics")
+def metricsPage():
+    return Response(server.metricsText(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import threading
+import time
+
+#sprites decoded and scaled to their size on screen before the game needs
+#them. A background thread makes one PNG per sprite at exactly the size it is
+#drawn at for the current player radius, keeps them in CACHE_DIR under the
+#hash of the source file and the size, and decodes them. render.py hands the
+#decoded images to cmu_graphics once they are all ready, so no frame ever
+#decodes or rescales a sprite. Until then obstacles are drawn as circles
+
+#obstacle image as the engine names it -> width, height in radii
+SPRITES = {
+    'images\\meteor.png': (3, 3),
+    'images\\comet.png': (4.5, 2),
+    'images/blackhole.png': (3, 3),
+}
+SPRITES.update({f'images\\star{starType}.png': (3, 3) for starType in range(5)})
+CACHE_DIR = '.sprite-cache'
+
+class Sprites:
+    def __init__(self, radius):
+        self.radius = radius
+        #obstacle image -> (cached path or None if the image is missing, width, height in pixels)
+        self.sprites = {}
+        #cached path -> decoded image, for render.py to hand to cmu_graphics
+        self.images = {}
+        self.ready = threading.Event()
+        self.built = 0 #cache files made, the rest were there already
+        self.seconds = None
+
+    def start(self):
+        threading.Thread(target=self.load, name='sprites', daemon=True).start()
+        return self
+
+    def load(self):
+        start = time.perf_counter()
+        #cmu_graphics' image library, imported here like the rest of the
+        #module needs no graphics
+        from cmu_graphics.shape_logic import wyvern
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for img, (w, h) in SPRITES.items():
+            path = img.replace('\\', '/')
+            width, height = max(1, round(w*self.radius)), max(1, round(h*self.radius))
+            if not os.path.exists(path):
+                self.sprites[img] = (None, width, height)
+                continue
+            cached = self.build(wyvern, path, width, height)
+            self.images[cached] = wyvern.load_image_from_path(cached)
+            self.sprites[img] = (cached, width, height)
+        self.seconds = time.perf_counter() - start
+        self.ready.set()
+
+    def build(self, wyvern, path, width, height):
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()[:16]
+        cached = os.path.join(CACHE_DIR, f"{digest}-{width}x{height}.png")
+        if not os.path.exists(cached):
+            surface = wyvern.ImageSurface(width, height)
+            surface.canvas.draw_image(wyvern.load_image_from_path(path).scaled(width, height), 0, 0, 1.0)
+            #written next to it and renamed, a half-written file is never in the cache
+            partial = f"{cached}.{os.getpid()}.part"
+            surface.canvas.save_png(partial)
+            os.replace(partial, cached)
+            self.built += 1
+        return cached
+
+def preload(radius):
+    return Sprites(radius).start()
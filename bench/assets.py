@@ -0,0 +1,74 @@
+#what the first appearance of each sprite costs a frame: the old way (an Image
+#of the source PNG scaled to its size, decoded on creation and rescaled on
+#the first paint) against the preloaded sprites from assets.py. Also the
+#preload itself, with an empty cache and with a warm one. Runs headless in a
+#temp dir with placeholder sprites of SOURCE_SIZE pixels
+#run from the repo root: python -m bench.assets
+from cmu_graphics import *
+from cmu_graphics import cmu_graphics as cg
+from cmu_graphics import shape_logic
+import os
+import sys
+import tempfile
+import time
+import assets
+import render
+from bench.render import png
+
+#pixels a side of the placeholder sprites, about what the real ones are
+SOURCE_SIZE = 512
+#shapes the frame shows, cmu_graphics calls the redrawAll of the module that is run
+SHOWN = []
+
+def redrawAll(app):
+    for shape in SHOWN:
+        app.group.add(shape)
+
+def firstFrame(app, canvas, make):
+    #ms to make the shape and paint the first frame it is in
+    start = time.perf_counter()
+    SHOWN[:] = [make()]
+    app._app.redrawAllWrapper()
+    app._app.redrawAll(canvas)
+    return (time.perf_counter() - start)*1000
+
+def main():
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('images')
+    #sizes apart, the cache would make one file for identical ones
+    for i, img in enumerate(assets.SPRITES):
+        png(img.replace('\\', '/'), SOURCE_SIZE + i)
+
+    cg.setupMvc()
+    app = cg.app
+    app.width, app.height = 800, 600
+    canvas = shape_logic.wyvern.ImageSurface(app.width, app.height).canvas
+    radius = app.height*0.035
+
+    old = []
+    for img, (w, h) in assets.SPRITES.items():
+        path = img.replace('\\', '/')
+        old.append(firstFrame(app, canvas, lambda: render.keep(Image, path, 400, 300, align='center',
+                                                                width=w*radius, height=h*radius)))
+
+    times = []
+    for cache in ('cold', 'warm'):
+        start = time.perf_counter()
+        app.sprites = assets.preload(radius)
+        app.sprites.ready.wait()
+        times.append((cache, (time.perf_counter() - start)*1000, app.sprites.built))
+    sprites = render.readySprites(app)
+    new = [firstFrame(app, canvas, lambda: render.keep(Image, path, 400, 300, align='center'))
+           for path, w, h in sprites.values()]
+
+    print(f"{len(assets.SPRITES)} sprites of {SOURCE_SIZE}px, drawn at radius {radius:.1f}")
+    for cache, ms, built in times:
+        print(f"preload, {cache} cache: {ms:8.1f} ms on its thread, {built} files made")
+    print(f"first frame with a sprite, old: {sum(old)/len(old):6.2f} ms each, worst {max(old):6.2f} ms")
+    print(f"first frame with a sprite, new: {sum(new)/len(new):6.2f} ms each, worst {max(new):6.2f} ms")
+    sys.stdout.flush()
+    #skip cmu_graphics' exit handler, it would try to open a window
+    os._exit(0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#checks that the grid broad phase in engine.checkCollisions gives exactly the
+#same hits as the original all-pairs loops, then times both
+#run from the repo root: python -m bench.collisions [matches] [ticks]
+import copy
+import random
+import sys
+import time
+import engine
+from classes import Star, BlackHole
+from engine import World, swapRemove
+
+#the all-pairs versions, kept as the reference. They use the engine's
+#containers (swapRemove) but no grid and no indexes
+def distance(x1, y1, x2, y2):
+    return ((x1 - x2)**2 + (y1 - y2)**2)**0.5
+
+def latestBlackHole(obstacles):
+    #all black holes fly at one speed, the furthest right spawned last
+    latest = None
+    for obs in obstacles:
+        if isinstance(obs, BlackHole) and (latest is None or obs.x > latest.x):
+            latest = obs
+    return latest
+
+def referenceTeleportCollision(world, traveler, attackerBullets):
+    for i in range(len(attackerBullets)-1, -1, -1):
+        bullet = attackerBullets[i]
+        if distance(bullet.x, bullet.y, traveler.x, traveler.y) < (traveler.r + bullet.r):
+            swapRemove(attackerBullets, i)
+            if traveler.isTeleported:
+                traveler.score = -100
+            else:
+                traveler.takeDamage(30)
+            return
+
+def referenceCollisions(world, player, bullets, obstacles):
+    removed = set()
+    for i in range(len(bullets)-1, -1, -1):
+        bullet = bullets[i]
+        hit = False
+        for j in range(len(obstacles)-1, -1, -1):
+            if j in removed:
+                continue
+            obs = obstacles[j]
+            if distance(bullet.x, bullet.y, obs.x, obs.y) < (obs.r + bullet.r):
+                if isinstance(obs, BlackHole):
+                    if obstacles == world.p1Obstacles:
+                        targetL = world.p2Obstacles
+                    elif obstacles == world.p2Obstacles:
+                        targetL = world.p1Obstacles
+                    targetBH = latestBlackHole(targetL)
+                    if targetBH:
+                        bullet.x = targetBH.x + targetBH.r + bullet.r
+                        bullet.y = targetBH.y
+                        bullet.dx = -bullet.dx
+                        bullet.dy = 0
+                        hit = False
+                        break
+                if not isinstance(obs, Star) and not isinstance(obs, BlackHole):
+                    removed.add(j)
+                    hit = True
+                    break
+        if hit:
+            swapRemove(bullets, i)
+    for j in sorted(removed, reverse=True):
+        swapRemove(obstacles, j)
+
+    for j in range(len(obstacles)-1, -1, -1):
+        obs = obstacles[j]
+        if distance(player.x, player.y, obs.x, obs.y) < (player.r + obs.r):
+            if isinstance(obs, Star):
+                player.collectedStars.add(obs.starType)
+                if len(player.collectedStars) >= 2:
+                    player.isAutoShoot = True
+                    player.autoShootTimeUp = world.counter + (15 * world.stepsPerSecond)
+                    player.collectedStars.clear()
+                swapRemove(obstacles, j)
+            elif isinstance(obs, BlackHole):
+                if world.counter < player.teleportCooldown:
+                    continue
+                swapRemove(obstacles, j)
+                if player.isTeleported:
+                    player.isTeleported = False
+                    player.teleportCooldown = world.counter + (1 * world.stepsPerSecond)
+                    player.minY = player.homeMinY
+                    player.maxY = player.homeMaxY
+                    player.x = world.playerX
+                    player.y = (player.homeMinY + player.homeMaxY)/2
+                else:
+                    player.isTeleported = True
+                    player.teleportTimeUp = world.counter + (10 * world.stepsPerSecond)
+                    player.teleportCooldown = world.counter + (2 * world.stepsPerSecond)
+                    if player == world.p1:
+                        targetMinY = world.p2.homeMinY
+                        targetMaxY = world.p2.homeMaxY
+                    else:
+                        targetMinY = world.p1.homeMinY
+                        targetMaxY = world.p1.homeMaxY
+                    player.minY = targetMinY
+                    player.maxY = targetMaxY
+                    player.x = world.width - world.playerX
+                    player.y = world.rng.randint(int(targetMinY + player.r), int(targetMaxY - player.r))
+            else:
+                swapRemove(obstacles, j)
+                player.takeDamage(obs.damage)
+
+def collisionPass(world, teleportCollision, collisions):
+    #the collision half of engine.onStep
+    teleportCollision(world, world.p1, world.p2Bullets)
+    teleportCollision(world, world.p2, world.p1Bullets)
+    for role in world.localRoles:
+        me = world.player(role)
+        myBullets = world.bullets(role)
+        collisions(world, me, myBullets, world.obstacles(role))
+        collisions(world, me, myBullets, world.obstacles(3 - role))
+        collisions(world, me, myBullets, world.bullets(3 - role))
+
+def signature(world):
+    def entity(e):
+        return (type(e).__name__, e.x, e.y, getattr(e, 'dx', None), getattr(e, 'dy', None))
+    players = [(p.x, p.y, p.score, p.isTeleported, p.minY, p.maxY, p.isAutoShoot,
+                sorted(p.collectedStars), p.teleportCooldown) for p in (world.p1, world.p2)]
+    lists = [[entity(e) for e in l] for l in (world.p1Bullets, world.p2Bullets, world.p1Obstacles, world.p2Obstacles)]
+    return players, lists
+
+def recordWorlds(matches, ticks, seed=0):
+    #busy synthetic matches: obstacles in both universes so black holes can
+    #teleport bullets, lots of shooting and auto-shoot switched on
+    worlds = []
+    for m in range(matches):
+        rng = random.Random(seed + m)
+        world = World(800, 600, rng=random.Random(seed + m))
+        world.attackRate = rng.choice((1, 3, 10))
+        for t in range(ticks):
+            inputs = {role: {'move': rng.choice((-1, 0, 1)), 'fire': rng.choice((-1, 1, 1, 0))} for role in (1, 2)}
+            for role, playerInput in inputs.items():
+                engine.applyInput(world, role, playerInput)
+            if rng.random() < 0.3:
+                engine.attackObstacle(world, 2)
+            if t % 90 == 0:
+                for p in (world.p1, world.p2):
+                    p.isAutoShoot = True
+                    p.autoShootTimeUp = world.counter + 60
+            worlds.append(copy.deepcopy(world))
+            world.step()
+            if world.gameOver:
+                world.reset()
+    return worlds
+
+def main():
+    matches = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    worlds = recordWorlds(matches, ticks)
+
+    mismatches = 0
+    for world in worlds:
+        #bring the recorded world to the point where onStep checks collisions
+        engine.updateObjects(world, world.p1Bullets, world.p1Obstacles)
+        engine.updateObjects(world, world.p2Bullets, world.p2Obstacles)
+        a, b = copy.deepcopy(world), copy.deepcopy(world)
+        collisionPass(a, engine.checkTeleportCollision, engine.checkCollisions)
+        collisionPass(b, referenceTeleportCollision, referenceCollisions)
+        if signature(a) != signature(b):
+            mismatches += 1
+    print(f"{len(worlds)} recorded worlds, {mismatches} with different hit results")
+
+    print(f"{'bullets':>8} {'obstacles':>10} {'grid ms':>8} {'old ms':>8}")
+    rng = random.Random(1)
+    for count in (10, 50, 200, 500):
+        world = World(800, 600, rng=random.Random(2))
+        for _ in range(count):
+            role = rng.choice((1, 2))
+            engine.attackObstacle(world, role)
+            world.obstacles(role)[-1].x = rng.uniform(0, 800)
+            engine.fireBullet(world, role, rng.choice((-1, 1)))
+            world.bullets(role)[-1].x = rng.uniform(0, 800)
+        timings = []
+        for teleportCollision, collisions in ((engine.checkTeleportCollision, engine.checkCollisions),
+                                              (referenceTeleportCollision, referenceCollisions)):
+            copies = [copy.deepcopy(world) for _ in range(20)]
+            start = time.perf_counter()
+            for w in copies:
+                collisionPass(w, teleportCollision, collisions)
+            timings.append((time.perf_counter() - start)/len(copies)*1000)
+        print(f"{count:>8} {count:>10} {timings[0]:>8.3f} {timings[1]:>8.3f}")
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
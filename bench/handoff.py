@@ -0,0 +1,106 @@
+#stress test for the snapshot handoff in network.py: a thread plays the enemy
+#and feeds the Inbox as fast as it can, another encodes our outbox like
+#sendGameData, while the game loop steps with takeUpdates/publishSnapshot.
+#The thread switch interval is tiny so they interleave as much as possible
+#run from the repo root: python -m bench.handoff [ticks]
+import random
+import sys
+import threading
+import time
+import network
+import protocol
+from engine import World
+
+class App:
+    pass
+
+def enemyThread(app, stop, counts, errors):
+    #the other client's world, sent as delta frames and decoded like receiveUpdates
+    try:
+        rng = random.Random(1)
+        world = World(800, 600, rng=random.Random(1))
+        world.localRoles = (2,)
+        encoder = protocol.SnapshotEncoder()
+        while not stop.is_set():
+            world.step({2: {'move': rng.choice((-1, 0, 1)), 'fire': rng.choice((-1, 0, 1))}})
+            if world.gameOver:
+                world.reset()
+                world.localRoles = (2,)
+            frame = encoder.encode(protocol.PROTOCOL_DELTA, 2, world.p2, world.p2Bullets, 800, 600)
+            app.inbox.addEnemyFrame(protocol.decodeMessage(frame, 800, 600), time.monotonic())
+            counts['received'] += 1
+    except Exception as e:
+        errors.append(e)
+
+def senderThread(app, stop, counts, errors):
+    try:
+        encoder = protocol.SnapshotEncoder()
+        while not stop.is_set():
+            snapshot = app.outbox
+            if snapshot is None:
+                continue
+            me, myBullets, width, height, takenAt = snapshot
+            encoder.encode(protocol.PROTOCOL_DELTA, 1, me, myBullets, width, height)
+            counts['sent'] += 1
+    except Exception as e:
+        errors.append(e)
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    sys.setswitchinterval(1e-6)
+
+    app = App()
+    app.myRole = 1
+    app.protocol = protocol.PROTOCOL_DELTA
+    app.world = World(800, 600, rng=random.Random(2))
+    app.enemyBullets = {}
+    app.enemyTaken = 0
+    app.worldTaken = None
+    app.lockstepStart = None
+    app.lockstepSim = None
+    app.inbox = network.Inbox()
+    app.outbox = None
+
+    stop = threading.Event()
+    counts = {'received': 0, 'sent': 0}
+    errors = []
+    threads = [threading.Thread(target=fn, args=(app, stop, counts, errors)) for fn in (enemyThread, senderThread)]
+    for t in threads:
+        t.start()
+
+    rng = random.Random(3)
+    handoff = []
+    try:
+        for _ in range(ticks):
+            start = time.perf_counter()
+            network.takeUpdates(app)
+            middle = time.perf_counter()
+            app.world.step({1: {'move': rng.choice((-1, 0, 1)), 'fire': rng.choice((-1, 0, 1))}})
+            end = time.perf_counter()
+            network.publishSnapshot(app)
+            handoff.append(middle - start + time.perf_counter() - end)
+            #what the renderer does with the same lists
+            sum(b.x for b in app.world.p2Bullets)
+            if app.world.gameOver:
+                app.world.reset()
+    except Exception as e:
+        errors.append(e)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    #after one last take every bullet the enemy has out is in our world,
+    #except the ones our world already dropped
+    network.takeUpdates(app)
+    published = {b[0] for b in app.inbox.enemy[2]}
+    missing = published - set(app.enemyBullets)
+    extra = set(app.enemyBullets) - published
+
+    handoff.sort()
+    print(f"{ticks} steps, {counts['received']} enemy frames in, {counts['sent']} frames encoded out")
+    print(f"handoff per step: p50 {handoff[len(handoff)//2]*1e6:.1f} us, max {handoff[-1]*1e6:.1f} us")
+    print(f"errors: {len(errors)} {errors[:3]}, missing bullets: {len(missing)}, stale bullets: {len(extra)}")
+    return 1 if errors or missing or extra else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
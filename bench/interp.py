@@ -0,0 +1,102 @@
+#what the enemy UFO looks like on screen with the old scheme (20 snapshots a
+#second, drawn where the last one said) against the snapshot buffer in
+#network.py (10 a second, drawn INTERP_DELAY in the past). The link has
+#latency, jitter and now and then a late frame, frames stay in order (TCP)
+#run from the repo root: python -m bench.interp [seconds]
+import random
+import sys
+import network
+import protocol
+from engine import World
+
+STEPS_PER_SECOND = 30
+
+def playEnemy(seconds, seed):
+    #the enemy's own world, (time, x, y, player, bullets) after every step.
+    #It holds a direction for a while like a person would
+    rng = random.Random(seed)
+    world = World(800, 600, STEPS_PER_SECOND, localRoles=(2,), rng=random.Random(seed))
+    world.attackRate = 10**9
+    states = []
+    move, held = 0, 0
+    for step in range(seconds*STEPS_PER_SECOND):
+        if held == 0:
+            move, held = rng.choice((-1, 0, 1)), rng.randint(3, 30)
+        held -= 1
+        world.step({2: {'move': move, 'fire': rng.choice((0, 0, 0, 1))}})
+        world.p2.score = 100
+        states.append((step/STEPS_PER_SECOND, world.p2.x, world.p2.y, network.PlayerState(world.p2),
+                       tuple(network.BulletState(b) for b in world.p2Bullets)))
+    return states
+
+def deliver(states, interval, seed):
+    #(arrival time, frame) for a snapshot every interval seconds
+    rng = random.Random(seed)
+    encoder = protocol.SnapshotEncoder()
+    frames = []
+    nextSend = 0
+    arrival = 0
+    for t, x, y, player, bullets in states:
+        if t < nextSend:
+            continue
+        nextSend += interval
+        latency = 0.04 + rng.uniform(0, 0.03)
+        if rng.random() < 0.05:
+            latency += 0.1
+        arrival = max(arrival, t + latency)
+        frames.append((arrival, encoder.encode(protocol.PROTOCOL_DELTA, 2, player, bullets, 800, 600, t)))
+    return frames
+
+def watch(states, frames, interpolate):
+    #where the UFO is drawn at every step of our client, and how many bytes came in
+    inbox = network.Inbox()
+    shown = []
+    i = 0
+    size = 0
+    for t, *_ in states:
+        while i < len(frames) and frames[i][0] <= t:
+            arrival, frame = frames[i]
+            inbox.addEnemyFrame(protocol.decodeMessage(frame, 800, 600), arrival)
+            size += len(frame)
+            i += 1
+        if inbox.enemy is None:
+            shown.append(None)
+        elif interpolate:
+            shown.append(network.sampleTrack(inbox.enemy[3], t - network.INTERP_DELAY))
+        else:
+            shown.append((inbox.player['x'], inbox.player['y']))
+    return shown, size
+
+def measure(states, shown, seconds):
+    #how far behind the drawn UFO is (the lag that fits best), how far off
+    #it is from where the enemy really was that long ago, and hitches: steps
+    #where it moved more than the real one can
+    ys = [y for t, x, y, *_ in states]
+    maxStep = max(abs(a - b) for a, b in zip(ys, ys[1:]))
+    fits = []
+    for lag in range(STEPS_PER_SECOND):
+        errors = [abs(pos[1] - ys[i - lag]) for i, pos in enumerate(shown) if pos is not None and i >= lag]
+        fits.append((sum(errors)/len(errors), lag))
+    error, lag = min(fits)
+    hitches = 0
+    last = None
+    for pos in shown:
+        if pos is not None and last is not None and abs(pos[1] - last[1]) > maxStep*1.01:
+            hitches += 1
+        last = pos
+    return lag/STEPS_PER_SECOND, error, hitches/seconds
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    states = playEnemy(seconds, 0)
+    print(f"{'scheme':>20} {'bytes/s':>8} {'frames/s':>9} {'lag s':>6} {'error px':>9} {'hitches/s':>10}")
+    for name, interval, interpolate in (("20 Hz, last frame", 0.05, False),
+                                        ("10 Hz, interpolated", 0.1, True),
+                                        ("20 Hz, interpolated", 0.05, True)):
+        frames = deliver(states, interval, 1)
+        shown, size = watch(states, frames, interpolate)
+        lag, error, hitches = measure(states, shown, seconds)
+        print(f"{name:>20} {size/seconds:>8.0f} {len(frames)/seconds:>9.1f} {lag:>6.2f} {error:>9.2f} {hitches:>10.2f}")
+
+if __name__ == '__main__':
+    main()
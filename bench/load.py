@@ -0,0 +1,367 @@
+#load test for server.py: starts it on a free port and connects bots that
+#play like network.py does, join, wait for the opponent and send snapshot
+#frames at a fixed rate. Every frame carries a mark in the score field, so
+#the bot on the other end can tell how long the relay took. Reports relay
+#latency, throughput and the server's CPU and memory, and writes it all to a
+#JSON file that --compare can hold a later run against. --spectators adds
+#watchers spread over the matches, the server CPU with 10 and with 1000 of
+#them shows what the spectator tier costs. --flooders makes some bots send
+#far faster than a client does, what the rate limit saves shows against a
+#run with RATE_MESSAGES and RATE_BYTES set out of reach. At the end one
+#more client sends a frame over the server's MAX_FRAME and reports what
+#closed it: the websockets protocol before the frame was read in, or only
+#the handler after (a worker that took the default 1 MiB cap)
+#run from the repo root: python -m bench.load --bots 500 --seconds 20
+#a thousand bots or more need a higher open file limit (ulimit -n), every
+#bot is a socket on both ends
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import types
+import urllib.request
+import websockets
+import protocol
+import recording
+
+#score values the marks go through, one wrap takes far longer than any relay
+MARKS = 1000
+#bytes of the oversized frame, over MAX_FRAME and under websockets' default max_size
+OVERSIZED = 65536
+PROTOCOLS = {'json': protocol.PROTOCOL_JSON, 'binary': protocol.PROTOCOL_BINARY, 'delta': protocol.PROTOCOL_DELTA}
+
+class Counters:
+    def __init__(self):
+        self.measuring = False
+        self.latencies = []
+        self.sent = self.received = 0
+        self.bytesSent = self.bytesReceived = 0
+        self.connected = self.started = self.failed = 0
+        self.watching = self.watched = self.bytesWatched = 0
+        #(bot, mark) -> when the frame was sent, (match, role) -> bot
+        self.sentAt = {}
+        self.bots = {}
+
+def freePort():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def startServer(port, asgi, workers, record=None):
+    #relay mode, with the periodic stats line and per-client logging out of the way
+    env = dict(os.environ, PORT=str(port), AUTHORITATIVE='0', LOCKSTEP='0', STATS_INTERVAL='3600',
+               WORKERS=str(workers))
+    if record is not None:
+        env['RECORD_DIR'] = record
+    if asgi:
+        #the way render.yaml runs it
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                   '--loop', 'uvloop', '--http', 'httptools', '--log-level', 'warning']
+    else:
+        command = [sys.executable, 'server.py']
+    return subprocess.Popen(command, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+async def waitForServer(url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with websockets.connect(url):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+def processStat(pid):
+    #the fields of /proc/<pid>/stat after the command name
+    with open(f'/proc/{pid}/stat') as f:
+        return f.read().rsplit(')', 1)[1].split()
+
+def processUsage(pid):
+    #cpu seconds and resident memory in MB from /proc, None off linux. The
+    #server's children count too, the workers in multi-process mode
+    pids = [pid]
+    try:
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    if int(processStat(entry)[1]) == pid:
+                        pids.append(int(entry))
+                except (OSError, IndexError):
+                    pass
+        cpu = rss = peak = 0
+        for p in pids:
+            fields = processStat(p)
+            with open(f'/proc/{p}/status') as f:
+                status = dict(line.split(':', 1) for line in f)
+            cpu += (int(fields[11]) + int(fields[12]))/os.sysconf('SC_CLK_TCK')
+            rss += int(status['VmRSS'].split()[0])/1024
+            peak += int(status['VmHWM'].split()[0])/1024
+    except OSError:
+        return None
+    return cpu, rss, peak
+
+async def sendFrames(bot, websocket, config, counters, stop):
+    #one UFO drifting up and down, firing so there are always config.bullets
+    #out, the oldest one is replaced by a new one every frame
+    encoder = protocol.SnapshotEncoder()
+    me = types.SimpleNamespace(x=40, y=150, score=0, isTeleported=False)
+    bullets = [types.SimpleNamespace(id=i, x=40 + 10*i, y=150, dx=10, dy=0) for i in range(config.bullets)]
+    nextId = config.bullets
+    interval = 1/(config.floodRate if bot.id < config.flooders else config.rate)
+    nextSend = time.monotonic()
+    frame = 0
+    while not stop.is_set():
+        frame += 1
+        me.y = 150 + (frame % 100)
+        me.score = frame % MARKS
+        if bullets:
+            b = bullets.pop(0)
+            b.id, b.x, b.y = nextId, me.x, me.y
+            nextId += 1
+            bullets.append(b)
+        for b in bullets:
+            b.x = (b.x + b.dx) % 800
+        data = encoder.encode(bot.protocol, bot.role, me, bullets, 800, 600, time.monotonic())
+        counters.sentAt[(bot.id, me.score)] = time.perf_counter()
+        try:
+            await websocket.send(data)
+        except websockets.exceptions.ConnectionClosed:
+            return
+        if counters.measuring:
+            counters.sent += 1
+            counters.bytesSent += len(data)
+        nextSend += interval
+        await asyncio.sleep(max(0, nextSend - time.monotonic()))
+
+async def runBot(botId, url, matchId, config, counters, stop):
+    try:
+        #the match id in the URL like network.py, a multi-process server routes on it
+        target = f"{url}/?match={matchId}" if matchId is not None else url
+        async with websockets.connect(target, ping_interval=None, max_queue=None) as websocket:
+            counters.connected += 1
+            await websocket.send(json.dumps({'type': 'join', 'match': matchId, 'protocols': config.protocols}))
+            joined = json.loads(await websocket.recv())
+            if joined.get('type') != 'joined':
+                counters.failed += 1
+                return
+            bot = types.SimpleNamespace(id=botId, role=joined['role'], match=joined['match'], protocol=None)
+            counters.bots[(bot.match, bot.role)] = botId
+
+            sender = None
+            async for raw in websocket:
+                if stop.is_set():
+                    break
+                data = protocol.decodeMessage(raw, 800, 600)
+                if data is None:
+                    continue
+                if data.get('type') == 'start':
+                    bot.protocol = data.get('protocol', protocol.PROTOCOL_JSON)
+                    counters.started += 1
+                    sender = asyncio.create_task(sendFrames(bot, websocket, config, counters, stop))
+                    continue
+                if data.get('role') is None or 'score' not in data['player']:
+                    continue
+                #the opponent's frame, how long since it was sent
+                opponent = counters.bots.get((bot.match, 3 - bot.role))
+                sentAt = counters.sentAt.pop((opponent, data['player']['score']), None)
+                if counters.measuring:
+                    counters.received += 1
+                    counters.bytesReceived += len(raw)
+                    if sentAt is not None:
+                        counters.latencies.append(time.perf_counter() - sentAt)
+            if sender is not None:
+                sender.cancel()
+    except (OSError, websockets.exceptions.WebSocketException):
+        counters.failed += 1
+
+async def runSpectator(url, matchId, counters, stop):
+    try:
+        async with websockets.connect(f"{url}/?match={matchId}", ping_interval=None, max_queue=None) as websocket:
+            await websocket.send(json.dumps({'type': 'spectate', 'match': matchId}))
+            welcome = json.loads(await websocket.recv())
+            if welcome.get('type') != 'spectating':
+                counters.failed += 1
+                return
+            counters.watching += 1
+            async for raw in websocket:
+                if stop.is_set():
+                    break
+                if counters.measuring:
+                    counters.watched += sum(1 for _ in recording.unpack(raw))
+                    counters.bytesWatched += len(raw)
+    except (OSError, websockets.exceptions.WebSocketException):
+        counters.failed += 1
+
+async def sendOversized(url):
+    #who closed the connection on a frame over MAX_FRAME: 'protocol', 'handler' or 'nobody'
+    try:
+        async with websockets.connect(f"{url}/?match=load-oversized", max_size=None) as websocket:
+            await websocket.send(json.dumps({'type': 'join', 'match': 'load-oversized',
+                                             'protocols': [protocol.PROTOCOL_JSON]}))
+            await websocket.recv()
+            await websocket.send(b'\0'*OVERSIZED)
+            await asyncio.wait_for(websocket.wait_closed(), 5)
+    except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException):
+        return 'nobody'
+    if websocket.close_code != 1009:
+        return 'nobody'
+    #server.handler's own reason, websockets names the sizes
+    return 'handler' if websocket.close_reason == "message too big" else 'protocol'
+
+def serverCounter(url, name):
+    #a counter off the server's /metrics page
+    try:
+        with urllib.request.urlopen(url.replace('ws://', 'http://') + '/metrics', timeout=5) as response:
+            page = response.read().decode()
+    except OSError:
+        return None
+    found = re.search(rf'^{name} (\S+)$', page, re.MULTILINE)
+    return float(found.group(1)) if found else None
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values)*p/100))]*1000 if values else None
+
+async def run(config):
+    server = None
+    url = config.url
+    if url is None:
+        port = freePort()
+        server = startServer(port, config.asgi, config.workers, config.record)
+        url = f"ws://127.0.0.1:{port}"
+    try:
+        await waitForServer(url)
+        counters = Counters()
+        stop = asyncio.Event()
+
+        #connect at config.connectRate a second, a burst of thousands of
+        #handshakes would measure the listen backlog and not the relay
+        bots = []
+        for i in range(config.bots):
+            matchId = f"load-{i//2}" if config.pairing == 'pairs' else None
+            bots.append(asyncio.create_task(runBot(i, url, matchId, config, counters, stop)))
+            await asyncio.sleep(1/config.connectRate)
+        #spectators go to the matches the pairs opened, in turn
+        matches = max(1, config.bots//2)
+        for i in range(config.spectators if config.pairing == 'pairs' else 0):
+            bots.append(asyncio.create_task(runSpectator(url, f"load-{i % matches}", counters, stop)))
+            await asyncio.sleep(1/config.connectRate)
+        await asyncio.sleep(config.warmup)
+
+        before = processUsage(server.pid) if server else None
+        ownBefore = time.process_time()
+        counters.measuring = True
+        start = time.perf_counter()
+        await asyncio.sleep(config.seconds)
+        counters.measuring = False
+        elapsed = time.perf_counter() - start
+        after = processUsage(server.pid) if server else None
+        ownCpu = time.process_time() - ownBefore
+        throttled = [serverCounter(url, f'ufo_throttled_{kind}_total') for kind in ('clients', 'coalesced', 'dropped')]
+        oversizedClosedBy = await sendOversized(url)
+
+        stop.set()
+        for task in bots:
+            task.cancel()
+        await asyncio.gather(*bots, return_exceptions=True)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies = sorted(counters.latencies)
+    results = {
+        'connected': counters.connected,
+        'started': counters.started,
+        'failed': counters.failed,
+        'messagesPerSecondIn': counters.sent/elapsed,
+        'messagesPerSecondOut': counters.received/elapsed,
+        'bytesPerSecondIn': counters.bytesSent/elapsed,
+        'bytesPerSecondOut': counters.bytesReceived/elapsed,
+        #frames that never made it to the opponent, dropped or coalesced
+        #by a full outbox, or still on the way when the window closed
+        'undelivered': max(0, 1 - counters.received/counters.sent) if counters.sent else None,
+        'throttledClients': throttled[0],
+        'throttledFrames': throttled[1] + throttled[2] if None not in throttled else None,
+        'oversizedClosedBy': oversizedClosedBy,
+        'spectators': counters.watching,
+        'spectatorFramesPerSecond': counters.watched/elapsed,
+        'spectatorBytesPerSecond': counters.bytesWatched/elapsed,
+        'latencyMsP50': percentile(latencies, 50),
+        'latencyMsP95': percentile(latencies, 95),
+        'latencyMsP99': percentile(latencies, 99),
+        'latencyMsMax': latencies[-1]*1000 if latencies else None,
+        #the bots share a core with nothing else only if this stays well below 1
+        'loadGeneratorCpu': ownCpu/elapsed,
+    }
+    if before is not None and after is not None:
+        results['serverCpu'] = (after[0] - before[0])/elapsed
+        results['serverRssMb'] = after[1]
+        results['serverPeakRssMb'] = after[2]
+    return results
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(old, new):
+    print(f"{'':>22} {'before':>10} {'after':>10} {'change':>8}")
+    for key, value in new['results'].items():
+        was = old['results'].get(key)
+        if isinstance(value, (int, float)) and isinstance(was, (int, float)):
+            change = f"{(value - was)/was*100:+.0f}%" if was else ''
+            print(f"{key:>22} {was:>10.2f} {value:>10.2f} {change:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="load test for server.py")
+    parser.add_argument('--bots', type=int, default=200, help="clients, two per match")
+    parser.add_argument('--rate', type=float, default=10, help="frames a second per bot, SEND_INTERVAL is 0.1")
+    parser.add_argument('--flooders', type=int, default=0, help="bots that send at --flood-rate instead")
+    parser.add_argument('--flood-rate', dest='floodRate', type=float, default=1000, help="frames a second per flooder")
+    parser.add_argument('--bullets', type=int, default=10, help="bullets in every frame")
+    parser.add_argument('--pairing', choices=('pairs', 'quick'), default='pairs',
+                        help="pairs: a match id per two bots, quick: the quick match queue")
+    parser.add_argument('--protocol', choices=tuple(PROTOCOLS), default='delta',
+                        help="newest wire format the bots offer")
+    parser.add_argument('--seconds', type=float, default=20, help="length of the measured window")
+    parser.add_argument('--spectators', type=int, default=0, help="watchers spread over the matches, pairs only")
+    parser.add_argument('--record', help="directory the server records every match to (RECORD_DIR)")
+    parser.add_argument('--warmup', type=float, default=3, help="seconds after the last bot joined")
+    parser.add_argument('--connect-rate', dest='connectRate', type=float, default=500, help="new bots a second")
+    parser.add_argument('--asgi', action='store_true', help="run the server under uvicorn (asgi.py)")
+    parser.add_argument('--workers', type=int, default=1, help="server processes, see supervisor.py")
+    parser.add_argument('--url', help="load an already running server, CPU and memory are not measured then")
+    parser.add_argument('--out', help="results file, load-<commit>-<bots>.json by default")
+    parser.add_argument('--compare', help="an earlier results file to print the changes against")
+    config = parser.parse_args()
+    config.protocols = [p for p in protocol.SUPPORTED_PROTOCOLS if p <= PROTOCOLS[config.protocol]]
+
+    results = asyncio.run(run(config))
+    commit = gitCommit()
+    report = {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {key: value for key, value in vars(config).items() if key not in ('out', 'compare')},
+        'results': results,
+    }
+    out = config.out or f"load-{commit or 'local'}-{config.bots}.json"
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for key, value in results.items():
+        print(f"{key:>22} {value:.2f}" if isinstance(value, float) else f"{key:>22} {value}")
+    print(f"written to {out}")
+    if config.compare:
+        with open(config.compare) as f:
+            compare(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
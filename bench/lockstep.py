@@ -0,0 +1,97 @@
+#two lockstep peers (lockstep.py) playing a match over a link with latency,
+#jitter and now and then a late frame, every frame encoded and decoded like
+#the real thing. Reports desyncs (there should be none), stalls and the
+#bytes sent against delta snapshots at SEND_INTERVAL, then runs again with
+#one world nudged to show the checksums catch it
+#run from the repo root: python -m bench.lockstep [seconds]
+import random
+import sys
+import lockstep
+import network
+import protocol
+from engine import checksum
+
+STEPS_PER_SECOND = 30
+
+class Peer:
+    def __init__(self, role, seed):
+        self.world = lockstep.makeWorld(800, 600, STEPS_PER_SECOND, seed)
+        self.sim = lockstep.Lockstep(self.world, role)
+        self.rng = random.Random(role)
+        self.move, self.held = 0, 0
+        self.inFlight = [] #(arrival time, frame) on the way to this peer
+        self.sent = 0
+        #what the same match costs with delta snapshots
+        self.encoder = protocol.SnapshotEncoder()
+        self.snapshotBytes = 0
+
+    def press(self):
+        #holds a direction for a while like a person would
+        if self.held == 0:
+            self.move, self.held = self.rng.choice((-1, 0, 1)), self.rng.randint(3, 30)
+        self.held -= 1
+        return self.move, self.rng.choice((0, 0, 0, 1))
+
+def send(link, peer, frame, now):
+    latency = 0.04 + link.uniform(0, 0.03)
+    if link.random() < 0.05:
+        latency += 0.1
+    #TCP keeps frames in order
+    arrival = max([now + latency] + [t for t, _ in peer.inFlight])
+    peer.inFlight.append((arrival, frame))
+
+def play(seconds, seed, nudgeAt=None):
+    link = random.Random(seed)
+    peers = {1: Peer(1, seed), 2: Peer(2, seed)}
+    steps = seconds*STEPS_PER_SECOND
+    for step in range(steps):
+        now = step/STEPS_PER_SECOND
+        for role, peer in peers.items():
+            other = peers[3 - role]
+            while peer.inFlight and peer.inFlight[0][0] <= now:
+                data = protocol.decodeMessage(peer.inFlight.pop(0)[1], 800, 600)
+                if data['type'] == 'lockstep':
+                    peer.sim.addRemoteInput(data['tick'], data['move'], data['fire'])
+                else:
+                    peer.sim.addRemoteChecksum(data['tick'], data['checksum'])
+
+            move, fire = peer.press()
+            tick = peer.sim.addLocalInput(move, fire)
+            if tick is not None:
+                frame = protocol.encodeLockstep(protocol.PROTOCOL_DELTA, tick, move, fire)
+                peer.sent += len(frame)
+                send(link, other, frame, now)
+            for checkTick, crc in peer.sim.advance():
+                frame = protocol.encodeChecksum(protocol.PROTOCOL_DELTA, checkTick, crc)
+                peer.sent += len(frame)
+                send(link, other, frame, now)
+
+            if step % int(network.SEND_INTERVAL*STEPS_PER_SECOND) == 0:
+                world = peer.world
+                peer.snapshotBytes += len(peer.encoder.encode(protocol.PROTOCOL_DELTA, role, world.player(role),
+                                                              world.bullets(role), 800, 600, now))
+        if nudgeAt is not None and peers[2].sim.tick == nudgeAt:
+            peers[2].world.p1.x += 0.5
+            nudgeAt = None
+    return peers
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    peers = play(seconds, 0)
+    p1, p2 = peers[1], peers[2]
+    ticks = min(p1.sim.tick, p2.sim.tick)
+    same = p1.sim.tick != p2.sim.tick or checksum(p1.world) == checksum(p2.world)
+    print(f"{seconds*STEPS_PER_SECOND} steps, ticks run: {p1.sim.tick} / {p2.sim.tick}, "
+          f"stalls: {p1.sim.stalls} / {p2.sim.stalls}")
+    print(f"desync: {p1.sim.desyncTick} / {p2.sim.desyncTick}, worlds equal at the end: {same}")
+    print(f"bytes per peer per second: lockstep {p1.sent/seconds:.0f}, "
+          f"delta snapshots {p1.snapshotBytes/seconds:.0f}")
+
+    nudged = play(seconds, 0, nudgeAt=100)
+    print(f"one world nudged at tick 100, desync seen at tick: "
+          f"{nudged[1].sim.desyncTick} / {nudged[2].sim.desyncTick}")
+    ok = p1.sim.desyncTick is None and p2.sim.desyncTick is None and same and ticks > 0
+    return 0 if ok and nudged[1].sim.desyncTick is not None else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#allocation and GC behaviour of a long headless match, with the entity
+#pools on and off (maxFree = 0 turns a pool into plain allocation)
+#run from the repo root: python -m bench.memory [ticks]
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from classes import POOLS, Bullet
+from engine import World
+
+def playMatch(ticks, seed=0):
+    #both players fire every tick, obstacles come fast and auto-shoot is on
+    #most of the time, a new round starts whenever one ends
+    rng = random.Random(seed)
+    world = World(800, 600, rng=random.Random(seed))
+    world.attackRate = 2
+    stepTimes = []
+    for t in range(ticks):
+        if world.gameOver:
+            world.reset()
+            world.attackRate = 2
+        if t % 300 == 0:
+            for p in (world.p1, world.p2):
+                p.isAutoShoot = True
+                p.autoShootTimeUp = world.counter + 200
+        inputs = {role: {'move': rng.choice((-1, 0, 1)), 'fire': rng.choice((-1, 1))} for role in (1, 2)}
+        start = time.perf_counter()
+        world.step(inputs)
+        stepTimes.append(time.perf_counter() - start)
+    return stepTimes
+
+def gcPauses():
+    #collections and pause times per generation, via gc.callbacks
+    pauses = {0: [], 1: [], 2: []}
+    started = {}
+    def callback(phase, info):
+        if phase == 'start':
+            started['t'] = time.perf_counter()
+        else:
+            pauses[info['generation']].append(time.perf_counter() - started['t'])
+    return pauses, callback
+
+def run(ticks, pooled):
+    for pool in POOLS.values():
+        pool.maxFree = 1024 if pooled else 0
+        pool.free.clear()
+        pool.created = pool.reused = 0
+
+    #timing and GC first, tracemalloc slows every allocation down
+    gc.collect()
+    pauses, callback = gcPauses()
+    gc.callbacks.append(callback)
+    stepTimes = playMatch(ticks)
+    gc.callbacks.remove(callback)
+    created = sum(pool.created for pool in POOLS.values())
+    reused = sum(pool.reused for pool in POOLS.values())
+
+    tracemalloc.start()
+    playMatch(ticks)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stepTimes.sort()
+    ms = lambda q: stepTimes[min(len(stepTimes) - 1, int(q*len(stepTimes)))]*1000
+    print(f"pools {'on' if pooled else 'off'}:")
+    print(f"  entities created {created}, reused {reused}")
+    print(f"  gc collections gen0/1/2: {len(pauses[0])}/{len(pauses[1])}/{len(pauses[2])}, "
+          f"total pause {sum(sum(p) for p in pauses.values())*1000:.1f} ms, "
+          f"longest {max((max(p) for p in pauses.values() if p), default=0)*1000:.3f} ms")
+    print(f"  step ms p50 {ms(0.5):.3f}  p99 {ms(0.99):.3f}  max {ms(1.0):.3f}")
+    print(f"  tracemalloc peak {peak/1024:.0f} KiB")
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    tracemalloc.start()
+    bullets = [Bullet(0, 0, 1, 1, 0, 0, 1) for _ in range(10000)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{size/len(bullets):.0f} bytes per Bullet")
+    del bullets
+
+    run(ticks, pooled=False)
+    run(ticks, pooled=True)
+
+if __name__ == '__main__':
+    main()
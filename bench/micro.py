@@ -0,0 +1,243 @@
+#microbenchmarks for the simulation hot paths at 10, 100 and 1000 entities:
+#engine.onStep, checkCollisions, checkAutoShoot, updateObjects,
+#network.updateEnemyState and the snapshot encode in sendGameData. Worlds
+#come from fixed seeds and app is a plain object, nothing needs a display.
+#Every case reports time per call and what the call allocates, and the run
+#fails when a case got slower or allocates more than the stored baseline
+#run from the repo root: python -m bench.micro [--save] [--only name]
+#times are compared as multiples of a fixed pure Python loop timed next to
+#each case, a busy or throttled machine slows both. --save after a change
+#that is meant to move the numbers
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import engine
+import network
+import protocol
+from classes import POOLS, Bullet
+from engine import World
+
+SCALES = (10, 100, 1000)
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+#time below this much over the baseline is noise even if it is a large share
+NOISE_US = 1.0
+NOISE_KB = 1.0
+#times over the baseline are measured again this many times before they
+#count, a single slow run is more often the machine than the code
+RETRIES = 2
+
+class App:
+    pass
+
+def makeWorld(count, seed):
+    #count entities in the top universe, half bullets flying right and half
+    #obstacles spread over the screen, so some of them collide. The bottom
+    #universe gets a black hole so bullets can teleport
+    rng = random.Random(seed)
+    world = World(800, 600, rng=random.Random(seed))
+    world.attackRate = 10**9
+    for i in range(count):
+        if i % 2:
+            engine.fireBullet(world, 1, 1)
+            b = world.p1Bullets[-1]
+            b.x, b.y = rng.uniform(0, 800), rng.uniform(0, world.split)
+        else:
+            engine.attackObstacle(world, 1)
+            obs = world.p1Obstacles[-1]
+            obs.x = rng.uniform(0, 800)
+    engine.attackObstacle(world, 2)
+    return world
+
+def onStepCase(count):
+    world = makeWorld(count, count)
+    return lambda: copy.deepcopy(world), engine.onStep
+
+def collisionsCase(count):
+    world = makeWorld(count, count)
+    return (lambda: copy.deepcopy(world),
+            lambda w: engine.checkCollisions(w, w.p1, w.p1Bullets, w.p1Obstacles))
+
+def autoShootCase(count):
+    world = makeWorld(count, count)
+    world.p1.isAutoShoot = True
+    world.p1.autoShootTimeUp = 10**9
+    world.p1.shootCooldown = 0
+    return lambda: copy.deepcopy(world), lambda w: engine.checkAutoShoot(w, w.p1, w.p1Bullets)
+
+def updateObjectsCase(count):
+    world = makeWorld(count, count)
+    return lambda: copy.deepcopy(world), lambda w: engine.updateObjects(w, w.p1Bullets, w.p1Obstacles)
+
+def enemyFrame(count, received, seed):
+    #what Inbox.addEnemyFrame publishes for an enemy with count bullets
+    rng = random.Random(seed)
+    bullets = tuple((i, rng.uniform(0, 800), rng.uniform(300, 600), 20, 0, received, 0.0) for i in range(count))
+    return (received, {'x': 64, 'y': 450, 'score': 80, 'isTeleported': False}, bullets, ())
+
+def enemyStateCase(count):
+    #steady state: every bullet is known already and was sent again
+    app = App()
+    app.myRole = 1
+    app.world = World(800, 600, localRoles=(1,), rng=random.Random(count))
+    app.enemyBullets = {}
+    app.enemyTaken = 0
+    network.updateEnemyState(app, enemyFrame(count, 1, count), 0.0)
+    app.enemyTaken = 1
+    frame = enemyFrame(count, 2, count + 1)
+    return lambda: copy.deepcopy(app), lambda a: network.updateEnemyState(a, frame, 0.0)
+
+def encodeCase(version):
+    def case(count):
+        #the bullets one client has out, the encoder of a match in progress
+        world = makeWorld(count*2, count)
+        snapshot = (network.PlayerState(world.p1), tuple(network.BulletState(b) for b in world.p1Bullets))
+        encoder = protocol.SnapshotEncoder()
+        encoder.encode(version, 1, *snapshot, 800, 600, 0.0)
+        return lambda: encoder, lambda e: e.encode(version, 1, *snapshot, 800, 600, 0.0)
+    return case
+
+CASES = {
+    'onStep': onStepCase,
+    'checkCollisions': collisionsCase,
+    'checkAutoShoot': autoShootCase,
+    'updateObjects': updateObjectsCase,
+    'updateEnemyState': enemyStateCase,
+    'encode json': encodeCase(protocol.PROTOCOL_JSON),
+    'encode delta': encodeCase(protocol.PROTOCOL_DELTA),
+}
+
+def clearPools():
+    #every call starts from the same pools, or what earlier calls released
+    #would decide what a call allocates
+    for pool in POOLS.values():
+        pool.free.clear()
+
+def timeCase(fresh, fn, repeat=9, minTime=0.01, maxBatch=128):
+    #per call, best of repeat batches. States are made before a batch starts,
+    #the copy is not timed but it is what limits the batch size
+    batch = 1
+    while True:
+        states = [fresh() for _ in range(batch)]
+        clearPools()
+        start = time.perf_counter()
+        for state in states:
+            fn(state)
+        elapsed = time.perf_counter() - start
+        if elapsed >= minTime or batch >= maxBatch:
+            break
+        batch *= 2
+    best = elapsed/batch
+    for _ in range(repeat - 1):
+        states = [fresh() for _ in range(batch)]
+        clearPools()
+        start = time.perf_counter()
+        for state in states:
+            fn(state)
+        best = min(best, (time.perf_counter() - start)/batch)
+    return best*1e6
+
+def reference():
+    #attribute reads and writes, float math and list appends, what the
+    #simulation is made of
+    b = Bullet(0, 0, 1, 1.5, 0.5, 0, 600)
+    trail = []
+    for _ in range(200):
+        b.x += b.dx
+        b.y += b.dy
+        trail.append((b.x*b.x + b.y*b.y)**0.5)
+    return trail
+
+def calibrate():
+    return timeCase(lambda: None, lambda _: reference(), repeat=7)
+
+def allocations(fresh, fn):
+    #KB allocated at the peak of one call, and KB still held after it
+    state = fresh()
+    clearPools()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    fn(state)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (peak - before)/1024, (current - before)/1024
+
+def measure(name, count):
+    fresh, fn = CASES[name](count)
+    reference = calibrate()
+    us = timeCase(fresh, fn)
+    reference = min(reference, calibrate())
+    peak, held = allocations(fresh, fn)
+    return {'us': us, 'relative': us/reference, 'peakKb': peak, 'heldKb': held}
+
+def regressions(results, baseline, tolerance):
+    #(key, what got worse)
+    found = []
+    for key, now in results.items():
+        was = baseline.get(key)
+        if was is None:
+            continue
+        #what it would take now at the speed the baseline machine ran at
+        us = now['relative']*was['us']/was['relative']
+        if us > was['us']*(1 + tolerance) and us - was['us'] > NOISE_US:
+            found.append((key, f"{was['us']:.2f} -> {us:.2f} us (speed adjusted)"))
+        if now['peakKb'] > was['peakKb']*(1 + tolerance) and now['peakKb'] - was['peakKb'] > NOISE_KB:
+            found.append((key, f"{was['peakKb']:.1f} -> {now['peakKb']:.1f} KB allocated"))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="microbenchmarks for the simulation hot paths")
+    parser.add_argument('--save', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.5, help="share a case may get worse, 0.5 is 50%%")
+    parser.add_argument('--only', help="cases whose name contains this")
+    config = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(config.baseline):
+        with open(config.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    print(f"{'case':>28} {'us/call':>10} {'baseline':>9} {'x ref':>7} {'baseline':>9} {'peak KB':>8} {'held KB':>8}")
+    for name in CASES:
+        if config.only and config.only not in name:
+            continue
+        for count in SCALES:
+            key = f"{name}/{count}"
+            now = results[key] = measure(name, count)
+            was = baseline.get(key)
+            wasUs, wasRelative = (f"{was['us']:.2f}", f"{was['relative']:.2f}") if was else ('-', '-')
+            print(f"{key:>28} {now['us']:>10.2f} {wasUs:>9} {now['relative']:>7.2f} {wasRelative:>9} "
+                  f"{now['peakKb']:>8.1f} {now['heldKb']:>8.1f}")
+
+    if config.save:
+        #a partial run only replaces its own cases
+        baseline.update(results)
+        with open(config.baseline, 'w') as f:
+            json.dump({'machine': platform.platform(), 'python': platform.python_version(),
+                       'results': baseline}, f, indent=2, sort_keys=True)
+        print(f"baseline written to {config.baseline}")
+        return 0
+
+    found = regressions(results, baseline, config.tolerance)
+    for _ in range(RETRIES):
+        if not found:
+            break
+        for key in {key for key, _ in found}:
+            name, count = key.rsplit('/', 1)
+            again = measure(name, int(count))
+            if again['relative'] < results[key]['relative']:
+                results[key] = again
+        found = regressions(results, baseline, config.tolerance)
+    for key, line in found:
+        print(f"REGRESSION {key}: {line}")
+    return 1 if found else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#what the profiler costs: a busy world stepped with world.profiler off and
+#on, then a few headless client frames (onStep + redrawAll from main.py)
+#with the overlay up, dumped as a Chrome trace and read back
+#run from the repo root: python -m bench.profiler [steps]
+from cmu_graphics import *
+from cmu_graphics import cmu_graphics as cg
+from cmu_graphics import shape_logic
+#after the star import, it brings its own random
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import main as client
+import network
+import profiler
+import protocol
+from engine import World
+
+#cmu_graphics calls the redrawAll of the module that is run
+def redrawAll(app):
+    client.redrawAll(app)
+
+def busyWorld(seed):
+    world = World(800, 600, rng=random.Random(seed))
+    world.attackRate = 2
+    return world
+
+def timeSteps(steps, timer):
+    world = busyWorld(0)
+    world.profiler = timer
+    rng = random.Random(1)
+    total = 0
+    for _ in range(steps):
+        inputs = {role: {'move': rng.choice((-1, 0, 1)), 'fire': rng.choice((-1, 1))} for role in (1, 2)}
+        start = time.perf_counter()
+        world.step(inputs)
+        total += time.perf_counter() - start
+        if world.gameOver:
+            world.reset()
+            world.attackRate = 2
+    return total/steps*1e6
+
+def clientFrames(frames):
+    #the parts of onAppStart that don't need a server
+    cg.setupMvc()
+    app = cg.app
+    app.width, app.height = 800, 600
+    app.stepsPerSecond = 30
+    app.matchId = None
+    app.myRole = 1
+    app.protocol = protocol.PROTOCOL_DELTA
+    app.authoritative = False
+    app.lockstep = False
+    app.lockstepStart = None
+    app.lockstepSim = None
+    app.background = client.render.black
+    app.disableMvcChecker = True
+    app.inbox = network.Inbox()
+    app.outbox = None
+    app.sprites = None
+    client.reset(app)
+    app.world.attackRate = 2
+    app.profiler = profiler.Profiler()
+    app.showProfiler = True
+
+    canvas = shape_logic.wyvern.ImageSurface(app.width, app.height).canvas
+    for i in range(frames):
+        app.move = random.choice((-1, 0, 1))
+        app.shots.append(1)
+        #a whole tick since the last frame, however long this one took
+        if app.lastFrame is not None:
+            app.lastFrame -= 1/app.world.stepsPerSecond
+        client.onStep(app)
+        app._app.redrawAllWrapper()
+        app._app.redrawAll(canvas)
+    return app
+
+def main():
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    off = min(timeSteps(steps, None) for _ in range(3))
+    on = min(timeSteps(steps, profiler.Profiler()) for _ in range(3))
+    print(f"world.step: {off:.1f} us with the profiler off, {on:.1f} us on ({on - off:+.1f} us)")
+
+    os.chdir(tempfile.mkdtemp())
+    app = clientFrames(60)
+    for name, ms in app.profiler.summary('onStep', seconds=60):
+        print(f"{ms:8.3f} ms per step  {name}")
+    path = app.profiler.dump()
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    spans = [e for e in events if e['ph'] == 'X']
+    print(f"{path}: {len(spans)} spans, {len({e['name'] for e in spans})} names, {os.path.getsize(path)} bytes")
+    sys.stdout.flush()
+    #skip cmu_graphics' exit handler, it would try to open a window
+    os._exit(0 if spans else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#what a dropped connection costs network.py's client: it plays through a proxy
+#that cuts the connection now and then, while a bot on the other side of the
+#match sends snapshots every SEND_INTERVAL. The client reconnects and resumes
+#its seat. Reports how long from the cut until it was back on its seat, until
+#it had the opponent's state again (the server's cache of it, sent with the
+#seat) and until the first frame the bot sent after the resume, which is as
+#long as recovery would take without the cache. With --workers the server
+#runs its supervisor and the two play a quick match, whose id has to bring
+#the resume back to the worker that holds the seat
+#run from the repo root: python -m bench.reconnect [cuts] [--workers N]
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+import types
+import websockets
+import network
+import protocol
+from bench.load import freePort, startServer
+
+MATCH = 'reconnect-bench'
+
+class Proxy:
+    #passes bytes both ways, cut() drops every connection without a close
+    def __init__(self, target):
+        self.target = target
+        self.transports = []
+
+    async def serve(self, reader, writer):
+        upstream, downstream = await asyncio.open_connection(*self.target)
+        self.transports += [writer.transport, downstream.transport]
+        await asyncio.gather(self.pipe(reader, downstream), self.pipe(upstream, writer))
+
+    async def pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+        except OSError:
+            pass
+        finally:
+            writer.transport.abort()
+
+    def cut(self):
+        for transport in self.transports:
+            transport.abort()
+        self.transports = []
+
+class TimedInbox(network.Inbox):
+    #when each enemy frame came, by the frame number the bot put in its score
+    def __init__(self):
+        super().__init__()
+        self.arrivals = []
+
+    def addEnemyFrame(self, data, now):
+        super().addEnemyFrame(data, now)
+        self.arrivals.append((time.monotonic(), self.player.get('score')))
+
+async def runBot(port, matchId, sentAt, joined):
+    query = f"?match={matchId}" if matchId is not None else ""
+    async with websockets.connect(f"ws://127.0.0.1:{port}/{query}") as websocket:
+        await websocket.send(json.dumps({'type': 'join', 'match': matchId, 'protocols': [protocol.PROTOCOL_DELTA]}))
+        role = json.loads(await websocket.recv())['role']
+        joined.set()
+        while json.loads(await websocket.recv()).get('type') != 'start':
+            pass
+        encoder = protocol.SnapshotEncoder()
+        me = types.SimpleNamespace(x=400, y=150, score=0, isTeleported=False)
+        while True:
+            #the score numbers the frames
+            me.score = len(sentAt) % 60000
+            sentAt.append(time.monotonic())
+            await websocket.send(encoder.encode(protocol.PROTOCOL_DELTA, role, me, [], 800, 600, time.monotonic()))
+            await asyncio.sleep(network.SEND_INTERVAL)
+
+def makeApp(matchId):
+    app = types.SimpleNamespace(matchId=matchId, myRole=None, lockstepSim=None, profiler=None,
+                                world=types.SimpleNamespace(width=800, height=600),
+                                protocol=protocol.PROTOCOL_JSON, authoritative=False, lockstep=False,
+                                sentMove=0, inbox=TimedInbox(), outbox=None)
+    app.resumedAt = []
+    resume = network.resume
+    def timedResume(app, reply):
+        app.resumedAt.append(time.monotonic())
+        resume(app, reply)
+    network.resume = timedResume
+    return app
+
+async def waitFor(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("the client did not recover")
+        await asyncio.sleep(0.001)
+
+async def run(cuts, workers):
+    port, proxyPort = freePort(), freePort()
+    server = startServer(port, False, workers)
+    #one worker plays a named match, more play a quick one
+    matchId = MATCH if workers == 1 else None
+    try:
+        for attempt in range(100):
+            try:
+                #named, a quick one would count as a quick join with the supervisor
+                async with websockets.connect(f"ws://127.0.0.1:{port}/?match={MATCH}"):
+                    break
+            except OSError:
+                await asyncio.sleep(0.05)
+        proxy = Proxy(('127.0.0.1', port))
+        listener = await asyncio.start_server(proxy.serve, '127.0.0.1', proxyPort)
+
+        #the bot joins first, so the client is the one that pairs with it
+        sentAt = []
+        joined = asyncio.Event()
+        bot = asyncio.create_task(runBot(port, matchId, sentAt, joined))
+        await asyncio.wait_for(joined.wait(), 5)
+        network.GAMESERVERURL = f"127.0.0.1:{proxyPort}"
+        app = makeApp(matchId)
+        threading.Thread(target=lambda: asyncio.run(network.receiveUpdates(app)), daemon=True).start()
+        inbox = app.inbox
+        await waitFor(lambda: inbox.arrivals)
+
+        results = []
+        for cut in range(cuts):
+            await asyncio.sleep(0.3 + 0.2*cut/cuts)
+            resumes, frames = len(app.resumedAt), len(inbox.arrivals)
+            start = time.monotonic()
+            proxy.cut()
+            await waitFor(lambda: len(app.resumedAt) > resumes and len(inbox.arrivals) > frames)
+            resumedAt = app.resumedAt[-1]
+            #sent after the resume, so not from the cache
+            await waitFor(lambda: any(sentAt[mark] > resumedAt for _, mark in inbox.arrivals[frames:]))
+            firstLive = next(at for at, mark in inbox.arrivals[frames:] if sentAt[mark] > resumedAt)
+            results.append(((resumedAt - start)*1000, (inbox.arrivals[frames][0] - start)*1000,
+                            (firstLive - start)*1000))
+        bot.cancel()
+        #the pipes end on their own once nothing can connect again
+        listener.close()
+        proxy.cut()
+        await asyncio.sleep(0.1)
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="what a dropped connection costs the client")
+    parser.add_argument('cuts', type=int, nargs='?', default=20)
+    parser.add_argument('--workers', type=int, default=1, help="server processes, more than one runs the supervisor")
+    config = parser.parse_args()
+    results = asyncio.run(run(config.cuts, config.workers))
+    print(f"{config.cuts} cuts, {config.workers} workers, the bot sends every {network.SEND_INTERVAL*1000:.0f} ms")
+    for i, name in enumerate(("back on its seat", "opponent's state (cache)", "first frame sent after (no cache)")):
+        times = sorted(result[i] for result in results)
+        print(f"{name:>34}: median {statistics.median(times):6.1f} ms, worst {times[-1]:6.1f} ms")
+
+if __name__ == '__main__':
+    main()
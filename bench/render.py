@@ -0,0 +1,170 @@
+#frame time of render.drawFrame against the old redrawAll with 50 to 500
+#entities on screen and as many bullets just past the right edge. Runs
+#headless in a temp dir with placeholder sprites
+#run from the repo root: python -m bench.render [frames]
+from cmu_graphics import *
+from cmu_graphics import cmu_graphics as cg
+from cmu_graphics import shape_logic
+#after the star import, it brings its own random
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import zlib
+import assets
+import engine
+import render
+from classes import Obstacle, Star, BlackHole
+from engine import World
+
+#the old redrawAll, kept as the reference
+def drawHealthBar(app, score, x, y):
+    drawRect(x, y, app.barWidth, app.barHeight, fill=None, border=render.white)
+    fillPct = max(1, min(100, score))/100
+    color = render.green
+    if score < 30: color = render.red
+    elif score < 60: color = render.yellow
+    drawRect(x, y, app.barWidth*fillPct, app.barHeight, fill=color)
+
+def drawObstacle(obs):
+    #same calls as before, with the path made to work off windows
+    if obs.img is not None:
+        path = obs.img.replace('\\', '/')
+        if type(obs)==Obstacle and obs.img=='images\\comet.png':
+            drawImage(path, obs.x, obs.y, align='center', width=obs.r*4.5, height=obs.r*2)
+        else:
+            drawImage(path, obs.x, obs.y, align='center', width=obs.r*3, height=obs.r*3)
+    else:
+        drawCircle(obs.x, obs.y, obs.r, fill=render.red)
+
+def referenceFrame(app):
+    world = app.world
+    drawRect(0, 0, app.width, app.height, fill=render.black)
+    drawLine(0, world.split, app.width, world.split, fill=render.white, lineWidth=3)
+    for p, bullets, obstacles in ((world.p1, world.p1Bullets, world.p1Obstacles),
+                                  (world.p2, world.p2Bullets, world.p2Obstacles)):
+        drawCircle(p.x, p.y, p.r, fill=rgb(*p.color))
+        for b in bullets:
+            drawRect(b.x, b.y-b.r/2, b.r*3, b.r, fill=render.yellow)
+        for obs in obstacles:
+            drawObstacle(obs)
+    labelX = app.width - app.margin - app.barWidth - 20
+    barX = app.width - app.margin - app.barWidth
+    for label, p, y in (("P1", world.p1, app.height*0.05), ("P2", world.p2, world.split + app.height*0.05)):
+        drawLabel(label, labelX, y + app.barHeight/2, fill=render.white, size=app.height*0.04)
+        drawHealthBar(app, p.score, barX, y)
+        drawLabel(f"Stars: {len(p.collectedStars)}/5", barX, y + app.barHeight + 15,
+                  fill=render.yellow, size=12, align='left')
+        if p.isAutoShoot:
+            drawLabel("Auto-Shoot ACTIVE!!", barX, y + 50, fill=render.red, bold=True, align='left')
+    if app.paused or world.gameOver or app.myRole is None:
+        drawRect(0, 0, app.width, app.height, fill='black', opacity=50)
+        popupW = app.width*0.4
+        popupH = app.height*0.3
+        cx, cy = app.width/2, app.height/2
+        drawRect(cx - popupW/2, cy - popupH/2, popupW, popupH, fill=render.white, border=render.purple, borderWidth=4)
+        tSize = int(app.height*0.05)
+        if world.gameOver:
+            drawLabel("game over ^_^", cx, cy - popupH*0.15, fill=render.red, size=tSize, bold=True)
+            drawLabel(f"{world.winner} wins!!", cx, cy + popupH*0.15, fill=render.black, size=tSize*0.8)
+        elif app.myRole is None:
+            drawLabel("joining match...", cx, cy, size=tSize, bold=True, fill=render.black)
+        else:
+            drawLabel("paused...", cx, cy, size=tSize, bold=True, fill=render.black)
+
+MODE = {'draw': referenceFrame}
+
+def redrawAll(app):
+    MODE['draw'](app)
+
+def png(path, size=16):
+    #a plain white square, enough for drawImage to load
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    rows = b''.join(b'\x00' + b'\xff\xff\xff\xff'*size for _ in range(size))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows)))
+        f.write(chunk(b'IEND', b''))
+
+def populate(app, count, seed):
+    #count entities on screen, as many bullets as obstacles, and count more
+    #bullets past the right edge, bullets live 50 pixels beyond it
+    rng = random.Random(seed)
+    world = World(app.width, app.height, rng=random.Random(seed))
+    for i in range(count):
+        role = rng.choice((1, 2))
+        if i % 2:
+            engine.fireBullet(world, role, rng.choice((-1, 1)))
+            world.bullets(role)[-1].x = rng.uniform(0, 780)
+        else:
+            if i % 10 == 0:
+                cls = rng.choice((Star, BlackHole))
+                args = (rng.randrange(5),) if cls is Star else ()
+                world.addObstacle(role, cls(world.width + 20, world.player(role).y, 15, world.obstacleSpeed, *args))
+            else:
+                engine.attackObstacle(world, role)
+            world.obstacles(role)[-1].x = rng.uniform(0, 780)
+        role = rng.choice((1, 2))
+        engine.fireBullet(world, role, 1)
+        world.bullets(role)[-1].x = rng.uniform(world.width, world.width + 50)
+    app.world = world
+    app.paused = False
+    app.myRole = 1
+    app.profiler = None
+    app.showProfiler = False
+    app.alpha = 1
+    app.prevPlayers = {}
+    app.barWidth = app.width*0.15
+    app.barHeight = app.height*0.03
+    app.margin = app.width*0.05
+
+def timeFrames(app, canvas, frames):
+    #redrawAll making the shapes, then cmu_graphics painting them
+    build = paint = 0
+    for _ in range(frames):
+        start = time.perf_counter()
+        app._app.redrawAllWrapper()
+        middle = time.perf_counter()
+        app._app.redrawAll(canvas)
+        build += middle - start
+        paint += time.perf_counter() - middle
+    return build/frames*1000, paint/frames*1000
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('images')
+    for name in ['meteor', 'comet', 'blackhole'] + [f'star{i}' for i in range(5)]:
+        png(f'images/{name}.png')
+
+    cg.setupMvc()
+    app = cg.app
+    app.width, app.height = 800, 600
+    #the sprites ready before the first frame, like a game that has started
+    app.sprites = assets.preload(app.height*0.035)
+    app.sprites.ready.wait()
+
+    canvas = shape_logic.wyvern.ImageSurface(app.width, app.height).canvas
+
+    print(f"{'entities':>8} {'old build':>10} {'paint':>6} {'new build':>10} {'paint':>6}")
+    for count in (50, 100, 250, 500):
+        populate(app, count, count)
+        results = []
+        for draw, checker in ((referenceFrame, False), (render.drawFrame, True)):
+            MODE['draw'] = draw
+            app.disableMvcChecker = checker
+            app.background = render.black if checker else None
+            app._app.redrawAllWrapper()
+            results.append(timeFrames(app, canvas, frames))
+        (oldBuild, oldPaint), (newBuild, newPaint) = results
+        print(f"{count:>8} {oldBuild:>10.2f} {oldPaint:>6.2f} {newBuild:>10.2f} {newPaint:>6.2f}")
+    sys.stdout.flush()
+    #skip cmu_graphics' exit handler, it would try to open a window
+    os._exit(0)
+
+if __name__ == '__main__':
+    main()
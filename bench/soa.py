@@ -0,0 +1,94 @@
+#checks the NumPy backend (soa.ArrayWorld) plays exactly like engine.World,
+#then times one step of each at 10, 100 and 1000 entities
+#run from the repo root: python -m bench.soa [matches] [ticks]
+import copy
+import random
+import sys
+import time
+import engine
+from engine import World
+from soa import ArrayWorld
+
+def signature(world):
+    def entity(e):
+        return (type(e).__name__, e.x, e.y, getattr(e, 'dx', None), getattr(e, 'dy', None))
+    players = [(p.x, p.y, p.score, p.isTeleported, p.minY, p.maxY, p.isAutoShoot,
+                sorted(p.collectedStars), p.teleportCooldown, p.shootCooldown) for p in (world.p1, world.p2)]
+    lists = [[entity(e) for e in l] for l in (world.p1Bullets, world.p2Bullets, world.p1Obstacles, world.p2Obstacles)]
+    return players, lists, world.gameOver, world.winner
+
+def playMatch(seed, ticks):
+    #the same busy match on both backends: obstacles in both universes so
+    #black holes teleport bullets, lots of shooting, auto-shoot now and then
+    worlds = [World(800, 600, rng=random.Random(seed)), ArrayWorld(800, 600, rng=random.Random(seed))]
+    rng = random.Random(seed)
+    attackRate = rng.choice((1, 3, 10))
+    for world in worlds:
+        world.attackRate = attackRate
+    for t in range(ticks):
+        inputs = {role: {'move': rng.choice((-1, 0, 1)), 'fire': rng.choice((-1, 1, 1, 0))} for role in (1, 2)}
+        spawn = rng.random() < 0.3
+        for world in worlds:
+            if spawn:
+                engine.attackObstacle(world, 2)
+            if t % 90 == 0:
+                for p in (world.p1, world.p2):
+                    p.isAutoShoot = True
+                    p.autoShootTimeUp = world.counter + 60
+            world.step(inputs)
+        if signature(worlds[0]) != signature(worlds[1]):
+            return t
+        if worlds[0].gameOver:
+            for world in worlds:
+                world.reset()
+    return None
+
+def populate(world, count, seed):
+    #count bullets and count obstacles spread over the screen. They are made
+    #in a plain World and assigned whole, editing objects through an
+    #ArrayWorld's lists doesn't reach its arrays
+    rng = random.Random(seed)
+    source = World(world.width, world.height, rng=random.Random(seed))
+    for _ in range(count):
+        role = rng.choice((1, 2))
+        engine.attackObstacle(source, role)
+        source.obstacles(role)[-1].x = rng.uniform(0, 800)
+        engine.fireBullet(source, role, rng.choice((-1, 1)))
+        source.bullets(role)[-1].x = rng.uniform(0, 800)
+    world.p1Bullets, world.p2Bullets = source.p1Bullets, source.p2Bullets
+    world.p1Obstacles, world.p2Obstacles = source.p1Obstacles, source.p2Obstacles
+    world.attackRate = 10**9
+    #keep the players out of the way so the match doesn't end
+    world.p1.score = world.p2.score = 10**9
+
+def timeStep(world, reps):
+    copies = [copy.deepcopy(world) for _ in range(reps)]
+    start = time.perf_counter()
+    for w in copies:
+        w.step()
+    return (time.perf_counter() - start)/reps*1000
+
+def main():
+    matches = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+
+    diverged = 0
+    for seed in range(matches):
+        tick = playMatch(seed, ticks)
+        if tick is not None:
+            print(f"match {seed} diverged at tick {tick}")
+            diverged += 1
+    print(f"{matches} matches of {ticks} ticks, {diverged} diverged")
+
+    print(f"{'entities':>8} {'objects ms':>11} {'numpy ms':>9}")
+    for count in (10, 100, 1000):
+        timings = []
+        for backend in (World, ArrayWorld):
+            world = backend(800, 600, rng=random.Random(0))
+            populate(world, count, 1)
+            timings.append(timeStep(world, 200 if count < 1000 else 20))
+        print(f"{2*count:>8} {timings[0]:>11.3f} {timings[1]:>9.3f}")
+    return 1 if diverged else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
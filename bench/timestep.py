@@ -0,0 +1,78 @@
+#the fixed timestep in main.py against machines of different speed: frames
+#that take longer and longer to draw (a sleep stands in for redrawAll), one
+#onStep each like cmu_graphics does. The game should keep TICK_RATE ticks a
+#second until a frame takes longer than MAX_CATCHUP_TICKS ticks, where one
+#tick per frame (the old onStep) runs in slow motion from the first late frame
+#run from the repo root: python -m bench.timestep [seconds per case]
+from cmu_graphics import *
+from cmu_graphics import cmu_graphics as cg
+#after the star import, it brings its own random
+import os
+import random
+import sys
+import time
+import main as client
+import network
+import protocol
+
+#ms redrawAll takes, from a fast machine to one far too slow for the game
+DRAW_MS = (1, 20, 40, 80, 250)
+
+def makeApp():
+    #the parts of onAppStart that don't need a server
+    cg.setupMvc()
+    app = cg.app
+    app.width, app.height = 800, 600
+    app.stepsPerSecond = client.FRAME_RATE
+    app.matchId = None
+    app.myRole = 1
+    app.protocol = protocol.PROTOCOL_DELTA
+    app.authoritative = False
+    app.lockstep = False
+    app.lockstepStart = None
+    app.lockstepSim = None
+    app.profiler = None
+    app.showProfiler = False
+    app.disableMvcChecker = True
+    app.inbox = network.Inbox()
+    app.outbox = None
+    app.sprites = None
+    return app
+
+def play(app, drawMs, seconds):
+    client.reset(app)
+    rng = random.Random(drawMs)
+    frames = skipped = 0
+    frame = max(1/app.stepsPerSecond, drawMs/1000)
+    start = time.monotonic()
+    while time.monotonic() - start < seconds:
+        frameStart = time.monotonic()
+        app.move = rng.choice((-1, 0, 1))
+        client.onStep(app)
+        frames += 1
+        if app.skipRender:
+            skipped += 1
+        else:
+            time.sleep(drawMs/1000)
+        time.sleep(max(0, frameStart + frame - time.monotonic()))
+        if app.world.gameOver:
+            app.world.reset()
+    elapsed = time.monotonic() - start
+    return app.world.counter/elapsed, frames/elapsed, skipped, app.droppedTicks
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    app = makeApp()
+    print(f"TICK_RATE {client.TICK_RATE}, FRAME_RATE {client.FRAME_RATE}, MAX_CATCHUP_TICKS {client.MAX_CATCHUP_TICKS}")
+    print(f"{'draw ms':>8} {'ticks/s':>8} {'frames/s':>9} {'skipped':>8} {'dropped':>8} {'old ticks/s':>12}")
+    for drawMs in DRAW_MS:
+        ticks, frames, skipped, dropped = play(app, drawMs, seconds)
+        #one tick per onStep, and every frame drawn
+        old = min(client.TICK_RATE, 1000/drawMs)
+        print(f"{drawMs:>8} {ticks:>8.1f} {frames:>9.1f} {skipped:>8} {dropped:>8} {old:>12.1f}")
+    sys.stdout.flush()
+    #skip cmu_graphics' exit handler, it would try to open a window
+    os._exit(0)
+
+if __name__ == '__main__':
+    main()
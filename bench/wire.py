@@ -0,0 +1,46 @@
+#compares the JSON, binary and delta snapshot encodings sent by sendGameData
+#run from the repo root: python -m bench.wire
+import random
+import timeit
+import protocol
+from classes import UFO, Bullet
+
+WIDTH, HEIGHT = 800, 600
+
+def makeSnapshot(bulletCount, seed=0):
+    rng = random.Random(seed)
+    player = UFO(WIDTH*0.08, rng.uniform(0, HEIGHT/2), HEIGHT*0.035, 0, HEIGHT/2)
+    bullets = [Bullet(rng.uniform(-50, WIDTH + 50), rng.uniform(0, HEIGHT/2), 8.4, 20, 0, 0, HEIGHT/2)
+               for _ in range(bulletCount)]
+    return player, bullets
+
+def timePerCall(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5))/number*1e6
+
+def main():
+    print(f"{'bullets':>8} {'format':>7} {'bytes':>7} {'encode us':>10} {'decode us':>10}")
+    for bulletCount in (0, 5, 20, 50, 200):
+        player, bullets = makeSnapshot(bulletCount)
+        number = max(200, 20000//(bulletCount + 1))
+        for name, version in (('json', protocol.PROTOCOL_JSON), ('binary', protocol.PROTOCOL_BINARY)):
+            frame = protocol.encodeSnapshot(version, 1, player, bullets, WIDTH, HEIGHT)
+            size = len(frame.encode() if isinstance(frame, str) else frame)
+            encode = timePerCall(lambda: protocol.encodeSnapshot(version, 1, player, bullets, WIDTH, HEIGHT), number)
+            decode = timePerCall(lambda: protocol.decodeMessage(frame, WIDTH, HEIGHT), number)
+            print(f"{bulletCount:>8} {name:>7} {size:>7} {encode:>10.2f} {decode:>10.2f}")
+
+        #delta frames depend on history, so average over a whole keyframe
+        #interval of bullets flying straight (one keyframe, the rest deltas)
+        encoder = protocol.SnapshotEncoder()
+        frames = []
+        for _ in range(protocol.KEYFRAME_INTERVAL):
+            for b in bullets:
+                b.x += b.dx
+            frames.append(encoder.encode(protocol.PROTOCOL_DELTA, 1, player, bullets, WIDTH, HEIGHT))
+        size = sum(len(frame) for frame in frames)/len(frames)
+        encode = timePerCall(lambda: encoder.encode(protocol.PROTOCOL_DELTA, 1, player, bullets, WIDTH, HEIGHT), number)
+        decode = timePerCall(lambda: [protocol.decodeMessage(frame, WIDTH, HEIGHT) for frame in frames], number)/len(frames)
+        print(f"{bulletCount:>8} {'delta':>7} {size:>7.0f} {encode:>10.2f} {decode:>10.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,10 @@
-from cmu_graphics import *
-
-
-black  = rgb(31, 31, 31)
-white  = rgb(179, 179, 179)
-purple = rgb(136, 153, 207)
-green  = rgb(141, 199, 111)
-yellow = rgb(212, 212, 78)
-red    = rgb(206, 67, 69)
+#plain game objects, no graphics import so the engine can run headless
 
 class UFO:
+    __slots__ = ('x', 'y', 'r', 'minY', 'maxY', 'score', 'color', 'collectedStars', 'isTeleported',
+                 'teleportTimeUp', 'teleportCooldown', 'homeMinY', 'homeMaxY', 'isAutoShoot',
+                 'autoShootTimeUp', 'shootCooldown')
+
     def __init__(self, x, y, r, minY, maxY):
         self.x = x
         self.y = y
@@ -16,7 +12,7 @@ class UFO:
         self.minY = minY
         self.maxY = maxY
         self.score = 100
-        self.color = green
+        self.color = (141, 199, 111) #green, as rgb for the renderer
         self.collectedStars = set()
         self.isTeleported = False
         self.teleportTimeUp = 0 #after 10 seconds, auto-teleport back
@@ -40,7 +36,10 @@ class UFO:
         self.score = min(100, self.score + amount)
 
 class Obstacle:
+    __slots__ = ('x', 'y', 'r', 'speed', 'img', 'damage', 'shape', 'pooled')
+
     def __init__(self, x, y, r, speed, img=None):
+        self.pooled = False #set by Pool.acquire
         self.x = x
         self.y = y
         self.r = r
@@ -54,6 +53,8 @@ class Obstacle:
         return self.x > -self.r #return true if obstacle is on screen
 
 class Star(Obstacle):
+    __slots__ = ('starType',)
+
     def __init__(self, x, y, r, speed, starType):
         #star images will be star0.png, star1.png etc
         img = f'images\star{starType}.png'
@@ -64,13 +65,23 @@ class Star(Obstacle):
 
 #subclass for black holes
 class BlackHole(Obstacle):
+    __slots__ = ()
+
     def __init__(self, x, y, r, speed):
         super().__init__(x, y, r, speed, img="images/blackhole.png")
         self.damage = 0
         self.shape = 'blackhole'
 
 class Bullet:
-    def __init__(self, x, y, r, dx, dy, minY, maxY):
+    __slots__ = ('id', 'x', 'y', 'r', 'dx', 'dy', 'minY', 'maxY', 'damage', 'pooled')
+    nextId = 0 #stable ids let the network send spawn/despawn events
+
+    def __init__(self, x, y, r, dx, dy, minY, maxY, bulletId=None):
+        self.pooled = False #set by Pool.acquire
+        if bulletId is None:
+            bulletId = Bullet.nextId
+            Bullet.nextId += 1
+        self.id = bulletId
         self.x = x
         self.y = y
         self.r = r
@@ -78,6 +89,9 @@ class Bullet:
         self.dy = dy
         self.minY = minY
         self.maxY = maxY
+        #same as a shot in checkTeleportCollision, used when a player runs
+        #into enemy bullets in checkCollisions
+        self.damage = 30
         
     def update(self, appWidth):
         self.x += self.dx
@@ -88,3 +102,39 @@ class Bullet:
         if not (self.minY <= self.y <= self.maxY):
             return False
         return True #return true if bullet is on screen
+
+#free lists of dead entities, so a long match stops allocating new ones.
+#Only objects that came out of a pool go back into one: anything made
+#directly (e.g. enemy bullets the network keeps track of) may still be
+#referenced after it leaves the world's lists
+class Pool:
+    def __init__(self, cls, maxFree=1024):
+        self.cls = cls
+        self.maxFree = maxFree
+        self.free = []
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, *args, **kwargs):
+        if self.free:
+            obj = self.free.pop()
+            obj.__init__(*args, **kwargs)
+            self.reused += 1
+        else:
+            obj = self.cls(*args, **kwargs)
+            self.created += 1
+        obj.pooled = True
+        return obj
+
+    def release(self, obj):
+        if obj.pooled and len(self.free) < self.maxFree:
+            obj.pooled = False
+            self.free.append(obj)
+
+POOLS = {cls: Pool(cls) for cls in (Bullet, Obstacle, Star, BlackHole)}
+
+def acquire(cls, *args, **kwargs):
+    return POOLS[cls].acquire(*args, **kwargs)
+
+def release(obj):
+    POOLS[type(obj)].release(obj)
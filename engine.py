@@ -0,0 +1,478 @@
+import random
+import math
+import struct
+import zlib
+from classes import UFO, Obstacle, Star, BlackHole, Bullet, acquire, release
+from spatial import SpatialHash, ObstacleIndex, maxRadius, overlaps
+
+#game rules without any graphics, so matches can be simulated headless
+#(server, bots, benchmarks) and the cmu_graphics front-end only draws them
+
+#below this many bullet/obstacle pairs a grid costs more than it saves
+BRUTE_FORCE_PAIRS = 64
+
+#checksum records: counter, game over, entity counts / player / bullet / obstacle
+WORLD_RECORD = struct.Struct('<I?HHHH')
+PLAYER_RECORD = struct.Struct('<ddddd??')
+BULLET_RECORD = struct.Struct('<dddd')
+OBSTACLE_RECORD = struct.Struct('<ddd')
+
+class World:
+    def __init__(self, width, height, stepsPerSecond=30, localRoles=(1, 2), rng=None, spawnRoles=(1,)):
+        self.width = width
+        self.height = height
+        self.stepsPerSecond = stepsPerSecond
+        #roles whose collisions and powerups this world decides, a networked
+        #client only simulates its own player and gets the enemy from the wire
+        self.localRoles = localRoles
+        #universes obstacles are thrown at. The game only attacks Player 1's,
+        #headless self-play (selfplay.py) attacks both so both sides play
+        self.spawnRoles = spawnRoles
+        self.rng = rng if rng is not None else random.Random()
+        #a profiler.Profiler when the client is timing phases, see onStep
+        self.profiler = None
+        #a selfplay.MatchStats when a match is being measured, see hurt
+        self.stats = None
+        self.reset()
+
+    def reset(self):
+        self.gameOver = False
+        self.winner = None
+
+        #horizontal line
+        self.split = self.height/2
+
+        #player size
+        self.playerR = self.height*0.035
+        #player position (x doesn't change yet, only y does)
+        self.playerX = self.width*0.08
+
+        #speeds
+        self.bulletSpeed = self.width*0.025
+        self.obstacleSpeed = self.width*0.015
+        self.dy = self.height*0.02
+
+        self.attackRate = 40 #(decrease to make level harder)
+        #what attackObstacle spawns, in percent, the rest are meteors and comets
+        self.blackHoleChance = 10
+        self.starChance = 30
+        #score a player loses to a shot in their own universe, and to a meteor or comet
+        self.shotDamage = 30
+        self.obstacleDamage = 10
+        #seconds an auto-shoot powerup and a trip to the other universe last
+        self.autoShootSeconds = 15
+        self.teleportSeconds = 10
+
+        #initialize player objects
+        #p1 is top universe (0 to split)
+        self.p1 = UFO(self.playerX, self.split/2, self.playerR, 0, self.split)
+
+        #p2 is bottom universe (split to height)
+        self.p2 = UFO(self.playerX, self.split + (self.split/2), self.playerR, self.split, self.height)
+
+        #store objects
+        self.p1Bullets = []
+        self.p1Obstacles = []
+        self.p2Bullets = []
+        self.p2Obstacles = []
+
+        self.counter = 0
+
+        #role -> ObstacleIndex of that universe, built on first use
+        self.indexes = {}
+
+    def player(self, role):
+        return self.p1 if role == 1 else self.p2
+
+    def bullets(self, role):
+        return self.p1Bullets if role == 1 else self.p2Bullets
+
+    def obstacles(self, role):
+        return self.p1Obstacles if role == 1 else self.p2Obstacles
+
+    #every spawn goes through these, so a backend can keep its own containers
+    def addBullet(self, role, bullet):
+        self.bullets(role).append(bullet)
+
+    def addObstacle(self, role, obs):
+        index = self.obstacleIndex(role)
+        self.obstacles(role).append(obs)
+        index.add(obs)
+
+    def obstacleIndex(self, role):
+        #rebuilt when the list was swapped out under it (a world from the server)
+        obstacles = self.obstacles(role)
+        index = self.indexes.get(role)
+        if index is None or index.source is not obstacles:
+            index = self.indexes[role] = ObstacleIndex(obstacles)
+        return index
+
+    def step(self, inputs=None):
+        #inputs: role -> {'move': -1/0/1, 'fire': -1/0/1} for this tick
+        if self.gameOver:
+            return
+        if inputs:
+            for role, playerInput in inputs.items():
+                applyInput(self, role, playerInput)
+        onStep(self)
+
+def makeWorld(width, height, stepsPerSecond=30, backend='objects', **kwargs):
+    #'numpy' keeps bullets and obstacles in arrays, see soa.py
+    if backend == 'numpy':
+        #imported here so numpy stays an optional dependency
+        from soa import ArrayWorld
+        return ArrayWorld(width, height, stepsPerSecond, **kwargs)
+    return World(width, height, stepsPerSecond, **kwargs)
+
+def checksum(world):
+    #crc32 of everything the simulation decides, for lockstep desync checks.
+    #Floats go in bit for bit, two worlds only match if they agree exactly
+    crc = zlib.crc32(WORLD_RECORD.pack(world.counter & 0xFFFFFFFF, world.gameOver,
+                                       len(world.p1Bullets), len(world.p2Bullets),
+                                       len(world.p1Obstacles), len(world.p2Obstacles)))
+    for p in (world.p1, world.p2):
+        crc = zlib.crc32(PLAYER_RECORD.pack(p.x, p.y, p.score, p.minY, p.teleportTimeUp,
+                                            p.isTeleported, p.isAutoShoot), crc)
+        crc = zlib.crc32(bytes(sorted(p.collectedStars)), crc)
+    for b in world.p1Bullets + world.p2Bullets:
+        crc = zlib.crc32(BULLET_RECORD.pack(b.x, b.y, b.dx, b.dy), crc)
+    for obs in world.p1Obstacles + world.p2Obstacles:
+        crc = zlib.crc32(OBSTACLE_RECORD.pack(obs.x, obs.y, obs.r), crc)
+        crc = zlib.crc32(type(obs).__name__.encode(), crc)
+    return crc
+
+def applyInput(world, role, playerInput):
+    player = world.player(role)
+    move = playerInput.get('move', 0)
+    if move:
+        player.move(move*world.dy)
+    fire = playerInput.get('fire', 0)
+    if fire:
+        fireBullet(world, role, fire)
+
+#helper for a shot to the right (direction 1) or to the left (direction -1)
+def fireBullet(world, role, direction):
+    player = world.player(role)
+    #bullet size
+    bSize = world.playerR*0.4
+
+    #bullets stay in the universe the player is in right now
+    if player.y < world.split:
+        minY, maxY = 0, world.split
+    else:
+        minY, maxY = world.split, world.height
+
+    b = acquire(Bullet, player.x + direction*player.r, player.y, bSize, direction*world.bulletSpeed, 0, minY, maxY)
+    b.damage = world.shotDamage
+    world.addBullet(role, b)
+
+def onStep(world):
+    #each phase ends with a lap when the client is profiling, that is the
+    #only thing the profiler adds to a step
+    profiler = world.profiler
+    if profiler: profiler.begin()
+    world.counter += 1
+
+    #obstacles are generated not each step, but
+    #if random is 0 (so if we decrease attackRate, obstacles will appear more often)
+    for role in world.spawnRoles:
+        if world.rng.randint(0, world.attackRate) == 0:
+            attackObstacle(world, role)
+    if profiler: profiler.lap('spawn')
+
+    #a networked client only simulates its own player's logic
+    for role in world.localRoles:
+        me = world.player(role)
+        checkTeleportTimer(world, me)
+
+        checkAutoShoot(world, me, world.bullets(role))
+    if profiler: profiler.lap('checkAutoShoot')
+
+    #update objects
+    updateObjects(world, world.p1Bullets, world.p1Obstacles)
+    updateObjects(world, world.p2Bullets, world.p2Obstacles)
+    if profiler: profiler.lap('updateObjects')
+
+    checkTeleportCollision(world, world.p1, world.p2Bullets)
+    checkTeleportCollision(world, world.p2, world.p1Bullets)
+    if profiler: profiler.lap('checkTeleportCollision')
+
+    for role in world.localRoles:
+        me = world.player(role)
+        myBullets = world.bullets(role)
+        checkCollisions(world, me, myBullets, world.obstacles(role))
+        if profiler: profiler.lap('collisions: own obstacles')
+        checkCollisions(world, me, myBullets, world.obstacles(3 - role))
+        if profiler: profiler.lap('collisions: enemy obstacles')
+        checkCollisions(world, me, myBullets, world.bullets(3 - role))
+        if profiler: profiler.lap('collisions: enemy bullets')
+
+    checkGameOver(world)
+
+#check for teleportations timer (return to their original screen if time is up)
+def checkTeleportTimer(world, me):
+    if me.isTeleported and world.counter > me.teleportTimeUp:
+        me.isTeleported = False
+        me.x = world.playerX
+        me.minY = me.homeMinY
+        me.maxY = me.homeMaxY
+        me.y = (me.homeMinY + me.homeMaxY)/2
+
+def checkGameOver(world):
+    if world.p1.score < 0:
+        world.gameOver = True
+        world.winner = "Player 2"
+    elif world.p2.score < 0:
+        world.gameOver = True
+        world.winner = "Player 1"
+
+#helper to generate obstacles
+def attackObstacle(world, playerN):
+    r = world.playerR #obstacles same size as player
+    x = world.width + r
+
+    #random number to decide type of obstacle
+    rand = world.rng.randint(1, 100)
+
+    #determine y range
+    padding = r*1.5
+    if playerN == 1:
+        minY = int(padding)
+        maxY = int(world.split - padding)
+    else:
+        minY = int(world.split + padding)
+        maxY = int(world.height - padding)
+
+    y = world.rng.randint(minY, maxY)
+
+    #spawn logic based on roll
+    if rand < world.blackHoleChance:
+        #black hole, 10% by default
+        obs = acquire(BlackHole, x, y, r, world.obstacleSpeed*0.8) #slightly slower
+    elif rand < world.blackHoleChance + world.starChance:
+        #star, 30% by default
+        starType = world.rng.randint(0, 4)
+        obs = acquire(Star, x, y, r, world.obstacleSpeed, starType)
+    else:
+        #standard obstacle (meteor or comet) the rest of the time
+        imgType = world.rng.choice(['images\\meteor.png', 'images\\comet.png'])
+        obs = acquire(Obstacle, x, y, r, world.obstacleSpeed, img=imgType)
+        obs.damage = world.obstacleDamage
+
+    world.addObstacle(playerN, obs)
+
+#helper for auto shoot powerup
+def checkAutoShoot(world, player, bullets):
+    if not autoShootReady(world, player):
+        return
+
+    #updated target detection (target another enemy too)
+    enemy = world.p2 if player == world.p1 else world.p1
+    if player.y < world.split: #if in the upper universe
+        universe = 1
+        enemyHere = enemy.y < world.split
+    else:
+        universe = 2 #if in the lower universe
+        enemyHere = enemy.y >= world.split
+
+    #find closest obstacles, the index only holds damaging ones
+    target, closestDist = world.obstacleIndex(universe).nearest(player.x, player.y, world.width)
+    if enemyHere and distance(player.x, player.y, enemy.x, enemy.y) < closestDist:
+        target = enemy
+
+    if target != None:
+        bullets.append(aimedBullet(world, player, target.x, target.y))
+
+def autoShootReady(world, player):
+    if not player.isAutoShoot:
+        return False
+    if world.counter > player.autoShootTimeUp:
+        player.isAutoShoot = False
+        return False
+    if player.shootCooldown > 0: #fire every 10 frames for visibility
+        player.shootCooldown -= 1
+        return False
+    return True
+
+def aimedBullet(world, player, x, y):
+    angle = math.atan2(y - player.y, x - player.x)
+    bSpeed = world.bulletSpeed*2.2
+    dx = math.cos(angle)*bSpeed
+    dy = math.sin(angle)*bSpeed
+
+    minY = 0 if player.y < world.split else world.split
+    maxY = world.split if player.y < world.split else world.height
+
+    bSize = world.playerR*0.4
+    player.shootCooldown = 10
+    b = acquire(Bullet, player.x, player.y, bSize, dx, dy, minY, maxY)
+    b.damage = world.shotDamage
+    return b
+
+#O(1) removal, the last item moves into the hole. Inside a backwards loop
+#that is safe: nothing below i moves. Lists are not in spawn order because
+#of it, so nothing may rely on where an item sits
+def swapRemove(items, i):
+    item = items[i]
+    last = items.pop()
+    if i < len(items):
+        items[i] = last
+    return item
+
+#every removal from the world goes through here, so no index is left
+#holding something that is gone
+def discard(world, items, i):
+    item = swapRemove(items, i)
+    for index in world.indexes.values():
+        if index.source is items:
+            index.remove(item)
+    release(item)
+
+#helper to check positions of bullets and obstacles
+def updateObjects(world, bullets, obstacles):
+    for i in range(len(bullets)-1, -1, -1):
+        if not bullets[i].update(world.width): #off screen
+            discard(world, bullets, i)
+
+    for i in range(len(obstacles)-1, -1, -1):
+        if not obstacles[i].update(): #off screen
+            discard(world, obstacles, i)
+
+#every score a player loses goes through here, so world.stats can tell
+#what it was lost to
+def hurt(world, player, amount, source):
+    player.takeDamage(amount)
+    if world.stats: world.stats.damage(player, source, amount)
+
+def damageSource(obs):
+    #what a player ran into, for hurt
+    if isinstance(obs, Bullet):
+        return 'bullet'
+    return 'comet' if obs.img == 'images\\comet.png' else 'meteor'
+
+def distance(x1, y1, x2, y2):
+    return ((x1 - x2)**2 + (y1 - y2)**2)**0.5
+
+#one point against every bullet, a grid would cost as much to build as this scan
+def checkTeleportCollision(world, traveler, attackerBullets):
+    for i in range(len(attackerBullets)-1, -1, -1):
+        bullet = attackerBullets[i]
+        if overlaps(bullet.x, bullet.y, traveler.x, traveler.y, traveler.r + bullet.r):
+            discard(world, attackerBullets, i)
+
+            if traveler.isTeleported:
+                #travelers dies in another universe immediately if shot
+                hurt(world, traveler, traveler.score + 100, 'shot abroad')
+            else:
+                #in own universe, players has only 30 points damage if shot
+                hurt(world, traveler, world.shotDamage, 'shot')
+            return
+
+#helper to check collisions
+def checkCollisions(world, player, bullets, obstacles):
+
+    #1. bullet hits obstacle
+    #the grid hands each bullet only the obstacles around it, highest index
+    #first like a backwards scan. Hits are marked and removed after the pass,
+    #highest index first, so the indices in the grid stay valid
+    if len(bullets)*len(obstacles) > BRUTE_FORCE_PAIRS:
+        grid = SpatialHash(obstacles, max(1, maxRadius(obstacles) + maxRadius(bullets)))
+    else:
+        grid = None
+    everything = range(len(obstacles)-1, -1, -1)
+    removedObstacles = set()
+    hitBullets = set()
+    for i in range(len(bullets)-1, -1, -1):
+        bullet = bullets[i]
+        hit = False
+        for j in (grid.query(bullet.x, bullet.y) if grid is not None else everything):
+            if j in removedObstacles:
+                continue
+            obs = obstacles[j]
+            if overlaps(bullet.x, bullet.y, obs.x, obs.y, obs.r + bullet.r):
+                if isinstance(obs, BlackHole):
+                    #teleporting bullets
+                    #finding from which universe obstacles we need
+                    other = 2 if obstacles is world.p1Obstacles else 1
+
+                    #the newest blackhole (if it exists) in the abother universe
+                    targetBH = world.obstacleIndex(other).latestBlackHole()
+
+                    if targetBH:
+                        bullet.x =  targetBH.x + targetBH.r + bullet.r
+                        bullet.y = targetBH.y
+                        bullet.dx = -bullet.dx #inverts the direction of the bullet
+                        bullet.dy = 0
+                        hit = False #don't delete bullet
+                        break
+
+                #bullets only destroy damaging obstacles, not stars/portals
+                if not isinstance(obs, Star) and not isinstance(obs, BlackHole):
+                    removedObstacles.add(j)
+                    hit = True
+                    break
+        if hit:
+            hitBullets.add(i)
+
+    for j in sorted(removedObstacles, reverse=True):
+        discard(world, obstacles, j)
+    for i in sorted(hitBullets, reverse=True):
+        discard(world, bullets, i)
+
+    #2. player hits obstacle
+    #one point, the player may teleport halfway through, so a plain scan
+    for j in range(len(obstacles)-1, -1, -1):
+        obs = obstacles[j]
+        if overlaps(player.x, player.y, obs.x, obs.y, player.r + obs.r):
+            #handle different collisions types
+            if isinstance(obs, Star):
+                player.collectedStars.add(obs.starType)
+                if len(player.collectedStars) >= 2:
+                    #powerup for collecting a constellation
+                    player.isAutoShoot = True
+                    player.autoShootTimeUp = world.counter + (world.autoShootSeconds * world.stepsPerSecond)
+                    player.collectedStars.clear() #reset collection
+                discard(world, obstacles, j)
+
+            elif isinstance(obs, BlackHole):
+                if world.counter < player.teleportCooldown:
+                    continue
+
+                discard(world, obstacles, j)
+                teleportPlayer(world, player)
+
+            else:
+                hurt(world, player, obs.damage, damageSource(obs))
+                discard(world, obstacles, j)
+
+#player flew into a black hole
+def teleportPlayer(world, player):
+    if player.isTeleported:
+        #going home
+        player.isTeleported = False
+        player.teleportCooldown = world.counter + (1 * world.stepsPerSecond)
+
+        player.minY = player.homeMinY
+        player.maxY = player.homeMaxY
+
+
+        player.x = world.playerX
+        player.y = (player.homeMinY + player.homeMaxY)/2
+    else:
+        #telepoting to another universe
+        player.isTeleported = True
+        player.teleportTimeUp = world.counter + (world.teleportSeconds * world.stepsPerSecond)
+        player.teleportCooldown = world.counter + (2 * world.stepsPerSecond)
+
+        if player == world.p1:
+            targetMinY = world.p2.homeMinY
+            targetMaxY = world.p2.homeMaxY
+        else:
+            targetMinY = world.p1.homeMinY
+            targetMaxY = world.p1.homeMaxY
+
+        player.minY = targetMinY
+        player.maxY = targetMaxY
+
+        player.x = world.width - world.playerX
+        player.y = world.rng.randint(int(targetMinY + player.r), int(targetMaxY - player.r))
@@ -0,0 +1,90 @@
+import random
+import zlib
+from engine import World, checksum
+
+#deterministic input lockstep: both clients run the whole world from the same
+#seed and only send their key presses for each tick. A tick runs once both
+#players' inputs for it are in, so the two worlds go through the same steps
+
+#ticks between a key press and the tick it is for, it hides the time the
+#input takes to reach the other client
+INPUT_DELAY = 4
+#ticks between world checksums sent to the other side
+CHECKSUM_INTERVAL = 30
+#ticks run in one call at most, catching up after a late input
+MAX_CATCHUP = 4
+
+def seedFor(matchId):
+    #same on every machine, unlike hash() on a str
+    return zlib.crc32(matchId.encode())
+
+def makeWorld(width, height, stepsPerSecond, seed):
+    #both players are simulated on both sides
+    return World(width, height, stepsPerSecond, localRoles=(1, 2), rng=random.Random(seed))
+
+class Lockstep:
+    def __init__(self, world, role, inputDelay=INPUT_DELAY):
+        self.world = world
+        self.role = role
+        self.inputDelay = inputDelay
+        self.tick = 0 #next tick to simulate
+        #role -> tick -> (move, fire), nobody can press anything for the first ticks
+        self.inputs = {1: {}, 2: {}}
+        for tick in range(inputDelay):
+            self.inputs[1][tick] = self.inputs[2][tick] = (0, 0)
+        self.nextInputTick = inputDelay #tick our next input is for
+        self.checksums = {} #tick -> ours, until the other side's comes in
+        self.remoteChecksums = {}
+        self.desyncTick = None #first tick the two worlds were seen to differ
+        self.stalls = 0 #calls to advance that had to wait for the other side
+
+    def addLocalInput(self, move, fire):
+        #the tick this input will run in, None if we are a whole delay ahead
+        #of the simulation already and it has to wait
+        if self.nextInputTick > self.tick + self.inputDelay:
+            return None
+        tick = self.nextInputTick
+        self.inputs[self.role][tick] = (move, fire)
+        self.nextInputTick += 1
+        return tick
+
+    def addRemoteInput(self, tick, move, fire):
+        if tick >= self.tick:
+            self.inputs[3 - self.role][tick] = (move, fire)
+
+    def addRemoteChecksum(self, tick, crc):
+        self.remoteChecksums[tick] = crc
+        self.compare(tick)
+
+    def compare(self, tick):
+        ours = self.checksums.get(tick)
+        theirs = self.remoteChecksums.get(tick)
+        if ours is None or theirs is None:
+            return
+        del self.checksums[tick], self.remoteChecksums[tick]
+        if ours != theirs and self.desyncTick is None:
+            self.desyncTick = tick
+            print(f"WARNING: lockstep desync at tick {tick}")
+
+    def advance(self):
+        #runs the ticks that are due and have both inputs in, returns
+        #(tick, checksum) pairs to send to the other side. A tick is due once
+        #our input for it is a whole delay old, running earlier would use up
+        #the delay that covers the other side's latency
+        sent = []
+        p1Inputs, p2Inputs = self.inputs[1], self.inputs[2]
+        for ran in range(MAX_CATCHUP):
+            if self.tick + self.inputDelay >= self.nextInputTick:
+                break
+            if self.tick not in p1Inputs or self.tick not in p2Inputs:
+                if ran == 0:
+                    self.stalls += 1
+                break
+            (move1, fire1), (move2, fire2) = p1Inputs.pop(self.tick), p2Inputs.pop(self.tick)
+            self.world.step({1: {'move': move1, 'fire': fire1}, 2: {'move': move2, 'fire': fire2}})
+            self.tick += 1
+            if self.tick % CHECKSUM_INTERVAL == 0:
+                self.checksums[self.tick] = checksum(self.world)
+                sent.append((self.tick, self.checksums[self.tick]))
+                self.compare(self.tick)
+        return sent
@@ -0,0 +1,47 @@
+import bisect
+
+#the server's counters in the Prometheus text format, small enough to not
+#need the client library
+#https://prometheus.io/docs/instrumenting/exposition_formats/
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#seconds, from a frame that goes straight out to one stuck behind a slow reader
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets) + 1) #the last one is past every bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        #a bucket counts the values up to and including its bound
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name):
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {total}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum {self.sum}')
+        lines.append(f'{name}_count {self.count}')
+        return lines
+
+def render(families):
+    #families: (name, 'counter'/'gauge'/'histogram', help, a number or a Histogram)
+    lines = []
+    for name, kind, description, value in families:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        if isinstance(value, Histogram):
+            lines.extend(value.lines(name))
+        else:
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
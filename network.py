@@ -0,0 +1,495 @@
+import websockets
+import asyncio
+import collections
+import threading
+import time
+import json
+import random
+import urllib.parse
+import protocol
+import lockstep
+from classes import Bullet, acquire, release
+
+
+GAMESERVERURL = "localhost:8765"
+
+#the enemy is drawn this far in the past, between two frames we already have
+INTERP_DELAY = 0.15
+#when frames are late it keeps moving on its last velocity for at most this long
+MAX_EXTRAPOLATION = 0.25
+#enemy positions kept for interpolating
+TRACK_LENGTH = 16
+#seconds between our snapshots. With ADAPTIVE_SEND it goes down towards
+#MIN_SEND_INTERVAL as the round trip grows, see sendInterval
+SEND_INTERVAL = 0.1
+MIN_SEND_INTERVAL = 0.05
+ADAPTIVE_SEND = True
+#a connection that doesn't answer a ping for this long is taken as dropped
+PING_TIMEOUT = 2
+#after a drop we connect again at once and resume our seat with the session
+#token. Every attempt that fails waits twice as long as the last, from
+#RECONNECT_MIN up to RECONNECT_MAX seconds, less a random part of up to half
+#so clients dropped together don't all come back in step
+RECONNECT_MIN = 0.25
+RECONNECT_MAX = 8
+#lockstep inputs kept to send again after a reconnect, past the last one the
+#server got. The sim can't get more than the input delay ahead of it
+RESEND_INPUTS = 64
+
+#The network thread and the game loop never write to the same objects. The
+#thread keeps its own picture of what the server sent in an Inbox and
+#publishes every update as a new snapshot that nobody changes afterwards, the
+#game loop takes the latest one in once per step (takeUpdates). The other way
+#round the loop leaves a copy of our player and bullets after each step
+#(publishSnapshot) and the sender encodes that. Each handoff is one attribute
+#store, atomic under the GIL, so there are no locks
+
+class Inbox:
+    def __init__(self):
+        self.seq = None #last delta seq seen, to notice lost frames
+        self.received = 0 #enemy frames so far
+        self.player = {} #enemy fields as last sent
+        self.bullets = {} #bullet id -> (x, y, dx, dy, frame it was last sent in, time it came)
+        self.track = collections.deque(maxlen=TRACK_LENGTH) #enemy (time, x, y), oldest first
+        self.resetClock()
+        #(frame count, player fields, bullets as (id, x, y, dx, dy, frame, time), track)
+        self.enemy = None
+        #last world in authoritative mode, as decoded
+        self.world = None
+        #lockstep mode: the start message, and the other side's inputs and
+        #checksums as ('lockstep', tick, move, fire) / ('checksum', tick, crc).
+        #A deque can be appended on one thread and popped on the other
+        self.start = None
+        self.lockstep = collections.deque()
+
+    def resetClock(self):
+        #a new opponent starts a new clock
+        self.clock = None #last sender clock, as sent
+        self.sentAt = 0 #the same, unwrapped, in seconds
+        self.offset = None #our time minus the sender's, on the quickest frame so far
+
+    def frameTime(self, data, now):
+        #when the frame was sent, on our clock. The quickest frame tells the
+        #clock offset best, later ones only ever took longer to arrive
+        if data.get('clock') is None:
+            return now
+        if self.clock is None:
+            self.sentAt = data['clock']/1000
+        else:
+            self.sentAt = protocol.unwrapClock(data['clock'], self.clock, self.sentAt)
+        self.clock = data['clock']
+        if self.offset is None or now - self.sentAt < self.offset:
+            self.offset = now - self.sentAt
+        return self.sentAt + self.offset
+
+    def addEnemyFrame(self, data, now):
+        self.received += 1
+        now = self.frameTime(data, now)
+        #deltas only carry the fields that changed
+        teleported = self.player.get('isTeleported')
+        self.player.update(data['player'])
+        if self.player.get('isTeleported') != teleported:
+            #a teleport is a jump, not something to slide across the screen
+            self.track.clear()
+        if 'x' in self.player and 'y' in self.player:
+            self.track.append((now, self.player['x'], self.player['y']))
+        if data['keyframe']:
+            #keyframe lists every live bullet, anything else is gone
+            alive = {bData[0] for bData in data['bullets']}
+            for bid in [bid for bid in self.bullets if bid not in alive]:
+                del self.bullets[bid]
+        else:
+            for bid in data['despawn']:
+                self.bullets.pop(bid, None)
+        for bid, x, y, dx, dy in data['bullets']:
+            self.bullets[bid] = (x, y, dx, dy, self.received, now)
+        self.enemy = (self.received, dict(self.player),
+                      tuple((bid,) + b for bid, b in self.bullets.items()), tuple(self.track))
+
+class PlayerState:
+    #the player fields a snapshot frame carries
+    __slots__ = ('x', 'y', 'score', 'isTeleported')
+
+    def __init__(self, player):
+        self.x = player.x
+        self.y = player.y
+        self.score = player.score
+        self.isTeleported = player.isTeleported
+
+class BulletState:
+    __slots__ = ('id', 'x', 'y', 'dx', 'dy')
+
+    def __init__(self, b):
+        self.id = b.id
+        self.x = b.x
+        self.y = b.y
+        self.dx = b.dx
+        self.dy = b.dy
+
+async def sendGameData(app, websocket):
+    #nobody to talk to before the opponent is there
+    await app.started.wait()
+    while True:
+        if app.authoritative or app.lockstep:
+            #the server or both clients run the world, we only forward what was pressed
+            frame = await app.outgoing.get()
+            try:
+                await websocket.send(frame)
+            except:
+                print("Error with sending data")
+                break
+            continue
+
+        #only send data for the player we control, as of the last step
+        snapshot = app.outbox
+        if snapshot is None:
+            await asyncio.sleep(0.05)
+            continue
+        me, myBullets, width, height, takenAt = snapshot
+
+        #delta, binary or JSON, whichever the server picked for this match
+        profiler = app.profiler
+        start = time.perf_counter() if profiler else 0
+        myData = app.encoder.encode(app.protocol, app.myRole, me, myBullets, width, height, takenAt)
+        if profiler: profiler.add('net: encode', start, time.perf_counter())
+
+        try:
+            await websocket.send(myData)
+        except:
+            print("Error with sending data")
+            break
+
+        await asyncio.sleep(sendInterval(websocket))
+
+def sendInterval(websocket):
+    if not ADAPTIVE_SEND:
+        return SEND_INTERVAL
+    #a frame takes about half a round trip to arrive, and the next one has to
+    #be there before the peer's interpolation delay runs out
+    interval = INTERP_DELAY - websocket.latency/2
+    return max(MIN_SEND_INTERVAL, min(SEND_INTERVAL, interval))
+
+
+def reconnectDelay(failures):
+    delay = min(RECONNECT_MAX, RECONNECT_MIN*2**(failures - 1))
+    return delay/2 + random.uniform(0, delay/2)
+
+async def receiveUpdates(app):
+    #lives as long as the game, one connection after the other
+    app.session = None #(token, match id) while the server keeps a seat for us
+    app.encoder = protocol.SnapshotEncoder()
+    app.started = asyncio.Event()
+    app.outgoing = asyncio.Queue()
+    app.sentInputs = collections.deque(maxlen=RESEND_INPUTS) #(tick, frame)
+    app.netLoop = asyncio.get_running_loop()
+    failures = 0
+    while True:
+        if failures:
+            await asyncio.sleep(reconnectDelay(failures))
+        try:
+            if not await playConnection(app):
+                return
+            #we had a seat, the first try after it drops is right away
+            failures = 0
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+            print(f"Could not connect: {e}")
+            failures += 1
+
+async def playConnection(app):
+    #one connection, from the handshake until it drops. False if the server
+    #won't have us, True to connect again
+    matchId = app.session[1] if app.session is not None else app.matchId
+    #the match id in the URL lets a multi-process server send both players
+    #to the same worker before the join message is read, and a resume to the
+    #worker that holds our seat (quick-match ids hash back to it)
+    uri = f"ws://{GAMESERVERURL}/"
+    if matchId is not None:
+        uri += f"?match={urllib.parse.quote(matchId)}"
+    print(f"Connecting to {uri}...")
+
+    #frequent pings keep websocket.latency fresh for sendInterval
+    async with websockets.connect(uri, ping_interval=1, ping_timeout=PING_TIMEOUT) as websocket:
+        print("Connected!")
+
+        #matchmaking handshake, the server decides which player we are
+        #and which wire format the match uses. With a session we ask for
+        #the seat we had instead
+        if app.session is not None:
+            sim = app.lockstepSim
+            await websocket.send(json.dumps({'type': 'resume', 'session': app.session[0],
+                                             'tick': sim.tick if sim is not None else None}))
+        else:
+            await websocket.send(json.dumps({'type': 'join', 'match': app.matchId,
+                                             'protocols': protocol.SUPPORTED_PROTOCOLS}))
+        reply = json.loads(await websocket.recv())
+        if reply.get('type') == 'joined':
+            print(f"Joined match {reply['match']} as Player {reply['role']}")
+            app.session = (reply['session'], reply['match'])
+            #the game loop picks this up in takeUpdates
+            app.myRole = reply['role']
+            app.started.clear()
+        elif reply.get('type') == 'resumed':
+            print(f"Resumed match {reply['match']} as Player {reply['role']}")
+            resume(app, reply)
+        elif app.session is not None:
+            #our seat was given up, the match went on without us
+            print(f"Could not resume: {reply.get('reason')}")
+            app.session = None
+            return True
+        else:
+            print(f"Could not join match: {reply.get('reason')}")
+            return False
+
+        #start the sender loop in the background of this async function
+        sender = asyncio.create_task(sendGameData(app, websocket))
+        try:
+            await receiveFrames(app, websocket)
+        finally:
+            sender.cancel()
+        return True
+
+def resume(app, reply):
+    #the server sends what we missed right after this, its cache of the
+    #other side. A lockstep world goes on from where we are
+    app.protocol = reply.get('protocol', protocol.PROTOCOL_JSON)
+    app.authoritative = reply.get('authoritative', False)
+    app.lockstep = reply.get('lockstep', False)
+    app.encoder.forceKeyframe() #our last frame the opponent got is a while ago
+    #the server let go of the movement it held for us
+    app.sentMove = None
+    lastInputTick = reply.get('lastInputTick')
+    for tick, frame in list(app.sentInputs):
+        if lastInputTick is None or tick > lastInputTick:
+            app.outgoing.put_nowait(frame)
+    app.started.set()
+
+async def receiveFrames(app, websocket):
+    inbox = app.inbox
+    while True:
+        try:
+            rawdata = await websocket.recv()
+            profiler = app.profiler
+            start = time.perf_counter() if profiler else 0
+            data = protocol.decodeMessage(rawdata, app.world.width, app.world.height)
+            if data is None:
+                continue
+
+            #match control messages from the server
+            if data.get('type') == 'start':
+                app.protocol = data.get('protocol', protocol.PROTOCOL_JSON)
+                app.authoritative = data.get('authoritative', False)
+                app.lockstep = data.get('lockstep', False)
+                if app.lockstep:
+                    inbox.start = data
+                app.encoder.forceKeyframe() #new opponent knows nothing yet
+                inbox.resetClock()
+                app.started.set()
+                print("Opponent joined, game on!")
+            elif data.get('type') == 'world':
+                inbox.world = data
+            elif data.get('type') == 'lockstep' and isinstance(data.get('tick'), int):
+                inbox.lockstep.append(('lockstep', data['tick'], protocol.clampInput(data.get('move', 0)),
+                                       protocol.clampInput(data.get('fire', 0))))
+            elif data.get('type') == 'checksum' and isinstance(data.get('tick'), int):
+                inbox.lockstep.append(('checksum', data['tick'], data.get('checksum'), None))
+            elif data.get('type') == 'opponent_left':
+                print("Opponent left the match")
+            elif data.get('type') == 'opponent_away':
+                print(f"Opponent lost their connection, waiting {data.get('seconds')} s for them")
+            elif data.get('type') == 'opponent_back':
+                print("Opponent is back")
+            elif data.get('type') == 'resync':
+                app.encoder.forceKeyframe()
+            #check if this data belongs to another player
+            elif 'role' in data and data['role'] != app.myRole:
+                #a delta went missing on the way, ask for a keyframe
+                lastSeq = inbox.seq
+                if data['seq'] is not None:
+                    inbox.seq = data['seq']
+                    if not data['keyframe'] and lastSeq is not None and data['seq'] != (lastSeq + 1) & 0xFFFFFFFF:
+                        await websocket.send(json.dumps({'type': 'resync'}))
+                inbox.addEnemyFrame(data, time.monotonic())
+            if profiler: profiler.add('net: receive', start, time.perf_counter())
+        except websockets.exceptions.ConnectionClosed as e:
+            print(f"Connection lost: {e}")
+            return
+        except Exception as e:
+            #one frame we can't read is no reason to give up the connection
+            print(f"Bad message from the server: {e}")
+
+
+def takeUpdates(app):
+    #game loop side, once per step: whatever the network thread published
+    #since the last step goes into our world
+    inbox = app.inbox
+    if inbox.start is not None and inbox.start is not app.lockstepStart:
+        #a fresh world from the match seed, the one we had is not the same
+        #as the other side's
+        app.lockstepStart = inbox.start
+        app.world = lockstep.makeWorld(app.width, app.height, app.world.stepsPerSecond, inbox.start['seed'])
+        app.lockstepSim = lockstep.Lockstep(app.world, app.myRole)
+    if app.lockstepSim is not None:
+        sim = app.lockstepSim
+        while inbox.lockstep:
+            kind, tick, a, b = inbox.lockstep.popleft()
+            if kind == 'lockstep':
+                sim.addRemoteInput(tick, a, b)
+            else:
+                sim.addRemoteChecksum(tick, a)
+        return
+
+    world = app.world
+    if app.myRole is not None and world.localRoles != (app.myRole,):
+        world.localRoles = (app.myRole,)
+
+    state = inbox.world
+    if state is not None and state is not app.worldTaken:
+        app.worldTaken = state
+        applyWorldState(app, state)
+    enemy = inbox.enemy
+    if enemy is None:
+        return
+    renderTime = time.monotonic() - INTERP_DELAY
+    if enemy[0] != app.enemyTaken:
+        updateEnemyState(app, enemy, renderTime)
+        app.enemyTaken = enemy[0]
+    #every step, not only when a frame came in
+    track = enemy[3]
+    if track:
+        player = world.player(3 - app.myRole)
+        player.x, player.y = sampleTrack(track, renderTime)
+
+def sampleTrack(track, t):
+    #position at time t from (time, x, y) samples, oldest first. Between two
+    #samples it is interpolated, past the newest one extrapolated from the
+    #last two for at most MAX_EXTRAPOLATION, before the oldest it is the oldest
+    last = track[-1]
+    if t >= last[0]:
+        if len(track) < 2:
+            return last[1], last[2]
+        t = min(t, last[0] + MAX_EXTRAPOLATION)
+        (t0, x0, y0), (t1, x1, y1) = track[-2], last
+    else:
+        i = len(track) - 1
+        while i > 0 and track[i - 1][0] > t:
+            i -= 1
+        if i == 0:
+            return track[0][1], track[0][2]
+        (t0, x0, y0), (t1, x1, y1) = track[i - 1], track[i]
+    f = (t - t0)/(t1 - t0) if t1 > t0 else 1
+    return x0 + (x1 - x0)*f, y0 + (y1 - y0)*f
+
+def publishSnapshot(app):
+    #copy-on-tick, sendGameData only ever sees a whole step
+    world = app.world
+    app.outbox = (PlayerState(world.player(app.myRole)),
+                  tuple(BulletState(b) for b in world.bullets(app.myRole)),
+                  world.width, world.height, time.monotonic())
+
+def updateEnemyState(app, snapshot, renderTime):
+    world = app.world
+    enemy = world.player(3 - app.myRole)
+    received, player, bullets, track = snapshot
+
+    #sync data of enemy, the position comes from the track in takeUpdates
+    enemy.score = player.get('score', enemy.score)
+    enemy.isTeleported = player.get('isTeleported', enemy.isTeleported)
+
+    #sync Bullets in place, keyed by the id the enemy gave them
+    enemyBulletsList = world.bullets(3 - app.myRole)
+    known = app.enemyBullets
+
+    alive = set()
+    for bid, x, y, dx, dy, sent, receivedAt in bullets:
+        alive.add(bid)
+        #bullets stay inside the universe they are flying in
+        minY, maxY = (0, world.split) if y < world.split else (world.split, world.height)
+        #dead reckoning to where it is at render time, the same moment in the
+        #past the enemy UFO is drawn at
+        steps = (renderTime - receivedAt)*world.stepsPerSecond
+        x, y = x + dx*steps, y + dy*steps
+        b = known.get(bid)
+        if b is None:
+            #we simulate it from here on, updateObjects moves it every step.
+            #Not from a pool: our world may drop it while known still has it
+            b = Bullet(x, y, world.playerR*0.4, dx, dy, minY, maxY, bulletId=bid)
+            known[bid] = b
+            enemyBulletsList.append(b)
+        elif sent > app.enemyTaken:
+            #only bullets sent again since the last step are corrected
+            b.x, b.y, b.dx, b.dy = x, y, dx, dy
+            b.minY, b.maxY = minY, maxY
+
+    for bid in [bid for bid in known if bid not in alive]:
+        b = known.pop(bid)
+        if b in enemyBulletsList:
+            enemyBulletsList.remove(b)
+
+
+def stepLockstep(app, move, fire):
+    #called from the game loop in lockstep mode: sends this step's input for
+    #a later tick and runs whatever ticks are ready. False when the input
+    #could not be taken yet because the other side is behind
+    sim = app.lockstepSim
+    tick = sim.addLocalInput(move, fire)
+    if tick is not None:
+        frame = protocol.encodeLockstep(app.protocol, tick, move, fire)
+        #kept in case the connection drops before the server has it
+        app.sentInputs.append((tick, frame))
+        send(app, frame)
+    for checkTick, crc in sim.advance():
+        send(app, protocol.encodeChecksum(app.protocol, checkTick, crc))
+    return tick is not None
+
+def send(app, frame):
+    app.netLoop.call_soon_threadsafe(app.outgoing.put_nowait, frame)
+
+def sendInput(app, move, fire):
+    #called from the game loop in authoritative mode, movement is only sent
+    #when it changes because the server keeps it held until told otherwise
+    if move == app.sentMove and not fire:
+        return
+    app.sentMove = move
+    send(app, protocol.encodeInput(app.protocol, move, fire))
+
+
+def applyWorldState(app, data):
+    #authoritative mode, the server's world replaces ours
+    world = app.world
+    world.counter = data['counter']
+    world.gameOver = data['gameOver']
+    world.winner = f"Player {data['winner']}" if data['winner'] else None
+
+    for player, state in zip((world.p1, world.p2), data['players']):
+        player.x = state['x']
+        player.y = state['y']
+        player.score = state['score']
+        player.isTeleported = state['isTeleported']
+        player.isAutoShoot = state['isAutoShoot']
+        player.collectedStars = state['collectedStars']
+
+    bSize = world.playerR*0.4
+    p1Bullets, p2Bullets = [[acquire(Bullet, x, y, bSize, dx, dy, 0, 0, bulletId=bid) for bid, x, y, dx, dy in bullets]
+                            for bullets in data['bullets']]
+    p1Obstacles, p2Obstacles = [[protocol.makeObstacle(kind, x, y, world.playerR, world.obstacleSpeed)
+                                 for kind, x, y in obstacles]
+                                for obstacles in data['obstacles']]
+
+    #runs in the game loop, nothing else can still be drawing the old ones
+    for obj in world.p1Bullets + world.p2Bullets + world.p1Obstacles + world.p2Obstacles:
+        release(obj)
+    world.p1Bullets, world.p2Bullets = p1Bullets, p2Bullets
+    world.p1Obstacles, world.p2Obstacles = p1Obstacles, p2Obstacles
+
+
+def runAsyncInThread(app):
+    app.inbox = Inbox()
+    app.outbox = None
+    def runner():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(receiveUpdates(app))
+    #named for the profiler's trace
+    t = threading.Thread(target=runner, name='network')
+    t.start()
+    return t
@@ -0,0 +1,71 @@
+import itertools
+import json
+import os
+import threading
+import time
+
+#where the client's frame time goes: the game loop and the network thread
+#record named spans into a ring buffer, main.py shows a per-phase summary
+#on 'o' and dumps the buffer as a Chrome trace on 't' (open it in
+#chrome://tracing or ui.perfetto.dev). Nothing is recorded while app.profiler
+#and world.profiler are None, each phase then costs one attribute check
+
+#spans kept, a few seconds of a busy match
+RING_SIZE = 8192
+#seconds of spans the overlay averages over
+SUMMARY_WINDOW = 1.0
+
+class Profiler:
+    def __init__(self, size=RING_SIZE):
+        self.size = size
+        #one slot per span, written in place so recording allocates nothing
+        #but the tuple. next() on a count is atomic, so both threads can write
+        self.spans = [None]*size
+        self.slots = itertools.count()
+        self.last = time.perf_counter()
+        self.origin = self.last
+
+    def add(self, name, start, end):
+        self.spans[next(self.slots) % self.size] = (name, threading.get_ident(), start, end)
+
+    def begin(self):
+        #the following lap measures from here
+        self.last = time.perf_counter()
+
+    def lap(self, name):
+        #a span from the last begin or lap until now, for phases that follow
+        #each other on the game loop
+        now = time.perf_counter()
+        self.add(name, self.last, now)
+        self.last = now
+
+    def recent(self, seconds):
+        cutoff = time.perf_counter() - seconds
+        return [span for span in self.spans if span is not None and span[3] >= cutoff]
+
+    def summary(self, frameName, seconds=SUMMARY_WINDOW):
+        #(name, ms per frame) of every span name seen lately, slowest first.
+        #A frame is one frameName span, the name of the span around a whole step
+        totals = {}
+        frames = 0
+        for name, thread, start, end in self.recent(seconds):
+            if name == frameName:
+                frames += 1
+            totals[name] = totals.get(name, 0) + end - start
+        frames = max(1, frames)
+        return sorted(((name, total*1000/frames) for name, total in totals.items()), key=lambda row: -row[1])
+
+    def dump(self, path=None):
+        #Chrome trace-event JSON, complete events ('X') in microseconds
+        path = path or f"trace-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        spans = sorted((span for span in self.spans if span is not None), key=lambda span: span[2])
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        threads = {span[1] for span in spans}
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread,
+                   'args': {'name': names.get(thread, str(thread))}} for thread in threads]
+        for name, thread, start, end in spans:
+            events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': thread,
+                           'ts': (start - self.origin)*1e6, 'dur': (end - start)*1e6})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return path
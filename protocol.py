@@ -0,0 +1,397 @@
+import json
+import struct
+import time
+from classes import Obstacle, Star, BlackHole, acquire
+
+#protocol versions, offered by the client in its join message and picked by
+#the server once both players of a match are known
+PROTOCOL_JSON = 1
+PROTOCOL_BINARY = 2
+PROTOCOL_DELTA = 3
+SUPPORTED_PROTOCOLS = (PROTOCOL_DELTA, PROTOCOL_BINARY, PROTOCOL_JSON)
+
+#message kinds inside a binary frame
+KIND_SNAPSHOT = 1
+KIND_KEYFRAME = 2
+KIND_DELTA = 3
+#authoritative mode: clients send inputs, the server sends the whole world
+KIND_INPUT = 4
+KIND_WORLD = 5
+#lockstep mode: clients send each other their inputs per tick and checksums
+KIND_LOCKSTEP = 6
+KIND_CHECKSUM = 7
+
+#positions are sent as 16-bit fixed point relative to the window size, with
+#a margin on both sides because bullets live a bit past the screen edges
+QUANT_MAX = 65535
+QUANT_MARGIN = 0.25
+QUANT_SPAN = 1 + 2*QUANT_MARGIN
+#velocities are signed 16-bit, in 1/131072 of the window size per frame
+VELOCITY_SCALE = 131072
+
+#version, kind, role, flags, score, x, y, bullet count
+SNAPSHOT_HEADER = struct.Struct('<BBBBhHHH')
+FLAG_TELEPORTED = 1
+
+#version, kind, role, field mask, seq, sender clock, spawn count, despawn count
+DELTA_HEADER = struct.Struct('<BBBBIHHH')
+#bullet spawn: id, x, y, dx, dy
+SPAWN_FORMAT = 'IHHhh'
+SPAWN_SIZE = struct.calcsize('<' + SPAWN_FORMAT)
+#which player fields follow the delta header
+FIELD_X = 1
+FIELD_Y = 2
+FIELD_SCORE = 4
+FIELD_TELEPORTED = 8
+TELEPORTED_ON = 16 #value of isTeleported when FIELD_TELEPORTED is set
+ALL_FIELDS = FIELD_X | FIELD_Y | FIELD_SCORE | FIELD_TELEPORTED
+#a full keyframe every second at 10 frames a second, deltas in between
+KEYFRAME_INTERVAL = 10
+#the sender clock is in milliseconds and wraps, see unwrapClock
+CLOCK_WRAP = 65536
+
+U16 = struct.Struct('<H')
+I16 = struct.Struct('<h')
+
+#version, kind, move, fire
+INPUT_FORMAT = struct.Struct('<BBbb')
+#version, kind, tick, move, fire
+LOCKSTEP_FORMAT = struct.Struct('<BBIbb')
+#version, kind, tick, crc32 of the world after that tick
+CHECKSUM_FORMAT = struct.Struct('<BBII')
+
+#version, kind, flags (game over, winner role), counter
+WORLD_HEADER = struct.Struct('<BBBI')
+#x, y, score, flags (teleported, auto-shoot), collected stars bitmask
+PLAYER_STATE = struct.Struct('<HHhBB')
+#obstacle: kind, x, y
+OBSTACLE_FORMAT = 'BHH'
+OBSTACLE_SIZE = struct.calcsize('<' + OBSTACLE_FORMAT)
+#obstacle kinds, stars add their star type to OBSTACLE_STAR
+OBSTACLE_METEOR = 0
+OBSTACLE_COMET = 1
+OBSTACLE_BLACKHOLE = 2
+OBSTACLE_STAR = 8
+
+def negotiateProtocol(offersA, offersB):
+    #highest version both sides speak, JSON is always understood
+    common = set(offersA) & set(offersB)
+    return max(common) if common else PROTOCOL_JSON
+
+def isSelfContained(frame):
+    #frames that carry the sender's whole state, anything still queued from
+    #the same sender can be dropped in their favor
+    if isinstance(frame, str):
+        return frame.startswith('{"role"')
+    return len(frame) > 1 and frame[1] in (KIND_SNAPSHOT, KIND_KEYFRAME)
+
+def isPositionUpdate(frame):
+    #snapshots and deltas, where the sender is now. Of a run of them that
+    #can't all be passed on only the newest matters, a missed delta is
+    #asked for again as a keyframe
+    if isinstance(frame, str):
+        return frame.startswith('{"role"')
+    return len(frame) > 1 and frame[1] in (KIND_SNAPSHOT, KIND_KEYFRAME, KIND_DELTA)
+
+def isLockstep(frame):
+    #lockstep inputs and checksums, every one of them has to arrive
+    if isinstance(frame, str):
+        return frame.startswith(('{"type": "lockstep"', '{"type": "checksum"'))
+    return len(frame) > 1 and frame[1] in (KIND_LOCKSTEP, KIND_CHECKSUM)
+
+def quantize(value, size):
+    q = int((value/size + QUANT_MARGIN)*(QUANT_MAX/QUANT_SPAN) + 0.5)
+    return 0 if q < 0 else QUANT_MAX if q > QUANT_MAX else q
+
+def dequantize(q, size):
+    return (q*(QUANT_SPAN/QUANT_MAX) - QUANT_MARGIN)*size
+
+def quantizeVelocity(value, size):
+    q = round(value/size*VELOCITY_SCALE)
+    return -32768 if q < -32768 else 32767 if q > 32767 else q
+
+def dequantizeVelocity(q, size):
+    return q*size/VELOCITY_SCALE
+
+def encodeSnapshot(protocol, role, player, bullets, width, height):
+    if protocol != PROTOCOL_BINARY:
+        return json.dumps({
+            'role': role,
+            'y': player.y,
+            'x': player.x,
+            'score': player.score,
+            'isTeleported': player.isTeleported,
+            'bullets': [{'x': b.x, 'y': b.y} for b in bullets]
+        })
+
+    flags = FLAG_TELEPORTED if player.isTeleported else 0
+    header = SNAPSHOT_HEADER.pack(PROTOCOL_BINARY, KIND_SNAPSHOT, role, flags, int(player.score),
+                                  quantize(player.x, width), quantize(player.y, height), len(bullets))
+    #bullets go out as one contiguous x, y, x, y... array
+    coords = []
+    for b in bullets:
+        coords.append(quantize(b.x, width))
+        coords.append(quantize(b.y, height))
+    return header + struct.pack(f'<{len(coords)}H', *coords)
+
+class SnapshotEncoder:
+    #one per connection, remembers what the peer already knows so a delta
+    #frame only carries changed player fields and bullet spawns/despawns
+    def __init__(self):
+        self.seq = 0
+        self.sentPlayer = None #quantized (x, y, score, isTeleported)
+        self.sentBullets = {} #bullet id -> quantized (dx, dy)
+        self.forceKeyframe()
+
+    def forceKeyframe(self):
+        self.framesToKeyframe = 0
+
+    def encode(self, protocol, role, player, bullets, width, height, sentAt=None):
+        #sentAt is when the snapshot was taken (time.monotonic), the peer
+        #interpolates on it instead of on arrival times with their jitter
+        if protocol != PROTOCOL_DELTA:
+            return encodeSnapshot(protocol, role, player, bullets, width, height)
+
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        keyframe = self.framesToKeyframe <= 0
+        if keyframe:
+            self.framesToKeyframe = KEYFRAME_INTERVAL
+        self.framesToKeyframe -= 1
+
+        current = (quantize(player.x, width), quantize(player.y, height), int(player.score), player.isTeleported)
+        if keyframe or self.sentPlayer is None:
+            mask = ALL_FIELDS
+        else:
+            mask = 0
+            if current[0] != self.sentPlayer[0]: mask |= FIELD_X
+            if current[1] != self.sentPlayer[1]: mask |= FIELD_Y
+            if current[2] != self.sentPlayer[2]: mask |= FIELD_SCORE
+            if current[3] != self.sentPlayer[3]: mask |= FIELD_TELEPORTED
+        self.sentPlayer = current
+
+        values = []
+        if mask & FIELD_X: values.append(current[0])
+        if mask & FIELD_Y: values.append(current[1])
+        if mask & FIELD_SCORE: values.append(current[2])
+        if current[3]: mask |= TELEPORTED_ON
+
+        #bullets fly in straight lines, so the peer only needs to hear about
+        #one when it appears or its velocity changes (black hole teleport)
+        spawnCount = 0
+        alive = {}
+        for b in bullets:
+            velocity = (quantizeVelocity(b.dx, width), quantizeVelocity(b.dy, height))
+            alive[b.id] = velocity
+            if keyframe or self.sentBullets.get(b.id) != velocity:
+                values += (b.id & 0xFFFFFFFF, quantize(b.x, width), quantize(b.y, height), velocity[0], velocity[1])
+                spawnCount += 1
+        despawn = [] if keyframe else [bid & 0xFFFFFFFF for bid in self.sentBullets if bid not in alive]
+        self.sentBullets = alive
+        values += despawn
+
+        fieldFormat = ''.join(f for bit, f in ((FIELD_X, 'H'), (FIELD_Y, 'H'), (FIELD_SCORE, 'h')) if mask & bit)
+        if sentAt is None:
+            sentAt = time.monotonic()
+        clock = int(sentAt*1000) % CLOCK_WRAP
+        header = DELTA_HEADER.pack(PROTOCOL_DELTA, KIND_KEYFRAME if keyframe else KIND_DELTA,
+                                   role, mask, self.seq, clock, spawnCount, len(despawn))
+        return header + struct.pack(f'<{fieldFormat}{SPAWN_FORMAT*spawnCount}{len(despawn)}I', *values)
+
+def decodeDelta(raw, width, height):
+    _, kind, role, mask, seq, clock, spawnCount, despawnCount = DELTA_HEADER.unpack_from(raw)
+    offset = DELTA_HEADER.size
+    player = {}
+    if mask & FIELD_X:
+        player['x'] = dequantize(U16.unpack_from(raw, offset)[0], width)
+        offset += 2
+    if mask & FIELD_Y:
+        player['y'] = dequantize(U16.unpack_from(raw, offset)[0], height)
+        offset += 2
+    if mask & FIELD_SCORE:
+        player['score'] = I16.unpack_from(raw, offset)[0]
+        offset += 2
+    if mask & FIELD_TELEPORTED:
+        player['isTeleported'] = bool(mask & TELEPORTED_ON)
+
+    values = struct.unpack_from('<' + SPAWN_FORMAT*spawnCount, raw, offset)
+    bullets = [(values[i], dequantize(values[i + 1], width), dequantize(values[i + 2], height),
+                dequantizeVelocity(values[i + 3], width), dequantizeVelocity(values[i + 4], height))
+               for i in range(0, len(values), 5)]
+    offset += SPAWN_SIZE*spawnCount
+    despawn = list(struct.unpack_from(f'<{despawnCount}I', raw, offset))
+    return {'role': role, 'seq': seq, 'clock': clock, 'keyframe': kind == KIND_KEYFRAME,
+            'player': player, 'bullets': bullets, 'despawn': despawn}
+
+def unwrapClock(clock, last, lastTime):
+    #sender time in seconds for a wrapped millisecond clock, going on from
+    #the previous frame's clock and time. Frames arrive in order
+    return lastTime + ((clock - last) % CLOCK_WRAP)/1000
+
+def decodeMessage(raw, width, height):
+    #text frames are JSON: control messages ({'type': ...}) come back as they
+    #are. Snapshots in every encoding come back as {'role', 'seq', 'clock',
+    #'keyframe', 'player': {changed fields}, 'bullets': [(id, x, y, dx, dy)],
+    #'despawn': [id]}, only delta frames have a seq and a sender clock
+    #full snapshots (JSON and PROTOCOL_BINARY) have no ids or velocities, so
+    #their bullets are numbered by position and standing still
+    if isinstance(raw, str):
+        data = json.loads(raw)
+        if data.get('type') == 'world':
+            data['players'] = [{'x': x, 'y': y, 'score': score, 'isTeleported': teleported,
+                                'isAutoShoot': autoShoot, 'collectedStars': set(stars)}
+                               for x, y, score, teleported, autoShoot, stars in data['players']]
+            return data
+        if 'role' not in data or 'type' in data:
+            return data
+        player = {k: data[k] for k in ('x', 'y', 'score', 'isTeleported') if k in data}
+        bullets = [(i, b['x'], b['y'], 0, 0) for i, b in enumerate(data.get('bullets', []))]
+        return {'role': data['role'], 'seq': None, 'clock': None, 'keyframe': True,
+                'player': player, 'bullets': bullets, 'despawn': []}
+
+    if raw[1] == KIND_WORLD:
+        return decodeWorld(raw, width, height)
+    if raw[1] in (KIND_LOCKSTEP, KIND_CHECKSUM):
+        return decodeLockstep(raw)
+    if raw[0] == PROTOCOL_DELTA and raw[1] in (KIND_KEYFRAME, KIND_DELTA):
+        return decodeDelta(raw, width, height)
+    if raw[0] != PROTOCOL_BINARY or raw[1] != KIND_SNAPSHOT:
+        return None
+    _, _, role, flags, score, x, y, count = SNAPSHOT_HEADER.unpack_from(raw)
+    coords = struct.unpack_from(f'<{2*count}H', raw, SNAPSHOT_HEADER.size)
+    bullets = [(i//2, dequantize(coords[i], width), dequantize(coords[i + 1], height), 0, 0)
+               for i in range(0, len(coords), 2)]
+    player = {
+        'x': dequantize(x, width),
+        'y': dequantize(y, height),
+        'score': score,
+        'isTeleported': bool(flags & FLAG_TELEPORTED)
+    }
+    return {'role': role, 'seq': None, 'clock': None, 'keyframe': True,
+            'player': player, 'bullets': bullets, 'despawn': []}
+
+def encodeInput(protocol, move, fire):
+    if protocol == PROTOCOL_JSON:
+        return json.dumps({'type': 'input', 'move': move, 'fire': fire})
+    return INPUT_FORMAT.pack(protocol, KIND_INPUT, move, fire)
+
+def decodeInput(raw):
+    #(move, fire) from an input frame, None for anything else
+    if isinstance(raw, str):
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or data.get('type') != 'input':
+            return None
+        return clampInput(data.get('move', 0)), clampInput(data.get('fire', 0))
+    if len(raw) != INPUT_FORMAT.size or raw[1] != KIND_INPUT:
+        return None
+    _, _, move, fire = INPUT_FORMAT.unpack(raw)
+    return clampInput(move), clampInput(fire)
+
+def encodeLockstep(protocol, tick, move, fire):
+    if protocol == PROTOCOL_JSON:
+        return json.dumps({'type': 'lockstep', 'tick': tick, 'move': move, 'fire': fire})
+    return LOCKSTEP_FORMAT.pack(protocol, KIND_LOCKSTEP, tick & 0xFFFFFFFF, move, fire)
+
+def encodeChecksum(protocol, tick, crc):
+    if protocol == PROTOCOL_JSON:
+        return json.dumps({'type': 'checksum', 'tick': tick, 'checksum': crc})
+    return CHECKSUM_FORMAT.pack(protocol, KIND_CHECKSUM, tick & 0xFFFFFFFF, crc)
+
+def decodeLockstep(raw):
+    #{'type': 'lockstep', 'tick', 'move', 'fire'} or {'type': 'checksum', 'tick', 'checksum'}
+    if raw[1] == KIND_CHECKSUM and len(raw) == CHECKSUM_FORMAT.size:
+        _, _, tick, crc = CHECKSUM_FORMAT.unpack(raw)
+        return {'type': 'checksum', 'tick': tick, 'checksum': crc}
+    if raw[1] == KIND_LOCKSTEP and len(raw) == LOCKSTEP_FORMAT.size:
+        _, _, tick, move, fire = LOCKSTEP_FORMAT.unpack(raw)
+        return {'type': 'lockstep', 'tick': tick, 'move': clampInput(move), 'fire': clampInput(fire)}
+    return None
+
+def clampInput(value):
+    if not isinstance(value, int):
+        return 0
+    return -1 if value < 0 else 1 if value > 0 else 0
+
+def obstacleKind(obs):
+    if isinstance(obs, Star):
+        return OBSTACLE_STAR + obs.starType
+    if isinstance(obs, BlackHole):
+        return OBSTACLE_BLACKHOLE
+    return OBSTACLE_COMET if obs.img == 'images\\comet.png' else OBSTACLE_METEOR
+
+def makeObstacle(kind, x, y, r, speed):
+    if kind >= OBSTACLE_STAR:
+        return acquire(Star, x, y, r, speed, kind - OBSTACLE_STAR)
+    if kind == OBSTACLE_BLACKHOLE:
+        return acquire(BlackHole, x, y, r, speed*0.8)
+    img = 'images\\comet.png' if kind == OBSTACLE_COMET else 'images\\meteor.png'
+    return acquire(Obstacle, x, y, r, speed, img=img)
+
+def encodeWorld(protocol, world):
+    #whole world state, encoded once per tick and sent to both players
+    winner = 0
+    if world.winner is not None:
+        winner = 1 if world.winner == "Player 1" else 2
+    players = (world.p1, world.p2)
+    universes = ((world.p1Bullets, world.p1Obstacles), (world.p2Bullets, world.p2Obstacles))
+
+    if protocol == PROTOCOL_JSON:
+        return json.dumps({
+            'type': 'world',
+            'counter': world.counter,
+            'gameOver': world.gameOver,
+            'winner': winner,
+            'players': [[p.x, p.y, p.score, p.isTeleported, p.isAutoShoot, sorted(p.collectedStars)] for p in players],
+            'bullets': [[[b.id, b.x, b.y, b.dx, b.dy] for b in bullets] for bullets, _ in universes],
+            'obstacles': [[[obstacleKind(obs), obs.x, obs.y] for obs in obstacles] for _, obstacles in universes]
+        })
+
+    width, height = world.width, world.height
+    flags = (1 if world.gameOver else 0) | (winner << 1)
+    parts = [WORLD_HEADER.pack(protocol, KIND_WORLD, flags, world.counter & 0xFFFFFFFF)]
+    for p in players:
+        playerFlags = (1 if p.isTeleported else 0) | (2 if p.isAutoShoot else 0)
+        stars = 0
+        for starType in p.collectedStars:
+            stars |= 1 << starType
+        parts.append(PLAYER_STATE.pack(quantize(p.x, width), quantize(p.y, height), int(p.score), playerFlags, stars))
+    for bullets, obstacles in universes:
+        values = []
+        for b in bullets:
+            values += (b.id & 0xFFFFFFFF, quantize(b.x, width), quantize(b.y, height),
+                       quantizeVelocity(b.dx, width), quantizeVelocity(b.dy, height))
+        for obs in obstacles:
+            values += (obstacleKind(obs), quantize(obs.x, width), quantize(obs.y, height))
+        parts.append(struct.pack(f'<H{SPAWN_FORMAT*len(bullets)}H{OBSTACLE_FORMAT*len(obstacles)}',
+                                 len(bullets), *values[:5*len(bullets)], len(obstacles), *values[5*len(bullets):]))
+    return b''.join(parts)
+
+def decodeWorld(raw, width, height):
+    #{'type': 'world', 'counter', 'gameOver', 'winner', 'players': [p1, p2],
+    #'bullets': [[(id, x, y, dx, dy)], ...], 'obstacles': [[(kind, x, y)], ...]}
+    _, _, flags, counter = WORLD_HEADER.unpack_from(raw)
+    offset = WORLD_HEADER.size
+    players = []
+    for _ in range(2):
+        x, y, score, playerFlags, stars = PLAYER_STATE.unpack_from(raw, offset)
+        offset += PLAYER_STATE.size
+        players.append({'x': dequantize(x, width), 'y': dequantize(y, height), 'score': score,
+                        'isTeleported': bool(playerFlags & 1), 'isAutoShoot': bool(playerFlags & 2),
+                        'collectedStars': {t for t in range(8) if stars & (1 << t)}})
+    bullets, obstacles = [], []
+    for _ in range(2):
+        count = U16.unpack_from(raw, offset)[0]
+        values = struct.unpack_from('<' + SPAWN_FORMAT*count, raw, offset + 2)
+        offset += 2 + SPAWN_SIZE*count
+        bullets.append([(values[i], dequantize(values[i + 1], width), dequantize(values[i + 2], height),
+                         dequantizeVelocity(values[i + 3], width), dequantizeVelocity(values[i + 4], height))
+                        for i in range(0, len(values), 5)])
+        count = U16.unpack_from(raw, offset)[0]
+        values = struct.unpack_from('<' + OBSTACLE_FORMAT*count, raw, offset + 2)
+        offset += 2 + OBSTACLE_SIZE*count
+        obstacles.append([(values[i], dequantize(values[i + 1], width), dequantize(values[i + 2], height))
+                          for i in range(0, len(values), 3)])
+    return {'type': 'world', 'counter': counter, 'gameOver': bool(flags & 1), 'winner': flags >> 1,
+            'players': players, 'bullets': bullets, 'obstacles': obstacles}
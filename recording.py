@@ -0,0 +1,115 @@
+import bisect
+import mmap
+import os
+import struct
+import sys
+
+#a match's message stream on disk, as the server relayed it: the start
+#message, then every frame from either player (or every world frame in
+#authoritative mode), append-only and length-prefixed
+#
+#   file:   MAGIC, record, record, ...
+#   record: RECORD_HEADER (payload length, ms since the start, key, flags), payload
+#
+#key is the sender's role, 0 for the server's own frames. A reader maps the
+#file and only walks the 10-byte headers to index it, so seeking to a time
+#is a bisect and a frame is a slice of the map, nothing is copied or parsed.
+#Spectators get their frames as a run of the same records in one binary
+#message per flush
+MAGIC = b'UFOREC1\n'
+RECORD_HEADER = struct.Struct('<IIBB')
+FLAG_TEXT = 1
+#bytes the writer holds before it goes to the file, a crash loses at most this
+WRITE_BUFFER = 65536
+
+def pack(frame, key, ms):
+    text = isinstance(frame, str)
+    payload = frame.encode() if text else frame
+    return RECORD_HEADER.pack(len(payload), ms, key, FLAG_TEXT if text else 0) + payload
+
+def unpack(buffer):
+    #(seconds, key, frame) of every record in a spectator message, text
+    #frames as str like the websocket gave them, binary ones as memoryviews
+    view = memoryview(buffer)
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(view):
+        seconds, key, frame, offset = readRecord(view, offset)
+        yield seconds, key, frame
+
+def readRecord(view, offset):
+    length, ms, key, flags = RECORD_HEADER.unpack_from(view, offset)
+    start = offset + RECORD_HEADER.size
+    payload = view[start:start + length]
+    return ms/1000, key, str(payload, 'utf-8') if flags & FLAG_TEXT else payload, start + length
+
+class Recorder:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb', buffering=WRITE_BUFFER)
+        self.file.write(MAGIC)
+        self.frames = 0
+
+    def add(self, record):
+        #a record from pack, the spectators get the same bytes
+        self.file.write(record)
+        self.frames += 1
+
+    def close(self):
+        self.file.close()
+
+class Recording:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a match recording")
+        #header offset and time of every record. A record cut short by a
+        #crash ends the index
+        self.offsets = []
+        self.times = []
+        offset = len(MAGIC)
+        size = len(self.map)
+        while offset + RECORD_HEADER.size <= size:
+            length, ms, key, flags = RECORD_HEADER.unpack_from(self.map, offset)
+            if offset + RECORD_HEADER.size + length > size:
+                break
+            self.offsets.append(offset)
+            self.times.append(ms)
+            offset += RECORD_HEADER.size + length
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def duration(self):
+        return self.times[-1]/1000 if self.times else 0.0
+
+    def frame(self, index):
+        #(seconds, key, frame) like unpack, binary frames are views into the map
+        seconds, key, frame, _ = readRecord(memoryview(self.map), self.offsets[index])
+        return seconds, key, frame
+
+    def seek(self, seconds):
+        #index of the first frame at or after seconds
+        return bisect.bisect_left(self.times, int(seconds*1000))
+
+    def frames(self, start=0):
+        for index in range(start, len(self.offsets)):
+            yield self.frame(index)
+
+    def close(self):
+        self.map.close()
+
+def main():
+    #python recording.py <file> [seconds]: what is in a recording, and the
+    #first frames from a point in it
+    recording = Recording(sys.argv[1])
+    print(f"{sys.argv[1]}: {len(recording)} frames, {recording.duration():.1f} s, "
+          f"{os.path.getsize(sys.argv[1])} bytes")
+    start = recording.seek(float(sys.argv[2])) if len(sys.argv) > 2 else 0
+    for index in range(start, min(start + 5, len(recording))):
+        seconds, key, frame = recording.frame(index)
+        shown = frame[:60] if isinstance(frame, str) else bytes(frame[:24]).hex()
+        print(f"{seconds:8.3f}  key {key}  {len(frame):5d} bytes  {shown}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+from cmu_graphics import *
+from cmu_graphics import cmu_graphics as cmu
+from cmu_graphics import shape_logic
+import time
+
+#drawing for main.py. Every draw call in redrawAll builds a brand new shape,
+#and that is most of what a frame costs: ~7ms for a label, ~0.25ms for an
+#image or circle. So shapes are made once and kept in a few groups: redrawAll
+#moves them, hides the ones it doesn't need and puts the groups back in
+#app.group, which cmu_graphics empties before every frame. The caches live in
+#this module and not on app: app may not change inside redrawAll
+
+black  = rgb(31, 31, 31)
+white  = rgb(179, 179, 179)
+purple = rgb(136, 153, 207)
+green  = rgb(141, 199, 111)
+yellow = rgb(212, 212, 78)
+red    = rgb(206, 67, 69)
+
+#the assets.Sprites whose images cmu_graphics has been given
+SPRITES_GIVEN = {'sprites': None}
+#name -> group of kept shapes, drawn in the order they were first used
+GROUPS = {}
+#the groups the last frame drew, what a skipped frame shows again
+FRAME_GROUPS = []
+#look of a shape -> shapes made with it, handed out in order every frame
+SHAPES = {}
+#look of a shape -> how many of its shapes this frame and the last one showed
+USED = {}
+SHOWN = {}
+#name -> (values the shapes were made from, the shapes)
+LAYERS = {}
+#profiler overlay: its labels, made once, and the second they were last filled in
+PROFILER_ROWS = 18
+PROFILER_LABELS = []
+PROFILER_SHOWN = {'second': None}
+
+def keep(make, *args, **kwargs):
+    #a shape that outlives the frame. cmu_graphics only hands out throwaway
+    #ones in redrawAll, this makes one the way the framework makes its own
+    with cmu.NoMvc():
+        return make(*args, **kwargs)
+
+def group(app, name):
+    #re-adding one group is a single insert, re-adding each of its shapes
+    #would cost a scan of app.group per shape
+    g = GROUPS.get(name)
+    if g is None:
+        g = GROUPS[name] = keep(Group)
+    app.group.add(g)
+    if g not in FRAME_GROUPS:
+        FRAME_GROUPS.append(g)
+    return g
+
+def place(look, make, *args, **kwargs):
+    #the next free entity shape with this look, made if all of them are in use
+    shapes = SHAPES.setdefault(look, [])
+    i = USED.get(look, 0)
+    USED[look] = i + 1
+    if i == len(shapes):
+        shapes.append(keep(make, *args, **kwargs))
+        GROUPS['entities'].add(shapes[i])
+    elif i >= SHOWN.get(look, 0):
+        shapes[i].visible = True
+    return shapes[i]
+
+def hideUnused():
+    for look, shapes in SHAPES.items():
+        used = USED.get(look, 0)
+        for shape in shapes[used:max(used, SHOWN.get(look, 0))]:
+            shape.visible = False
+    SHOWN.clear()
+    SHOWN.update(USED)
+    USED.clear()
+
+def layer(app, groupName, name, key, build):
+    #shapes that only change with key, the key is values they are built from
+    cached = LAYERS.get(name)
+    if cached is not None and cached[0] == key:
+        return
+    g = GROUPS[groupName]
+    if cached is not None:
+        for shape in cached[1]:
+            g.remove(shape)
+    shapes = build()
+    for shape in shapes:
+        g.add(shape)
+    LAYERS[name] = (key, shapes)
+
+def readySprites(app):
+    #obstacle image -> (path, width, height) of the preloaded sprites, None
+    #until they are all in. cmu_graphics gets their decoded images the first
+    #time, an Image of one of them is then drawn without loading or scaling
+    sprites = app.sprites
+    if sprites is None or not sprites.ready.is_set():
+        return None
+    if SPRITES_GIVEN['sprites'] is not sprites:
+        for path, image in sprites.images.items():
+            shape_logic.activeDrawing.images[shape_logic.hashReference(path)] = image
+        SPRITES_GIVEN['sprites'] = sprites
+    return sprites.sprites
+
+#Frames come between two ticks, app.alpha of the way from the last one to the
+#next. Everything is drawn that far from the tick before the last to the last
+#one: bullets and obstacles fly straight, so that is back along their velocity
+#by (1 - alpha) of a tick, players move on keys and have their last position kept
+
+def drawPlayer(app, player, prev):
+    x, y = player.x, player.y
+    #a teleport is a jump, not a move to draw halfway through
+    if prev is not None and abs(prev[0] - x) + abs(prev[1] - y) < 4*player.r:
+        x, y = prev[0] + (x - prev[0])*app.alpha, prev[1] + (y - prev[1])*app.alpha
+    circle = place(('player', player.r, player.color), Circle, x, y, player.r, fill=rgb(*player.color))
+    circle.centerX, circle.centerY = x, y
+
+def drawBullets(app, bullets):
+    width = app.width
+    back = 1 - app.alpha
+    for b in bullets:
+        x, y = b.x - b.dx*back, b.y - b.dy*back
+        #drawn from x to x + 3r
+        if -3*b.r < x < width:
+            rect = place(('bullet', b.r), Rect, x, y-b.r/2, b.r*3, b.r, fill=yellow)
+            rect.left, rect.top = x, y-b.r/2
+
+def drawObstacles(app, obstacles):
+    width = app.width
+    back = 1 - app.alpha
+    sprites = readySprites(app)
+    for obs in obstacles:
+        x = obs.x + obs.speed*back
+        if obs.img is None or sprites is None:
+            path, w, h = None, 2*obs.r, 2*obs.r
+        else:
+            path, w, h = sprites[obs.img]
+        #skip everything past the edges, what's left of it is not drawn
+        if not (-w/2 < x < width + w/2):
+            continue
+        if path is not None:
+            #made at the size it is drawn at, no width or height to scale it to
+            shape = place(path, Image, path, x, obs.y, align='center')
+        else:
+            #missing images are drawn as circles
+            shape = place(('obstacle', obs.r), Circle, x, obs.y, obs.r, fill=red)
+        shape.centerX, shape.centerY = x, obs.y
+
+def buildHealthBar(app, score, x, y):
+    fillPct = max(1, min(100, score))/100
+    color = green
+    if score < 30: color = red
+    elif score < 60: color = yellow
+
+    return [
+        keep(Rect, x, y, app.barWidth, app.barHeight, fill=None, border=white),
+        keep(Rect, x, y, app.barWidth*fillPct, app.barHeight, fill=color),
+    ]
+
+def drawHud(app, role, player, y):
+    #one player's label, health bar, stars and auto-shoot. Each part is only
+    #rebuilt when what it shows changes, labels are the slow ones
+    labelX = app.width - app.margin - app.barWidth - 20
+    barX = app.width - app.margin - app.barWidth
+    size = (y, app.width, app.height)
+
+    layer(app, 'hud', ('label', role), size,
+          lambda: [keep(Label, f"P{role}", labelX, y + app.barHeight/2, fill=white, size=app.height*0.04)])
+    layer(app, 'hud', ('health', role), size + (player.score,),
+          lambda: buildHealthBar(app, player.score, barX, y))
+    stars = len(player.collectedStars)
+    layer(app, 'hud', ('stars', role), size + (stars,),
+          lambda: [keep(Label, f"Stars: {stars}/5", barX, y + app.barHeight + 15, fill=yellow, size=12, align='left')])
+    layer(app, 'hud', ('autoShoot', role), size + (player.isAutoShoot,),
+          lambda: [keep(Label, "Auto-Shoot ACTIVE!!", barX, y + 50, fill=red, bold=True, align='left')]
+                  if player.isAutoShoot else [])
+
+def buildPopup(app, world):
+    popupW = app.width*0.4
+    popupH = app.height*0.3
+    cx, cy = app.width/2, app.height/2
+
+    shapes = [
+        keep(Rect, 0, 0, app.width, app.height, fill='black', opacity=50),
+        keep(Rect, cx - popupW/2, cy - popupH/2, popupW, popupH, fill=white, border=purple, borderWidth=4),
+    ]
+
+    tSize = int(app.height*0.05)
+    if world.gameOver:
+        shapes.append(keep(Label, "game over ^_^", cx, cy - popupH*0.15, fill=red, size=tSize, bold=True))
+        shapes.append(keep(Label, f"{world.winner} wins!!", cx, cy + popupH*0.15, fill=black, size=tSize*0.8))
+    elif app.myRole is None:
+        shapes.append(keep(Label, "joining match...", cx, cy, size=tSize, bold=True, fill=black))
+    else:
+        shapes.append(keep(Label, "paused...", cx, cy, size=tSize, bold=True, fill=black))
+    return shapes
+
+def drawProfiler(app):
+    #ms per step of every phase over the last second. A new label costs ~10ms
+    #and a new value ~2ms, so the rows are made once and refilled once a second
+    g = group(app, 'profiler')
+    if not PROFILER_LABELS:
+        g.add(keep(Rect, 5, 5, 270, PROFILER_ROWS*14 + 10, fill='black', opacity=70))
+        for i in range(PROFILER_ROWS):
+            label = keep(Label, '', 12, 17 + i*14, fill=white, size=11, align='left')
+            PROFILER_LABELS.append(label)
+            g.add(label)
+    second = int(time.monotonic())
+    if second == PROFILER_SHOWN['second']:
+        return
+    PROFILER_SHOWN['second'] = second
+
+    world = app.world
+    rows = ["ms per frame, last second ('t' saves a trace)",
+            f"bullets {len(world.p1Bullets)} + {len(world.p2Bullets)}, "
+            f"obstacles {len(world.p1Obstacles)} + {len(world.p2Obstacles)}",
+            f"tick {world.counter}, {app.droppedTicks} ticks dropped catching up"]
+    rows += [f"{ms:7.2f}  {name}" for name, ms in app.profiler.summary('onStep')]
+    for label, row in zip(PROFILER_LABELS, rows + ['']*PROFILER_ROWS):
+        if label.value != row:
+            label.value = row
+        label.visible = row != ''
+
+def drawLastFrame(app):
+    #a frame main.py had no time for: the shapes from the last one, unmoved
+    for g in FRAME_GROUPS:
+        app.group.add(g)
+
+def drawFrame(app):
+    #the black background is app.background, cmu_graphics fills it anyway
+    world = app.world
+    timer = app.profiler
+    if timer: timer.begin()
+    FRAME_GROUPS.clear()
+    group(app, 'divider')
+    layer(app, 'divider', 'divider', (world.split, app.width),
+          lambda: [keep(Line, 0, world.split, app.width, world.split, fill=white, lineWidth=3)])
+
+    #draw player 1 and their obstacles
+    group(app, 'entities')
+    drawPlayer(app, world.p1, app.prevPlayers.get(1))
+    drawBullets(app, world.p1Bullets)
+    drawObstacles(app, world.p1Obstacles)
+
+    #draw player 2 and their obstacles
+    drawPlayer(app, world.p2, app.prevPlayers.get(2))
+    drawBullets(app, world.p2Bullets)
+    drawObstacles(app, world.p2Obstacles)
+    hideUnused()
+    if timer: timer.lap('draw: entities')
+
+    group(app, 'hud')
+    drawHud(app, 1, world.p1, app.height*0.05)
+    drawHud(app, 2, world.p2, world.split + app.height*0.05)
+    if timer: timer.lap('draw: hud')
+
+    if app.paused or world.gameOver or app.myRole is None:
+        group(app, 'popup')
+        key = (world.gameOver, world.winner, app.myRole is None, app.width, app.height)
+        layer(app, 'popup', 'popup', key, lambda: buildPopup(app, world))
+        if timer: timer.lap('draw: popup')
+
+    if app.showProfiler:
+        drawProfiler(app)
+        if timer: timer.lap('draw: profiler')
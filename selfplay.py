@@ -0,0 +1,379 @@
+import argparse
+import array
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+from classes import Star, BlackHole
+from engine import World
+
+#balance tuning without a window or a server: scripted bots play whole
+#matches by the engine's rules on a pool of processes, and the stats of
+#every match go to a columnar results file as they come in
+#
+#   python selfplay.py --matches 500 --set attackRate=20,40,80 --out sweep.ufocol
+#   python selfplay.py --read sweep.ufocol
+#
+#A --set is any World attribute (attackRate, blackHoleChance, starChance,
+#shotDamage, obstacleDamage, autoShootSeconds, teleportSeconds, ...), the
+#run plays --matches matches for every combination of them and every
+#pairing of --policies. Match n has seed --seed + n whatever worker plays
+#it, so each parameter set plays the same matches and a run gives the same
+#rows on any number of processes
+
+WIDTH = 800
+HEIGHT = 600
+TICK_RATE = 30
+#a match nobody has lost by then is a draw
+MAX_SECONDS = 300
+#ticks between two shots of a bot, a player mashing a key
+FIRE_INTERVAL = 6
+#matches a worker plays per job, fewer round trips to the pool
+BATCH = 16
+DAMAGE_SOURCES = ('shot', 'shot abroad', 'bullet', 'meteor', 'comet')
+
+#results file: MAGIC, header, row group, row group, ...
+#   header:    HEADER_LENGTH, JSON {'columns': [[name, typecode], ...], 'labels': {name: [text, ...]}}
+#   row group: GROUP_HEADER (rows), then every column's values for those
+#              rows back to back, as the array module packs its typecode, little-endian
+#Reading a column walks the group headers and slices its part out of every
+#group, no other column is touched. A text column holds indexes into its labels
+MAGIC = b'UFOCOL1\n'
+HEADER_LENGTH = struct.Struct('<I')
+GROUP_HEADER = struct.Struct('<I')
+#rows the writer holds before they go to the file, a crash loses at most this
+GROUP_ROWS = 1024
+
+class MatchStats:
+    #what happened to each player, the engine reports damage through hurt,
+    #the rest is looked at after every tick
+    def __init__(self, world):
+        self.world = world
+        self.damageTaken = {role: dict.fromkeys(DAMAGE_SOURCES, 0) for role in (1, 2)}
+        self.teleports = {1: 0, 2: 0}
+        self.autoShootTicks = {1: 0, 2: 0}
+        self.shotsFired = {1: 0, 2: 0}
+        self.wasTeleported = {1: False, 2: False}
+
+    def damage(self, player, source, amount):
+        self.damageTaken[1 if player is self.world.p1 else 2][source] += amount
+
+    def tick(self):
+        for role in (1, 2):
+            player = self.world.player(role)
+            if player.isAutoShoot:
+                self.autoShootTicks[role] += 1
+            if player.isTeleported and not self.wasTeleported[role]:
+                self.teleports[role] += 1
+            self.wasTeleported[role] = player.isTeleported
+
+#bot policies: (world, role, bot) -> (move, fire) for this tick, like the
+#keys a player holds and presses
+
+def universeOf(world, player):
+    return 1 if player.y < world.split else 2
+
+def threatAhead(world, player):
+    #the closest meteor or comet still coming at the player's lane
+    closest = None
+    for obs in world.obstacles(universeOf(world, player)):
+        if isinstance(obs, (Star, BlackHole)) or obs.x + obs.r < player.x - player.r:
+            continue
+        if abs(obs.y - player.y) < player.r + obs.r + world.dy and (closest is None or obs.x < closest.x):
+            closest = obs
+    return closest
+
+def steerTo(world, player, y):
+    if abs(y - player.y) < world.dy/2:
+        return 0
+    return 1 if y > player.y else -1
+
+def dodge(world, player, obs):
+    #away from it, unless that is into the edge of the universe
+    move = 1 if player.y >= obs.y else -1
+    if player.y + move*world.dy < player.minY + player.r or player.y + move*world.dy > player.maxY - player.r:
+        move = -move
+    return move
+
+def idle(world, role, bot):
+    return 0, 0
+
+def randomPolicy(world, role, bot):
+    if bot.rng.random() < 0.1:
+        bot.move = bot.rng.choice((-1, 0, 1))
+    return bot.move, bot.rng.choice((-1, 1)) if bot.rng.random() < 0.1 else 0
+
+def dodger(world, role, bot):
+    #shoots what is coming at it, steps aside if it can't and goes for stars
+    player = world.player(role)
+    threat = threatAhead(world, player)
+    if threat is not None:
+        if threat.x - player.x < 4*player.r:
+            return dodge(world, player, threat), 0
+        return steerTo(world, player, threat.y), 1
+    stars = [obs for obs in world.obstacles(universeOf(world, player))
+             if isinstance(obs, Star) and obs.x > player.x]
+    if stars:
+        return steerTo(world, player, min(stars, key=lambda star: star.x).y), 0
+    return 0, 0
+
+def hunter(world, role, bot):
+    #a dodger that goes through black holes to shoot the enemy from its own universe
+    player = world.player(role)
+    enemy = world.player(3 - role)
+    if player.isTeleported:
+        #the enemy is on the left, at home
+        threat = threatAhead(world, player)
+        if threat is not None and threat.x - player.x < 4*player.r:
+            return dodge(world, player, threat), 0
+        return steerTo(world, player, enemy.y), -1 if abs(enemy.y - player.y) < enemy.r else 0
+    if world.counter >= player.teleportCooldown:
+        holes = [obs for obs in world.obstacles(universeOf(world, player))
+                 if isinstance(obs, BlackHole) and obs.x > player.x]
+        if holes:
+            return steerTo(world, player, min(holes, key=lambda hole: hole.x).y), 0
+    return dodger(world, role, bot)
+
+POLICIES = {'idle': idle, 'random': randomPolicy, 'dodger': dodger, 'hunter': hunter}
+
+class Bot:
+    def __init__(self, policy, rng):
+        self.policy = policy
+        self.rng = rng
+        self.move = 0
+        self.cooldown = 0
+
+    def act(self, world, role):
+        move, fire = self.policy(world, role, self)
+        if self.cooldown > 0:
+            self.cooldown -= 1
+            fire = 0
+        elif fire:
+            self.cooldown = FIRE_INTERVAL
+        return {'move': move, 'fire': fire}
+
+def playMatch(seed, policies, params, maxSeconds):
+    #one match to the end, its row for the results file
+    #obstacles in both universes, the game only throws them at Player 1
+    #and Player 2's bot would have nothing to do
+    world = World(WIDTH, HEIGHT, TICK_RATE, rng=random.Random(seed), spawnRoles=(1, 2))
+    for name, value in params:
+        setattr(world, name, value)
+    stats = world.stats = MatchStats(world)
+    bots = {role: Bot(POLICIES[policy], random.Random(2*seed + role)) for role, policy in zip((1, 2), policies)}
+    maxTicks = int(maxSeconds*TICK_RATE)
+    while not world.gameOver and world.counter < maxTicks:
+        inputs = {role: bot.act(world, role) for role, bot in bots.items()}
+        for role, playerInput in inputs.items():
+            if playerInput['fire']:
+                stats.shotsFired[role] += 1
+        world.step(inputs)
+        stats.tick()
+
+    row = {'seed': seed, 'policy1': policies[0], 'policy2': policies[1], **dict(params),
+           'winner': int(world.winner[-1]) if world.winner else 0, 'seconds': world.counter/TICK_RATE}
+    for role in (1, 2):
+        p = f'p{role}'
+        for source, amount in stats.damageTaken[role].items():
+            row[p + 'Damage' + source.title().replace(' ', '')] = amount
+        row[p + 'Teleports'] = stats.teleports[role]
+        row[p + 'AutoShootSeconds'] = stats.autoShootTicks[role]/TICK_RATE
+        row[p + 'ShotsFired'] = stats.shotsFired[role]
+        row[p + 'Score'] = world.player(role).score
+    return row
+
+def playBatch(job):
+    first, count, policies, params, maxSeconds = job
+    return [playMatch(seed, policies, params, maxSeconds) for seed in range(first, first + count)]
+
+def columnsFor(paramNames):
+    columns = [('seed', 'q'), ('policy1', 'B'), ('policy2', 'B')]
+    columns += [(name, 'd') for name in paramNames]
+    columns += [('winner', 'b'), ('seconds', 'd')]
+    for role in (1, 2):
+        p = f'p{role}'
+        #damage and score are floats once a --set makes shotDamage or obstacleDamage one
+        columns += [(p + 'Damage' + source.title().replace(' ', ''), 'd') for source in DAMAGE_SOURCES]
+        columns += [(p + 'Teleports', 'q'), (p + 'AutoShootSeconds', 'd'), (p + 'ShotsFired', 'q'), (p + 'Score', 'd')]
+    return columns
+
+class ResultsWriter:
+    def __init__(self, path, columns, labels):
+        self.columns = columns
+        self.labels = {name: {text: i for i, text in enumerate(texts)} for name, texts in labels.items()}
+        self.pending = {name: array.array(typecode) for name, typecode in columns}
+        self.rows = 0
+        self.file = open(path, 'wb')
+        header = json.dumps({'columns': columns, 'labels': labels}).encode()
+        self.file.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+
+    def add(self, row):
+        for name, values in self.pending.items():
+            value = row[name]
+            values.append(self.labels[name][value] if name in self.labels else value)
+        self.rows += 1
+        if len(self.pending['seed']) >= GROUP_ROWS:
+            self.flush()
+
+    def flush(self):
+        rows = len(self.pending['seed'])
+        if not rows:
+            return
+        self.file.write(GROUP_HEADER.pack(rows))
+        for name, typecode in self.columns:
+            values = self.pending[name]
+            if sys.byteorder == 'big':
+                values.byteswap()
+            self.file.write(values.tobytes())
+            self.pending[name] = array.array(typecode)
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+class Results:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a self-play results file")
+        offset = len(MAGIC)
+        length, = HEADER_LENGTH.unpack_from(self.map, offset)
+        offset += HEADER_LENGTH.size
+        header = json.loads(self.map[offset:offset + length])
+        offset += length
+        self.columns = [(name, typecode) for name, typecode in header['columns']]
+        self.labels = header['labels']
+        rowSize = sum(array.array(typecode).itemsize for name, typecode in self.columns)
+        #(rows, offset of its first column) of every group, a group cut
+        #short by a crash ends the index
+        self.groups = []
+        size = len(self.map)
+        while offset + GROUP_HEADER.size <= size:
+            rows, = GROUP_HEADER.unpack_from(self.map, offset)
+            offset += GROUP_HEADER.size
+            if offset + rows*rowSize > size:
+                break
+            self.groups.append((rows, offset))
+            offset += rows*rowSize
+
+    def __len__(self):
+        return sum(rows for rows, offset in self.groups)
+
+    def column(self, name):
+        #every value of one column, labels as their text
+        typecode = dict(self.columns)[name]
+        values = array.array(typecode)
+        for rows, offset in self.groups:
+            for other, otherType in self.columns:
+                size = rows*array.array(otherType).itemsize
+                if other == name:
+                    values.frombytes(self.map[offset:offset + size])
+                    break
+                offset += size
+        if sys.byteorder == 'big':
+            values.byteswap()
+        if name in self.labels:
+            return [self.labels[name][value] for value in values]
+        return values
+
+    def close(self):
+        self.map.close()
+
+def parseSet(text):
+    #"attackRate=20,40,80" -> ('attackRate', [20, 40, 80])
+    name, _, values = text.partition('=')
+    if not hasattr(World(WIDTH, HEIGHT), name) or not values:
+        raise argparse.ArgumentTypeError(f"{text}: expected <World attribute>=<value>,<value>...")
+    try:
+        values = [float(value) if '.' in value else int(value) for value in values.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text}: values have to be numbers")
+    for value in values:
+        #a tick with it here, not a crash in a worker halfway through the
+        #results file (attackRate goes to randint, which takes no floats)
+        world = World(WIDTH, HEIGHT, TICK_RATE, spawnRoles=(1, 2))
+        setattr(world, name, value)
+        try:
+            world.step()
+        except (TypeError, ValueError) as e:
+            raise argparse.ArgumentTypeError(f"{name}={value}: {e}")
+    return name, values
+
+def summarize(path):
+    results = Results(path)
+    paramNames = [name for name, typecode in results.columns[3:results.columns.index(('winner', 'b'))]]
+    keys = ['policy1', 'policy2'] + paramNames
+    columns = {name: results.column(name) for name in keys + ['winner', 'seconds', 'p1Teleports', 'p2Teleports',
+                                                                 'p1AutoShootSeconds', 'p2AutoShootSeconds']}
+    damage = [name for name, typecode in results.columns if 'Damage' in name]
+    columns.update({name: results.column(name) for name in damage})
+    groups = {}
+    for i in range(len(results)):
+        groups.setdefault(tuple(columns[name][i] for name in keys), []).append(i)
+
+    print(f"{path}: {len(results)} matches")
+    for key, rows in sorted(groups.items()):
+        def mean(name):
+            return sum(columns[name][i] for i in rows)/len(rows)
+        wins = [sum(1 for i in rows if columns['winner'][i] == w)/len(rows)*100 for w in (1, 2, 0)]
+        print(', '.join(f"{name}={value}" for name, value in zip(keys, key)) + f": {len(rows)} matches")
+        print(f"  wins p1 {wins[0]:.0f}% p2 {wins[1]:.0f}% draws {wins[2]:.0f}%, {mean('seconds'):.1f} s a match")
+        for role in (1, 2):
+            p = f'p{role}'
+            taken = ', '.join(f"{name[len(p) + 6:]} {mean(name):.0f}" for name in damage if name.startswith(p))
+            print(f"  {p}: damage {taken}; {mean(p + 'Teleports'):.1f} teleports, "
+                  f"auto-shoot {mean(p + 'AutoShootSeconds')/mean('seconds')*100:.0f}% of the match")
+    results.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="headless self-play for balance tuning")
+    parser.add_argument('--matches', type=int, default=200, help="matches per parameter set and pairing")
+    parser.add_argument('--policies', default='dodger,hunter',
+                        help=f"bots that play each other in every pairing, of {', '.join(POLICIES)}")
+    parser.add_argument('--set', dest='sets', action='append', type=parseSet, default=[],
+                        help="a World attribute and the values to try, e.g. attackRate=20,40,80")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first match")
+    parser.add_argument('--max-seconds', dest='maxSeconds', type=float, default=MAX_SECONDS,
+                        help="match length after which it is a draw")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="processes playing matches")
+    parser.add_argument('--out', default='selfplay.ufocol', help="results file")
+    parser.add_argument('--read', help="summarize a results file instead of playing")
+    config = parser.parse_args()
+    if config.read:
+        summarize(config.read)
+        return
+
+    policies = config.policies.split(',')
+    unknown = [policy for policy in policies if policy not in POLICIES]
+    if unknown:
+        parser.error(f"unknown policies {', '.join(unknown)}")
+    paramNames = [name for name, values in config.sets]
+    jobs = [(config.seed + first, min(BATCH, config.matches - first), pairing, tuple(zip(paramNames, params)),
+             config.maxSeconds)
+            for params in itertools.product(*(values for name, values in config.sets))
+            for pairing in itertools.product(policies, repeat=2)
+            for first in range(0, config.matches, BATCH)]
+
+    writer = ResultsWriter(config.out, columnsFor(paramNames), {'policy1': policies, 'policy2': policies})
+    start = time.perf_counter()
+    played = 0
+    with multiprocessing.Pool(config.workers) as pool:
+        for rows in pool.imap_unordered(playBatch, jobs):
+            for row in rows:
+                writer.add(row)
+                played += row['seconds']
+    writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"{writer.rows} matches on {config.workers} workers in {elapsed:.1f} s: "
+          f"{writer.rows/elapsed:.1f} matches/s, {played/elapsed:.0f} game seconds a second")
+    summarize(config.out)
+
+if __name__ == '__main__':
+    main()
@@ -1,39 +1,809 @@
 import asyncio
 import websockets
 import os
+import json
+import time
+import uuid
+import zlib
+import collections
+import http
+import protocol
+import lockstep
+import metrics
+import recording
+from engine import makeWorld
+from websockets.asyncio.server import ServerConnection
 
 CONNECTED_CLIENTS = set()
 
+#max frames waiting for one client, a stalled reader never holds more than this
+OUTBOX_SIZE = int(os.environ.get("OUTBOX_SIZE", 32))
+#seconds between relay stats lines in the log
+STATS_INTERVAL = int(os.environ.get("STATS_INTERVAL", 60))
+
+#authoritative mode: the server runs every match's world and clients only send inputs
+AUTHORITATIVE = os.environ.get("AUTHORITATIVE", "0") == "1"
+#simulation ticks per second, shared by every match on this server
+TICK_RATE = int(os.environ.get("TICK_RATE", 30))
+#share of a tick that stepping matches may take, the rest is left for I/O
+TICK_BUDGET = float(os.environ.get("TICK_BUDGET", 0.8))
+#world size the server simulates in, same as the client window
+WORLD_WIDTH = 800
+WORLD_HEIGHT = 600
+#fire presses a client can have waiting for the next ticks
+MAX_QUEUED_SHOTS = 8
+#"numpy" keeps bullets and obstacles in arrays (needs numpy), "objects" doesn't
+WORLD_BACKEND = os.environ.get("WORLD_BACKEND", "objects")
+#lockstep mode: both clients run the world from the same seed and the server
+#only relays their inputs. Ignored when AUTHORITATIVE is on
+LOCKSTEP = os.environ.get("LOCKSTEP", "0") == "1" and not AUTHORITATIVE
+
+#processes serving matches, more than one starts the supervisor in
+#supervisor.py that hands every match to one of them
+WORKERS = int(os.environ.get("WORKERS", 1))
+#which of them this process is, supervisor.runWorker sets it
+WORKER_INDEX = 0
+#messages a second a spectator gets, each one has the match's frames since
+#the last one (recording.unpack reads them), snapshots a newer one replaced left out
+SPECTATOR_RATE = float(os.environ.get("SPECTATOR_RATE", 10))
+#bytes a spectator can have waiting to be written before it is dropped
+SPECTATOR_BUFFER = int(os.environ.get("SPECTATOR_BUFFER", 1 << 20))
+#directory every match's message stream is recorded to (recording.py), off when unset
+RECORD_DIR = os.environ.get("RECORD_DIR")
+#what one client may send, as token buckets: RATE_MESSAGES messages and
+#RATE_BYTES bytes a second, with RATE_BURST seconds of either saved up. A
+#client sends at most 20 snapshots a second, or 30 lockstep inputs and their
+#checksums, see Throttle for what happens over the limit
+RATE_MESSAGES = float(os.environ.get("RATE_MESSAGES", 60))
+RATE_BYTES = float(os.environ.get("RATE_BYTES", 65536))
+RATE_BURST = 2
+#largest message a client may send, the connection is closed with 1009 on a
+#bigger one. A snapshot with 200 bullets is 6 KB as JSON
+MAX_FRAME = int(os.environ.get("MAX_FRAME", 16384))
+#seconds a player whose connection dropped keeps their seat, they get it back
+#with the session token from 'joined'. 0 gives it up right away like a leave
+RESUME_GRACE = float(os.environ.get("RESUME_GRACE", 15))
+#lockstep records of each player kept for spectators and resumes, they are
+#never self-contained so there is no point to cut the history at. A side can't
+#run more than a couple of INPUT_DELAYs ahead of the other's inputs, so what
+#a resuming client is missing is always among the last few
+LOCKSTEP_HISTORY = 4*lockstep.CHECKSUM_INTERVAL
+#seconds between two looks at how late the event loop runs
+LOOP_LAG_INTERVAL = 0.1
+
+#relay counters, summed over every connection
+STATS = {
+    'dropped': 0, #frames thrown away because an outbox was full
+    'coalesced': 0, #snapshots replaced by a newer one before they were sent
+    'maxQueueDepth': 0, #highest number of frames ever waiting for one client
+    'connections': 0, #ever accepted
+    'messagesIn': 0,
+    'bytesIn': 0,
+    'messagesOut': 0,
+    'bytesOut': 0,
+    'spectatorsDropped': 0, #spectators that fell SPECTATOR_BUFFER behind
+    'resumes': 0, #players back on their seat after a dropped connection
+    'seatsExpired': 0, #held seats nobody came back to within RESUME_GRACE
+    'throttledClients': 0, #connections that went over the rate limit
+    'throttledCoalesced': 0, #position updates over the limit replaced by a newer one
+    'throttledDropped': 0, #other messages over the limit
+    'oversized': 0, #connections closed for a message over MAX_FRAME
+}
+#seconds from Outbox.put until the frame was written to the client
+FANOUT_LATENCY = metrics.Histogram()
+#seconds the event loop got to a timer later than asked, everything else
+#waits that long too
+LOOP_LAG = metrics.Histogram()
+
+#scheduler counters for authoritative mode
+TICK_STATS = {
+    'ticks': 0,
+    'missedTicks': 0, #ticks skipped because the loop fell behind
+    'overBudget': 0, #ticks where stepping ran out of budget
+    'deferred': 0, #match steps pushed to a later tick by the budget
+    'lastTickMs': 0.0,
+    'maxTickMs': 0.0,
+}
+
+#match id -> Match, every match holds at most two players
+MATCHES = {}
+#session token -> (match, role) of every seat, whether its player is connected or not
+SESSIONS = {}
+#the role a spectator has in the handler
+SPECTATOR = 0
+#quick match room that is still waiting for its second player
+WAITING_MATCH = None
+
+class Outbox:
+    #per-client send queue drained by its own writer task, so a slow receiver
+    #only delays itself and never the sender's input loop
+    def __init__(self, websocket, maxSize=OUTBOX_SIZE):
+        self.websocket = websocket
+        self.maxSize = maxSize
+        self.queue = collections.deque() #(key, message, time it was put, droppable)
+        self.ready = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def put(self, message, key=None, supersedes=True, droppable=True):
+        #messages with a key come from one sender, a self-contained snapshot
+        #makes everything still pending from that sender useless. A lost
+        #lockstep input would stall the match for good, those are never
+        #dropped; the sender can't get more than the input delay ahead of a
+        #stalled reader anyway, so the queue stays short
+        if key is not None and supersedes:
+            pending = len(self.queue)
+            self.queue = collections.deque(item for item in self.queue if item[0] != key)
+            STATS['coalesced'] += pending - len(self.queue)
+
+        if droppable and len(self.queue) >= self.maxSize:
+            #the oldest frame that may go, or this one if none of them may
+            STATS['dropped'] += 1
+            oldest = next((i for i, item in enumerate(self.queue) if item[3]), None)
+            if oldest is None:
+                return
+            del self.queue[oldest]
+        self.queue.append((key, message, time.monotonic(), droppable))
+        STATS['maxQueueDepth'] = max(STATS['maxQueueDepth'], len(self.queue))
+        self.ready.set()
+
+    async def run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                while self.queue:
+                    key, message, queuedAt, droppable = self.queue.popleft()
+                    await self.websocket.send(message)
+                    #JSON is ascii, so len is the byte count for both kinds
+                    STATS['messagesOut'] += 1
+                    STATS['bytesOut'] += len(message)
+                    FANOUT_LATENCY.observe(time.monotonic() - queuedAt)
+                self.ready.clear()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+def frameSize(message):
+    #bytes on the wire, a text frame goes as UTF-8
+    return len(message.encode()) if isinstance(message, str) else len(message)
+
+class Throttle:
+    #the rate limit on what one client sends. A position update over the
+    #limit is coalesced: only the newest one is held and it is passed on as
+    #soon as the buckets allow. Anything else over the limit is dropped, a
+    #client that keeps to the protocol never gets there
+    def __init__(self, forward, name):
+        self.forward = forward
+        self.name = name
+        self.messages = RATE_MESSAGES*RATE_BURST
+        self.bytes = RATE_BYTES*RATE_BURST
+        self.last = time.monotonic()
+        self.held = None
+        self.timer = None
+        self.throttled = False
+
+    def take(self, size):
+        now = time.monotonic()
+        elapsed, self.last = now - self.last, now
+        self.messages = min(RATE_MESSAGES*RATE_BURST, self.messages + elapsed*RATE_MESSAGES)
+        self.bytes = min(RATE_BYTES*RATE_BURST, self.bytes + elapsed*RATE_BYTES)
+        if self.messages < 1 or self.bytes < size:
+            return False
+        self.messages -= 1
+        self.bytes -= size
+        return True
+
+    def admit(self, message):
+        #True if message can be passed on now
+        position = protocol.isPositionUpdate(message)
+        if self.take(frameSize(message)):
+            if position and self.held is not None:
+                #newer than the one held back
+                self.held = None
+                STATS['throttledCoalesced'] += 1
+            return True
+        if not self.throttled:
+            self.throttled = True
+            STATS['throttledClients'] += 1
+            print(f"WARNING: {self.name} is over the rate limit")
+        if not position:
+            STATS['throttledDropped'] += 1
+            return False
+        if self.held is not None:
+            STATS['throttledCoalesced'] += 1
+        self.held = message
+        if self.timer is None:
+            self.schedule()
+        return False
+
+    def schedule(self):
+        wait = max((1 - self.messages)/RATE_MESSAGES, (frameSize(self.held) - self.bytes)/RATE_BYTES, 0)
+        self.timer = asyncio.get_running_loop().call_later(wait, self.release)
+
+    def release(self):
+        self.timer = None
+        if self.held is None:
+            return
+        if not self.take(frameSize(self.held)):
+            self.schedule()
+            return
+        message, self.held = self.held, None
+        self.forward(message)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+
+class Audience:
+    #a match's spectators and recording. Every frame is packed once as a
+    #recording.py record; a flush joins the pending ones into one message and
+    #hands that same object to every spectator, websockets connections get it
+    #through websockets.broadcast with no task or await per spectator. Other
+    #connections (asgi.py) go through their Outbox
+    def __init__(self):
+        self.direct = set()
+        self.outboxes = {} #websocket -> Outbox
+        self.pending = [] #(key, record) since the last flush
+        #key -> the record of its last self-contained frame and everything
+        #since, what a spectator joining now needs before the next flush. Of
+        #lockstep frames only the last LOCKSTEP_HISTORY
+        self.history = {}
+        self.recorder = None
+        self.start = time.monotonic()
+
+    def __len__(self):
+        return len(self.direct) + len(self.outboxes)
+
+    def add(self, frame, key=None, selfContained=False):
+        #key is the sender's role, 0 for the server's world frames and None
+        #for control messages
+        record = recording.pack(frame, key or 0, int((time.monotonic() - self.start)*1000))
+        if self.recorder is not None:
+            self.recorder.add(record)
+        if key is not None:
+            if selfContained:
+                self.history[key] = [record]
+            elif protocol.isLockstep(frame):
+                self.history.setdefault(key, collections.deque(maxlen=LOCKSTEP_HISTORY)).append(record)
+            else:
+                self.history.setdefault(key, []).append(record)
+        if not self:
+            return
+        if selfContained:
+            self.pending = [item for item in self.pending if item[0] != key]
+        self.pending.append((key, record))
+
+    def send(self, frame, direct, outboxes):
+        websockets.broadcast(direct, frame)
+        STATS['messagesOut'] += len(direct)
+        STATS['bytesOut'] += frameSize(frame)*len(direct)
+        for outbox in outboxes:
+            outbox.put(frame, droppable=False)
+
+    def addViewer(self, websocket, outbox, welcome):
+        if isinstance(websocket, ServerConnection):
+            self.direct.add(websocket)
+            direct, outboxes = [websocket], []
+        else:
+            self.outboxes[websocket] = outbox
+            direct, outboxes = [], [outbox]
+        self.send(welcome, direct, outboxes)
+        if self.history:
+            self.send(b''.join(record for records in self.history.values() for record in records), direct, outboxes)
+
+    def latest(self, key):
+        #the frames of key a spectator joining now would get, as the
+        #websocket gave them: a resuming player's cache of the other side
+        return [frame if isinstance(frame, str) else bytes(frame)
+                for _, _, frame in recording.unpack(b''.join(self.history.get(key, ())))]
+
+    def removeViewer(self, websocket):
+        self.direct.discard(websocket)
+        self.outboxes.pop(websocket, None)
+
+    def flush(self):
+        for websocket in [websocket for websocket in self.direct
+                          if websocket.transport.get_write_buffer_size() > SPECTATOR_BUFFER]:
+            #it won't catch up with deltas it never got, it can join again
+            self.direct.discard(websocket)
+            websocket.transport.abort()
+            STATS['spectatorsDropped'] += 1
+        for websocket, outbox in list(self.outboxes.items()):
+            if len(outbox.queue) > OUTBOX_SIZE:
+                del self.outboxes[websocket]
+                outbox.stop()
+                asyncio.create_task(websocket.close(1008, "too slow"))
+                STATS['spectatorsDropped'] += 1
+
+        batch = b''.join(record for key, record in self.pending)
+        self.pending = []
+        self.send(batch, list(self.direct), list(self.outboxes.values()))
+
+    def restart(self, matchId):
+        #a new game in the match, the clock, history and recording start over
+        self.stopRecording()
+        self.history = {}
+        self.start = time.monotonic()
+        if RECORD_DIR is not None:
+            os.makedirs(RECORD_DIR, exist_ok=True)
+            path = os.path.join(RECORD_DIR, f"{matchId}-{time.strftime('%Y%m%d-%H%M%S')}.uforec")
+            self.recorder = recording.Recorder(path)
+
+    def stopRecording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def close(self):
+        #the match is gone, whatever is pending goes out and the spectators with it
+        self.stopRecording()
+        if self.pending:
+            self.flush()
+        for websocket in list(self.direct) + list(self.outboxes):
+            asyncio.create_task(websocket.close(1000, "match over"))
+        self.direct.clear()
+        self.outboxes.clear()
+
+class Match:
+    def __init__(self, matchId):
+        self.matchId = matchId
+        self.clients = {} #role -> Outbox, of the players connected now
+        self.protocols = {} #role -> protocol versions that client speaks
+        self.sessions = {} #role -> session token, a seat is taken until it is given up
+        self.away = {} #role -> timer that gives the seat up, while its player is gone
+        self.protocol = protocol.PROTOCOL_JSON
+        #authoritative mode only, the world we simulate and the inputs for it
+        self.world = None
+        self.moves = {1: 0, 2: 0}
+        self.shots = {1: collections.deque(maxlen=MAX_QUEUED_SHOTS), 2: collections.deque(maxlen=MAX_QUEUED_SHOTS)}
+        self.sentGameOver = False
+        self.audience = Audience()
+
+    def isFull(self):
+        return len(self.sessions) >= 2
+
+    def addClient(self, outbox, protocols):
+        role = 1 if 1 not in self.sessions else 2
+        self.clients[role] = outbox
+        self.protocols[role] = protocols
+        self.sessions[role] = uuid.uuid4().hex
+        SESSIONS[self.sessions[role]] = (self, role)
+        return role
+
+    def negotiateProtocol(self):
+        return protocol.negotiateProtocol(self.protocols[1], self.protocols[2])
+
+    def opponentOf(self, role):
+        return self.clients.get(3 - role)
+
+    def startMessage(self, kind='start', **extra):
+        return json.dumps({'type': kind, 'match': self.matchId, 'protocol': self.protocol,
+                           'authoritative': AUTHORITATIVE, 'lockstep': LOCKSTEP,
+                           'seed': lockstep.seedFor(self.matchId), **extra})
+
+    def startWorld(self):
+        self.world = makeWorld(WORLD_WIDTH, WORLD_HEIGHT, TICK_RATE, backend=WORLD_BACKEND)
+        self.moves = {1: 0, 2: 0}
+        for shots in self.shots.values():
+            shots.clear()
+        self.sentGameOver = False
+
+    def receiveInput(self, role, message):
+        playerInput = protocol.decodeInput(message)
+        if playerInput is None:
+            return
+        move, fire = playerInput
+        #movement is held until the client says otherwise, shots are queued
+        self.moves[role] = move
+        if fire:
+            self.shots[role].append(fire)
+
+    def takeInputs(self):
+        inputs = {}
+        for role in (1, 2):
+            shots = self.shots[role]
+            inputs[role] = {'move': self.moves[role], 'fire': shots.popleft() if shots else 0}
+        return inputs
+
+def workerFor(matchId, workers):
+    #the same on every process, unlike hash() on a str
+    return zlib.crc32(matchId.encode()) % workers
+
+def quickMatchId():
+    #one the supervisor routes back to this worker, so whoever comes later
+    #with ?match=<id> (a spectator, a resume) finds the match
+    while True:
+        matchId = uuid.uuid4().hex[:8]
+        if workerFor(matchId, WORKERS) == WORKER_INDEX:
+            return matchId
+
+def joinMatch(matchId):
+    global WAITING_MATCH
+    if matchId is None:
+        #quick match: pair with whoever is waiting, otherwise open a new room
+        if WAITING_MATCH is None or WAITING_MATCH.isFull():
+            WAITING_MATCH = Match(quickMatchId())
+            MATCHES[WAITING_MATCH.matchId] = WAITING_MATCH
+        match = WAITING_MATCH
+    else:
+        match = MATCHES.get(matchId)
+        if match is None:
+            match = Match(matchId)
+            MATCHES[matchId] = match
+        elif match.isFull():
+            return None
+    return match
+
+def leaveMatch(match, role):
+    global WAITING_MATCH
+    match.clients.pop(role, None)
+    del match.protocols[role]
+    del SESSIONS[match.sessions.pop(role)]
+    away = match.away.pop(role, None)
+    if away is not None:
+        away.cancel()
+    match.world = None
+    match.audience.stopRecording()
+    if match is WAITING_MATCH:
+        WAITING_MATCH = None
+    if not match.sessions:
+        #room teardown once nobody is left in it
+        del MATCHES[match.matchId]
+        match.audience.close()
+
+def tellOpponent(match, role, message):
+    #a match event for the other player and the spectators
+    message = json.dumps(message)
+    match.audience.add(message)
+    opponent = match.opponentOf(role)
+    if opponent is not None:
+        opponent.put(message)
+
+def giveUpSeat(match, role):
+    tellOpponent(match, role, {'type': 'opponent_left', 'match': match.matchId})
+    leaveMatch(match, role)
+
+def holdSeat(match, role):
+    #the match goes on without them, what they miss is in the audience history
+    del match.clients[role]
+    match.moves[role] = 0
+    match.away[role] = asyncio.get_running_loop().call_later(RESUME_GRACE, expireSeat, match, role)
+    tellOpponent(match, role, {'type': 'opponent_away', 'match': match.matchId, 'seconds': RESUME_GRACE})
+
+def expireSeat(match, role):
+    del match.away[role]
+    STATS['seatsExpired'] += 1
+    giveUpSeat(match, role)
+
+def lockstepInputs(frames):
+    #(tick, frame) of every lockstep input among frames
+    for frame in frames:
+        data = protocol.decodeMessage(frame, WORLD_WIDTH, WORLD_HEIGHT)
+        if data is not None and data.get('type') == 'lockstep':
+            yield data['tick'], frame
+
+def resumeMatch(match, role, outbox, tick):
+    #the player is back on their seat and gets what they need to carry on
+    #right away, without waiting for the opponent's next frame: the latest
+    #world in authoritative mode, the opponent's last self-contained snapshot
+    #and the deltas since in relay mode, and in lockstep mode the opponent's
+    #inputs from the tick they are at plus the last of theirs we got, so they
+    #can send the ones lost with the connection again
+    away = match.away.pop(role, None)
+    if away is not None:
+        away.cancel()
+    old = match.clients.get(role)
+    if old is not None:
+        #back before the old connection was noticed to be dead
+        old.stop()
+        asyncio.create_task(old.websocket.close(1000, "resumed"))
+    match.clients[role] = outbox
+    STATS['resumes'] += 1
+
+    opponent = 3 - role
+    key = 0 if AUTHORITATIVE else opponent
+    lastInputTick = None
+    if LOCKSTEP:
+        for inputTick, frame in lockstepInputs(match.audience.latest(role)):
+            lastInputTick = inputTick
+        frames = [frame for inputTick, frame in lockstepInputs(match.audience.latest(opponent))
+                  if tick is None or inputTick >= tick]
+    else:
+        frames = match.audience.latest(key)
+    outbox.put(match.startMessage('resumed', role=role, lastInputTick=lastInputTick))
+    for frame in frames:
+        outbox.put(frame, key=key, supersedes=protocol.isSelfContained(frame), droppable=False)
+    if away is not None:
+        tellOpponent(match, role, {'type': 'opponent_back', 'match': match.matchId})
+
+def relay(match, role, message):
+    #the server runs this match, so the client only sends inputs
+    if match.world is not None:
+        match.receiveInput(role, message)
+        return
+
+    #only the opponent in the same room gets our messages
+    opponent = match.opponentOf(role)
+    selfContained = protocol.isSelfContained(message)
+    if opponent is not None:
+        #deltas must all arrive, only a full snapshot makes older frames useless
+        opponent.put(message, key=role, supersedes=selfContained,
+                     droppable=not protocol.isLockstep(message))
+    match.audience.add(message, role, selfContained)
+
+async def handshake(websocket, outbox):
+    #first message must be {'type': 'join', 'match': <id or None>},
+    #{'type': 'resume', 'session': <token>, 'tick': <lockstep tick or None>}
+    #to get a seat back, or {'type': 'spectate', 'match': <id>} to watch one
+    try:
+        request = json.loads(await websocket.recv())
+    except ValueError:
+        return None, None
+    if not isinstance(request, dict) or request.get('type') not in ('join', 'resume', 'spectate'):
+        return None, None
+
+    if request['type'] == 'resume':
+        seat = SESSIONS.get(request.get('session'))
+        if seat is None:
+            await websocket.send(json.dumps({'type': 'error', 'reason': 'session expired'}))
+            return None, None
+        match, role = seat
+        tick = request.get('tick')
+        resumeMatch(match, role, outbox, tick if isinstance(tick, int) else None)
+        return match, role
+
+    if request['type'] == 'spectate':
+        match = MATCHES.get(str(request.get('match')))
+        if match is None:
+            await websocket.send(json.dumps({'type': 'error', 'reason': 'no such match'}))
+            return None, None
+        #a match that hasn't started yet sends 'start' when it does
+        match.audience.addViewer(websocket, outbox, match.startMessage('spectating'))
+        return match, SPECTATOR
+
+    #clients that predate the binary format don't send a list. Checked before
+    #the seat is taken, negotiateProtocol can't fail on it after
+    protocols = request.get('protocols')
+    if not isinstance(protocols, list) or not protocols or any(type(p) is not int for p in protocols):
+        protocols = [protocol.PROTOCOL_JSON]
+    matchId = request.get('match')
+    match = joinMatch(str(matchId) if matchId is not None else None)
+    if match is None:
+        await websocket.send(json.dumps({'type': 'error', 'reason': 'match is full'}))
+        return None, None
+
+    role = match.addClient(outbox, protocols)
+    outbox.put(json.dumps({'type': 'joined', 'match': match.matchId, 'role': role,
+                           'session': match.sessions[role]}))
+    if match.isFull():
+        match.protocol = match.negotiateProtocol()
+        if AUTHORITATIVE:
+            match.startWorld()
+        start = match.startMessage()
+        match.audience.restart(match.matchId)
+        match.audience.add(start)
+        for client in match.clients.values():
+            client.put(start)
+    return match, role
+
 async def handler(websocket):
     CONNECTED_CLIENTS.add(websocket)
+    STATS['connections'] += 1
     print(f"INFO: Client connected. Total: {len(CONNECTED_CLIENTS)}")
-    
+
+    outbox = Outbox(websocket)
+    outbox.start()
+    match, role = None, None
+    throttle = None
+    dropped = False
     try:
+        match, role = await handshake(websocket, outbox)
+        if match is None:
+            return
+        if role == SPECTATOR:
+            print(f"INFO: Client is watching match {match.matchId}. Spectators: {len(match.audience)}")
+            #nothing a spectator sends matters, this only waits for it to leave
+            async for message in websocket:
+                pass
+            return
+        print(f"INFO: Client joined match {match.matchId} as Player {role}. Matches: {len(MATCHES)}")
+
+        throttle = Throttle(lambda message: relay(match, role, message),
+                            f"Player {role} of match {match.matchId}")
         async for message in websocket:
-            if CONNECTED_CLIENTS:
-                tasks = [
-                    asyncio.create_task(client.send(message))
-                    for client in CONNECTED_CLIENTS
-                    if client != websocket
-                ]
-                await asyncio.wait(tasks) 
-                
+            STATS['messagesIn'] += 1
+            size = frameSize(message)
+            STATS['bytesIn'] += size
+            if size > MAX_FRAME:
+                #websockets closes the connection on these itself, asgi.py gets here
+                STATS['oversized'] += 1
+                await websocket.close(1009, "message too big")
+                break
+            if throttle.admit(message):
+                relay(match, role, message)
+
     except websockets.exceptions.ConnectionClosedOK:
-        pass 
+        pass
+    except websockets.exceptions.ConnectionClosedError as e:
+        if e.sent is not None and e.sent.code == 1009:
+            #websockets closed it for a message over MAX_FRAME
+            STATS['oversized'] += 1
+        else:
+            #gone without a close, most likely the network and not the player
+            dropped = True
     except Exception as e:
         print(f"ERROR: Error in handler for a client: {e}")
     finally:
         CONNECTED_CLIENTS.remove(websocket)
+        outbox.stop()
+        if throttle is not None:
+            throttle.stop()
+        if match is not None and role == SPECTATOR:
+            match.audience.removeViewer(websocket)
+        elif match is not None and match.clients.get(role) is outbox:
+            #a started match keeps a dropped player's seat for a while
+            if dropped and RESUME_GRACE > 0 and match.isFull():
+                holdSeat(match, role)
+            else:
+                giveUpSeat(match, role)
         print(f"INFO: Client disconnected. Total: {len(CONNECTED_CLIENTS)}")
 
+def queueDepth():
+    return sum(len(client.queue) for match in MATCHES.values() for client in match.clients.values())
+
+def stepMatches(matches, cursor, start, budget, loop):
+    #steps matches round robin from cursor until the budget is used up, the
+    #ones left over go first next tick so none of them starves
+    frames = []
+    for i in range(len(matches)):
+        match = matches[(cursor + i) % len(matches)]
+        world = match.world
+        if world.gameOver and match.sentGameOver:
+            continue
+        world.step(match.takeInputs())
+        match.sentGameOver = world.gameOver
+        #encoded once, the same frame goes to both players
+        frames.append((match, protocol.encodeWorld(match.protocol, world)))
+        if loop.time() - start > budget:
+            TICK_STATS['overBudget'] += 1
+            TICK_STATS['deferred'] += len(matches) - i - 1
+            return frames, (cursor + i + 1) % len(matches)
+    return frames, cursor
+
+async def runTicks():
+    loop = asyncio.get_running_loop()
+    period = 1/TICK_RATE
+    budget = period*TICK_BUDGET
+    nextTick = loop.time()
+    cursor = 0
+    while True:
+        start = loop.time()
+        matches = [match for match in MATCHES.values() if match.world is not None]
+        frames, cursor = stepMatches(matches, cursor, start, budget, loop)
+
+        #one flush per tick: every frame is handed to the writers together
+        for match, frame in frames:
+            for outbox in match.clients.values():
+                outbox.put(frame, key=0)
+            match.audience.add(frame, 0, True)
+
+        tickMs = (loop.time() - start)*1000
+        TICK_STATS['ticks'] += 1
+        TICK_STATS['lastTickMs'] = tickMs
+        TICK_STATS['maxTickMs'] = max(TICK_STATS['maxTickMs'], tickMs)
+
+        nextTick += period
+        delay = nextTick - loop.time()
+        if delay < 0:
+            #fell behind, skip the ticks we missed instead of bursting to catch up
+            missed = int(-delay/period) + 1
+            TICK_STATS['missedTicks'] += missed
+            nextTick += missed*period
+            delay = nextTick - loop.time()
+        await asyncio.sleep(delay)
+
+async def runSpectators():
+    #one flush per match every 1/SPECTATOR_RATE, however many are watching
+    while True:
+        await asyncio.sleep(1/SPECTATOR_RATE)
+        for match in list(MATCHES.values()):
+            if match.audience.pending:
+                match.audience.flush()
+
+async def reportStats():
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        print(f"INFO: Relay stats: queued={queueDepth()} maxQueueDepth={STATS['maxQueueDepth']} "
+              f"coalesced={STATS['coalesced']} dropped={STATS['dropped']}")
+        if AUTHORITATIVE:
+            running = sum(1 for match in MATCHES.values() if match.world is not None)
+            print(f"INFO: Tick stats: matches={running} ticks={TICK_STATS['ticks']} "
+                  f"missed={TICK_STATS['missedTicks']} overBudget={TICK_STATS['overBudget']} "
+                  f"deferred={TICK_STATS['deferred']} lastTickMs={TICK_STATS['lastTickMs']:.2f} "
+                  f"maxTickMs={TICK_STATS['maxTickMs']:.2f}")
+
+async def watchLoopLag():
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        LOOP_LAG.observe(max(0.0, loop.time() - start - LOOP_LAG_INTERVAL))
+
+def metricsText():
+    return metrics.render([
+        ('ufo_connections', 'gauge', "Clients connected now", len(CONNECTED_CLIENTS)),
+        ('ufo_connections_total', 'counter', "Clients ever connected", STATS['connections']),
+        ('ufo_matches', 'gauge', "Open matches", len(MATCHES)),
+        ('ufo_spectators', 'gauge', "Spectators watching now", sum(len(match.audience) for match in MATCHES.values())),
+        ('ufo_spectators_dropped_total', 'counter', "Spectators dropped for falling behind", STATS['spectatorsDropped']),
+        ('ufo_players_away', 'gauge', "Players whose seat is held after a dropped connection",
+         sum(len(match.away) for match in MATCHES.values())),
+        ('ufo_resumes_total', 'counter', "Players back on their seat after a dropped connection", STATS['resumes']),
+        ('ufo_seats_expired_total', 'counter', "Held seats nobody came back to", STATS['seatsExpired']),
+        ('ufo_throttled_clients_total', 'counter', "Connections that went over the rate limit",
+         STATS['throttledClients']),
+        ('ufo_throttled_coalesced_total', 'counter', "Position updates over the rate limit replaced by a newer one",
+         STATS['throttledCoalesced']),
+        ('ufo_throttled_dropped_total', 'counter', "Other messages over the rate limit", STATS['throttledDropped']),
+        ('ufo_oversized_total', 'counter', "Connections closed for a message over MAX_FRAME", STATS['oversized']),
+        ('ufo_messages_in_total', 'counter', "Messages received from clients after the handshake", STATS['messagesIn']),
+        ('ufo_bytes_in_total', 'counter', "Bytes of those messages", STATS['bytesIn']),
+        ('ufo_messages_out_total', 'counter', "Messages written to clients", STATS['messagesOut']),
+        ('ufo_bytes_out_total', 'counter', "Bytes of those messages", STATS['bytesOut']),
+        ('ufo_dropped_total', 'counter', "Frames thrown away because an outbox was full", STATS['dropped']),
+        ('ufo_coalesced_total', 'counter', "Snapshots replaced by a newer one before they were sent", STATS['coalesced']),
+        ('ufo_send_queue_depth', 'gauge', "Frames waiting in every outbox together", queueDepth()),
+        ('ufo_send_queue_depth_max', 'gauge', "Most frames ever waiting for one client", STATS['maxQueueDepth']),
+        ('ufo_fanout_latency_seconds', 'histogram', "From a frame being queued for a client until it was written",
+         FANOUT_LATENCY),
+        ('ufo_event_loop_lag_seconds', 'histogram', "How much later than asked the event loop ran a timer", LOOP_LAG),
+        ('ufo_ticks_total', 'counter', "Authoritative simulation ticks", TICK_STATS['ticks']),
+        ('ufo_missed_ticks_total', 'counter', "Ticks skipped because the loop fell behind", TICK_STATS['missedTicks']),
+        ('ufo_last_tick_seconds', 'gauge', "Time the last tick took", TICK_STATS['lastTickMs']/1000),
+    ])
+
+def serveMetrics(connection, request):
+    #GET /metrics on the game port is answered as plain HTTP, every other
+    #path goes on to the websocket handshake
+    if request.path.split('?', 1)[0] == '/metrics':
+        response = connection.respond(http.HTTPStatus.OK, metricsText())
+        del response.headers['Content-Type']
+        response.headers['Content-Type'] = metrics.CONTENT_TYPE
+        return response
+
+def modeName():
+    return f"authoritative, {WORLD_BACKEND} world" if AUTHORITATIVE else "lockstep" if LOCKSTEP else "relay"
+
+def startBackgroundTasks():
+    #everything that runs next to the connections, for main and for asgi.py
+    tasks = [asyncio.create_task(reportStats()), asyncio.create_task(watchLoopLag()),
+             asyncio.create_task(runSpectators())]
+    if AUTHORITATIVE:
+        tasks.append(asyncio.create_task(runTicks()))
+    return tasks
+
 async def main():
     port = int(os.environ.get("PORT", 8765))
     host = "0.0.0.0"
-    
-    print(f"Server started on ws://{host}:{port}")
 
-    async with websockets.serve(handler, host, port):
-        await asyncio.Future()
+    print(f"Server started on ws://{host}:{port} ({modeName()} mode), metrics on http://{host}:{port}/metrics")
+
+    async with websockets.serve(handler, host, port, process_request=serveMetrics, max_size=MAX_FRAME):
+        tasks = startBackgroundTasks()
+        try:
+            await asyncio.Future()
+        finally:
+            for task in tasks:
+                task.cancel()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if WORKERS > 1:
+        import supervisor
+        supervisor.main(WORKERS)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,383 @@
+import numpy as np
+from classes import Star, BlackHole, release
+from engine import (World, applyInput, attackObstacle, checkTeleportTimer, checkGameOver,
+                    autoShootReady, aimedBullet, teleportPlayer, distance, swapRemove, hurt, damageSource)
+
+#struct-of-arrays backend for the engine: positions, velocities, radii,
+#bounds and a type tag live in NumPy columns, and the per-tick move, culling
+#and bullet/obstacle overlap tests are whole-array operations.
+#The rules are the same as engine.onStep, hit for hit (bench/soa.py checks it)
+
+KIND_BULLET = 0
+KIND_OBSTACLE = 1
+KIND_STAR = 2
+KIND_BLACKHOLE = 3
+
+COLUMNS = ('x', 'y', 'dx', 'dy', 'r', 'minY', 'maxY')
+
+class EntityStore:
+    #rows 0..size-1 of every column are live, objects holds the matching
+    #Bullet/Obstacle objects in the same order. The objects are only a view:
+    #their positions are written back lazily when someone asks for them
+    def __init__(self, isBullets, capacity=64):
+        self.isBullets = isBullets
+        self.size = 0
+        for name in COLUMNS:
+            setattr(self, name, np.empty(capacity))
+        self.kind = np.empty(capacity, dtype=np.int8)
+        self.objects = []
+        self.dirty = False
+
+    def grow(self):
+        capacity = 2*len(self.x)
+        for name in COLUMNS + ('kind',):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def put(self, i, obj):
+        if i == len(self.x):
+            self.grow()
+        self.x[i] = obj.x
+        self.y[i] = obj.y
+        self.r[i] = obj.r
+        if self.isBullets:
+            self.dx[i] = obj.dx
+            self.dy[i] = obj.dy
+            self.minY[i] = obj.minY
+            self.maxY[i] = obj.maxY
+            self.kind[i] = KIND_BULLET
+        else:
+            #obstacles only ever fly left at their own speed
+            self.dx[i] = -obj.speed
+            self.dy[i] = 0
+            self.minY[i] = -np.inf
+            self.maxY[i] = np.inf
+            if isinstance(obj, BlackHole):
+                self.kind[i] = KIND_BLACKHOLE
+            elif isinstance(obj, Star):
+                self.kind[i] = KIND_STAR
+            else:
+                self.kind[i] = KIND_OBSTACLE
+
+    def add(self, obj):
+        self.objects.append(obj)
+        self.put(self.size, obj)
+        self.size += 1
+
+    def load(self, objects):
+        #a whole new list, e.g. World.reset or a world from the server
+        self.objects = objects
+        self.size = 0
+        self.dirty = False
+        self.ingest()
+
+    def ingest(self):
+        #objects appended to the view from outside since the last tick
+        while self.size < len(self.objects):
+            self.put(self.size, self.objects[self.size])
+            self.size += 1
+
+    def sync(self):
+        if not self.dirty:
+            return
+        n = self.size
+        if self.isBullets:
+            for obj, x, y, dx, dy in zip(self.objects, self.x[:n].tolist(), self.y[:n].tolist(),
+                                         self.dx[:n].tolist(), self.dy[:n].tolist()):
+                obj.x = x
+                obj.y = y
+                obj.dx = dx
+                obj.dy = dy
+        else:
+            for obj, x in zip(self.objects, self.x[:n].tolist()):
+                obj.x = x
+        self.dirty = False
+
+    def view(self):
+        self.sync()
+        return self.objects
+
+    def compact(self, keep):
+        #keep: bool mask over the live rows, everything else is dropped in
+        #the same order engine.swapRemove would leave them, highest first.
+        #Only rows from the lowest dropped one up can move
+        n = self.size
+        dropped = np.flatnonzero(~keep).tolist()
+        if not dropped:
+            return
+        lo = dropped[0]
+        order = list(range(lo, n))
+        objects = self.objects
+        for j in reversed(dropped):
+            release(objects[j])
+            swapRemove(order, j - lo)
+        m = lo + len(order)
+        for name in COLUMNS + ('kind',):
+            column = getattr(self, name)
+            column[lo:m] = column[order]
+        objects[lo:n] = [objects[k] for k in order]
+        self.size = m
+
+    def remove(self, i):
+        keep = np.ones(self.size, dtype=bool)
+        keep[i] = False
+        self.compact(keep)
+
+def storeView(name):
+    #World's object lists, backed by a store
+    return property(lambda world: world.stores[name].view(),
+                    lambda world, objects: world.stores[name].load(objects))
+
+class ArrayWorld(World):
+    p1Bullets = storeView('p1Bullets')
+    p2Bullets = storeView('p2Bullets')
+    p1Obstacles = storeView('p1Obstacles')
+    p2Obstacles = storeView('p2Obstacles')
+
+    def __init__(self, width, height, stepsPerSecond=30, localRoles=(1, 2), rng=None, spawnRoles=(1,)):
+        self.stores = {
+            'p1Bullets': EntityStore(True),
+            'p2Bullets': EntityStore(True),
+            'p1Obstacles': EntityStore(False),
+            'p2Obstacles': EntityStore(False),
+        }
+        super().__init__(width, height, stepsPerSecond, localRoles, rng, spawnRoles)
+
+    def bulletStore(self, role):
+        return self.stores['p1Bullets' if role == 1 else 'p2Bullets']
+
+    def obstacleStore(self, role):
+        return self.stores['p1Obstacles' if role == 1 else 'p2Obstacles']
+
+    def addBullet(self, role, bullet):
+        self.bulletStore(role).add(bullet)
+
+    def addObstacle(self, role, obs):
+        self.obstacleStore(role).add(obs)
+
+    def step(self, inputs=None):
+        if self.gameOver:
+            return
+        if inputs:
+            for role, playerInput in inputs.items():
+                applyInput(self, role, playerInput)
+        onStep(self)
+
+def onStep(world):
+    #same order as engine.onStep
+    world.counter += 1
+    for store in world.stores.values():
+        store.ingest()
+
+    for role in world.spawnRoles:
+        if world.rng.randint(0, world.attackRate) == 0:
+            attackObstacle(world, role)
+
+    for role in world.localRoles:
+        me = world.player(role)
+        checkTeleportTimer(world, me)
+        checkAutoShoot(world, role, me)
+
+    for role in (1, 2):
+        updateBullets(world.bulletStore(role), world.width)
+        updateObstacles(world.obstacleStore(role))
+
+    checkTeleportCollision(world, world.p1, world.bulletStore(2))
+    checkTeleportCollision(world, world.p2, world.bulletStore(1))
+
+    for role in world.localRoles:
+        me = world.player(role)
+        myBullets = world.bulletStore(role)
+        checkCollisions(world, me, myBullets, world.obstacleStore(role))
+        checkCollisions(world, me, myBullets, world.obstacleStore(3 - role))
+        checkCollisions(world, me, myBullets, world.bulletStore(3 - role))
+
+    checkGameOver(world)
+
+def checkAutoShoot(world, role, player):
+    if not autoShootReady(world, player):
+        return
+
+    enemy = world.p2 if player == world.p1 else world.p1
+    if player.y < world.split:
+        store = world.obstacleStore(1)
+        enemyTargeted = enemy.y < world.split
+    else:
+        store = world.obstacleStore(2)
+        enemyTargeted = enemy.y >= world.split
+
+    #closest damaging obstacle, first one wins a tie, then the enemy
+    closestDist = world.width
+    target = None
+    n = store.size
+    if n:
+        d = np.sqrt((player.x - store.x[:n])**2 + (player.y - store.y[:n])**2)
+        kind = store.kind[:n]
+        d[(kind == KIND_STAR) | (kind == KIND_BLACKHOLE)] = np.inf
+        j = int(np.argmin(d))
+        if d[j] < closestDist:
+            closestDist = d[j]
+            target = (float(store.x[j]), float(store.y[j]))
+    if enemyTargeted and distance(player.x, player.y, enemy.x, enemy.y) < closestDist:
+        target = (enemy.x, enemy.y)
+
+    if target is not None:
+        world.bulletStore(role).add(aimedBullet(world, player, *target))
+
+def updateBullets(store, width):
+    n = store.size
+    if not n:
+        return
+    x = store.x[:n]
+    y = store.y[:n]
+    x += store.dx[:n]
+    y += store.dy[:n]
+    store.dirty = True
+    keep = (-50 < x) & (x < width + 50) & (store.minY[:n] <= y) & (y <= store.maxY[:n])
+    store.compact(keep)
+
+def updateObstacles(store):
+    n = store.size
+    if not n:
+        return
+    x = store.x[:n]
+    x += store.dx[:n]
+    store.dirty = True
+    store.compact(x > -store.r[:n])
+
+def overlapping(x, y, r, store):
+    #rows of store touching the circle, squared distances like spatial.overlaps
+    n = store.size
+    dx = x - store.x[:n]
+    dy = y - store.y[:n]
+    reach = store.r[:n] + r
+    return dx*dx + dy*dy < reach*reach
+
+def checkTeleportCollision(world, traveler, attackerBullets):
+    n = attackerBullets.size
+    if not n:
+        return
+    dx = attackerBullets.x[:n] - traveler.x
+    dy = attackerBullets.y[:n] - traveler.y
+    reach = traveler.r + attackerBullets.r[:n]
+    hits = np.flatnonzero(dx*dx + dy*dy < reach*reach)
+    if not len(hits):
+        return
+    #the old loop ran backwards and stopped at the first hit
+    attackerBullets.remove(int(hits[-1]))
+    if traveler.isTeleported:
+        hurt(world, traveler, traveler.score + 100, 'shot abroad')
+    else:
+        hurt(world, traveler, world.shotDamage, 'shot')
+
+def checkCollisions(world, player, bullets, obstacles):
+    bulletHits(world, bullets, obstacles)
+    playerHits(world, player, obstacles)
+
+def bulletHits(world, bullets, obstacles):
+    nb = bullets.size
+    no = obstacles.size
+    if not nb or not no:
+        return
+
+    #black holes only matter when the other universe has one to send to
+    targets = world.obstacleStore(2) if obstacles is world.obstacleStore(1) else world.obstacleStore(1)
+    #the newest one is the furthest right, like ObstacleIndex.latestBlackHole
+    holes = np.flatnonzero(targets.kind[:targets.size] == KIND_BLACKHOLE)
+    targetBH = int(holes[np.argmax(targets.x[holes])]) if len(holes) else None
+
+    kind = obstacles.kind[:no]
+    relevant = (kind == KIND_OBSTACLE) | (kind == KIND_BULLET)
+    if targetBH is not None:
+        relevant |= kind == KIND_BLACKHOLE
+
+    #broad phase: obstacles sorted by x, each bullet only gets the ones
+    #within reach along x (plus a pixel so rounding can't lose a pair)
+    order = np.argsort(obstacles.x[:no], kind='stable')
+    sortedX = obstacles.x[:no][order]
+    bx = bullets.x[:nb]
+    maxReach = obstacles.r[:no].max() + bullets.r[:nb].max() + 1
+    lo = np.searchsorted(sortedX, bx - maxReach, 'left')
+    counts = np.searchsorted(sortedX, bx + maxReach, 'right') - lo
+    total = int(counts.sum())
+    if not total:
+        return
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    bi = np.repeat(np.arange(nb), counts)
+    oj = order[np.arange(total) + starts]
+
+    #narrow phase, squared distances like spatial.overlaps
+    dx = bullets.x[bi] - obstacles.x[oj]
+    dy = bullets.y[bi] - obstacles.y[oj]
+    reach = obstacles.r[oj] + bullets.r[bi]
+    touching = (dx*dx + dy*dy < reach*reach) & relevant[oj]
+    bi = bi[touching]
+    oj = oj[touching]
+
+    #the few pairs left are resolved in the old order, bullets backwards and
+    #obstacles backwards, so a bullet can't take an obstacle an earlier
+    #bullet already destroyed
+    pairs = np.lexsort((-oj, -bi))
+    intoHole = (kind[oj[pairs]] == KIND_BLACKHOLE).tolist()
+    removed = set()
+    hit = set()
+    done = set()
+    for i, j, isHole in zip(bi[pairs].tolist(), oj[pairs].tolist(), intoHole):
+        if i in done or j in removed:
+            continue
+        done.add(i)
+        if isHole:
+            bullets.x[i] = targets.x[targetBH] + targets.r[targetBH] + bullets.r[i]
+            bullets.y[i] = targets.y[targetBH]
+            bullets.dx[i] = -bullets.dx[i]
+            bullets.dy[i] = 0
+            bullets.dirty = True
+        else:
+            removed.add(j)
+            hit.add(i)
+
+    if removed:
+        keep = np.ones(no, dtype=bool)
+        keep[list(removed)] = False
+        obstacles.compact(keep)
+    if hit:
+        keep = np.ones(nb, dtype=bool)
+        keep[list(hit)] = False
+        bullets.compact(keep)
+
+def playerHits(world, player, obstacles):
+    removed = np.zeros(obstacles.size, dtype=bool)
+    upper = obstacles.size
+    while upper:
+        touching = np.flatnonzero(overlapping(player.x, player.y, player.r, obstacles)[:upper])
+        moved = False
+        for j in touching[::-1].tolist():
+            obs = obstacles.objects[j]
+            if obstacles.kind[j] == KIND_STAR:
+                player.collectedStars.add(obs.starType)
+                if len(player.collectedStars) >= 2:
+                    player.isAutoShoot = True
+                    player.autoShootTimeUp = world.counter + (world.autoShootSeconds * world.stepsPerSecond)
+                    player.collectedStars.clear()
+                removed[j] = True
+
+            elif obstacles.kind[j] == KIND_BLACKHOLE:
+                if world.counter < player.teleportCooldown:
+                    continue
+                removed[j] = True
+                teleportPlayer(world, player)
+                #everything below j is checked again from the new position
+                moved = True
+                upper = j
+                break
+
+            else:
+                removed[j] = True
+                hurt(world, player, obs.damage, damageSource(obs))
+        if not moved:
+            break
+
+    if removed.any():
+        obstacles.compact(~removed)
@@ -0,0 +1,111 @@
+from bisect import bisect_left, insort
+from classes import Star, BlackHole
+
+#uniform grid broad phase for the collision checks in engine.py, and the
+#per-universe obstacle indexes
+
+class SpatialHash:
+    #cells are as big as the largest possible overlap distance, so anything
+    #touching a circle at (x, y) sits in its cell or one of the 8 around it
+    def __init__(self, items, cellSize):
+        self.cellSize = cellSize
+        self.cells = {}
+        for index, item in enumerate(items):
+            key = (int(item.x//cellSize), int(item.y//cellSize))
+            cell = self.cells.get(key)
+            if cell is None:
+                self.cells[key] = [index]
+            else:
+                cell.append(index)
+
+    def query(self, x, y):
+        #indices of the items near (x, y), highest first like the old
+        #backwards loops so the same item wins when there are several hits
+        cx = int(x//self.cellSize)
+        cy = int(y//self.cellSize)
+        cells = self.cells
+        found = []
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                cell = cells.get((gx, gy))
+                if cell is not None:
+                    found += cell
+        found.sort(reverse=True)
+        return found
+
+def maxRadius(items):
+    r = 0
+    for item in items:
+        if item.r > r:
+            r = item.r
+    return r
+
+def overlaps(ax, ay, bx, by, r):
+    #squared distance, no square root in the narrow phase
+    dx = ax - bx
+    dy = ay - by
+    return dx*dx + dy*dy < r*r
+
+def xOf(item):
+    return item.x
+
+class ObstacleIndex:
+    #one universe's black holes and damaging obstacles, each kept ordered
+    #by x. Everything of one kind flies left at the same speed, so moving
+    #never changes the order and only spawns and removals touch the index
+    def __init__(self, obstacles):
+        self.source = obstacles #the list this index describes
+        self.blackHoles = []
+        self.damaging = []
+        for obs in obstacles:
+            self.add(obs)
+
+    def kindOf(self, obs):
+        if isinstance(obs, BlackHole):
+            return self.blackHoles
+        if isinstance(obs, Star):
+            return None
+        return self.damaging
+
+    def add(self, obs):
+        items = self.kindOf(obs)
+        if items is not None:
+            insort(items, obs, key=xOf)
+
+    def remove(self, obs):
+        items = self.kindOf(obs)
+        if items is None:
+            return
+        i = bisect_left(items, obs.x, key=xOf)
+        if i < len(items) and items[i] is obs:
+            del items[i]
+        else:
+            #another one at the very same x
+            items.remove(obs)
+
+    def latestBlackHole(self):
+        #black holes spawn at the right edge, the furthest right is the newest
+        return self.blackHoles[-1] if self.blackHoles else None
+
+    def nearest(self, x, y, maxDist):
+        #closest damaging obstacle nearer than maxDist, walking out from x
+        #both ways until the gap in x alone is too big
+        items = self.damaging
+        best = None
+        bestDist = maxDist
+        start = bisect_left(items, x, key=xOf)
+        for k in range(start, len(items)):
+            obs = items[k]
+            if obs.x - x > bestDist:
+                break
+            d = ((x - obs.x)**2 + (y - obs.y)**2)**0.5
+            if d < bestDist:
+                best, bestDist = obs, d
+        for k in range(start - 1, -1, -1):
+            obs = items[k]
+            if x - obs.x > bestDist:
+                break
+            d = ((x - obs.x)**2 + (y - obs.y)**2)**0.5
+            if d < bestDist:
+                best, bestDist = obs, d
+        return best, bestDist
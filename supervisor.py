@@ -0,0 +1,255 @@
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+import urllib.parse
+import websockets
+from websockets.asyncio.server import ServerConnection
+from websockets.server import ServerProtocol
+import server
+
+#multi-process mode of server.py (WORKERS > 1). The supervisor owns the
+#port and only accepts: it peeks at the HTTP upgrade request, picks the
+#worker from the match id in the URL (ws://host/?match=<id>) and hands the
+#socket itself to that worker over a unix socket. Both players of a match
+#end up on the same worker and every byte after the accept is the worker's
+#
+#   supervisor: accept -> peek "GET /?match=abc" -> crc32("abc") % WORKERS
+#   worker k:   recv_fds -> websockets handshake -> server.handler
+#
+#Quick matches have no id yet, they are handed out two at a time to each
+#worker in turn, so the two that pair up usually meet on the same one. The
+#worker makes up an id that hashes back to itself (server.quickMatchId)
+
+#seconds between health checks, a worker that misses HEALTH_TIMEOUT worth of
+#them is killed and started again. Its matches are lost
+HEALTH_INTERVAL = float(os.environ.get("HEALTH_INTERVAL", 2))
+HEALTH_TIMEOUT = float(os.environ.get("HEALTH_TIMEOUT", 6))
+#the upgrade request has to be in within this long and this many bytes
+PEEK_TIMEOUT = 5
+MAX_REQUEST = 8192
+#channel messages, one byte each, the socket rides along with HANDOFF
+HANDOFF = b'c'
+PING = b'p'
+
+def requestTarget(request):
+    #(path, query dict) of the request line, None if it isn't one
+    line = request.split(b'\r\n', 1)[0].split()
+    if len(line) != 3:
+        return None
+    target = urllib.parse.urlsplit(line[1].decode('latin-1'))
+    return target.path, urllib.parse.parse_qs(target.query)
+
+class Worker:
+    def __init__(self, index, loop):
+        self.index = index
+        self.loop = loop
+        self.process = None
+        self.channel = None
+        self.lastPong = 0
+
+    def start(self):
+        #SEQPACKET keeps every message and the socket sent with it together
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        #spawn, a fork would inherit the running event loop
+        context = multiprocessing.get_context('spawn')
+        self.process = context.Process(target=runWorker, args=(self.index, child), name=f"worker-{self.index}",
+                                       daemon=True)
+        self.process.start()
+        child.close()
+        parent.setblocking(False)
+        self.channel = parent
+        self.lastPong = time.monotonic()
+        self.loop.add_reader(parent.fileno(), self.readReplies)
+
+    def stop(self):
+        if self.channel is not None:
+            self.loop.remove_reader(self.channel.fileno())
+            self.channel.close()
+            self.channel = None
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+            self.process.join(1)
+
+    def readReplies(self):
+        try:
+            while self.channel.recv(16):
+                self.lastPong = time.monotonic()
+        except (BlockingIOError, OSError):
+            return
+        #the worker's end is closed. The fd stays readable at EOF, left
+        #registered it would spin until the health check restarts the worker
+        self.loop.remove_reader(self.channel.fileno())
+
+    def isHealthy(self):
+        return self.process.is_alive() and time.monotonic() - self.lastPong < HEALTH_TIMEOUT
+
+    def ping(self):
+        try:
+            self.channel.send(PING)
+        except OSError:
+            pass
+
+    def handOff(self, conn):
+        #False if the worker isn't taking sockets, the caller closes it then
+        try:
+            socket.send_fds(self.channel, [HANDOFF], [conn.fileno()])
+            return True
+        except OSError:
+            return False
+
+class Supervisor:
+    def __init__(self, workers):
+        self.workerCount = workers
+        self.workers = []
+        self.quickJoins = 0
+        self.stats = {'accepted': 0, 'handedOff': 0, 'rejected': 0, 'restarts': 0}
+
+    def pick(self, request):
+        target = requestTarget(request)
+        if target is None:
+            return None
+        path, query = target
+        if path == '/metrics':
+            #each worker counts for itself, ?worker=<n> picks which one
+            try:
+                return self.workers[int(query.get('worker', ['0'])[0]) % self.workerCount]
+            except ValueError:
+                return None
+        matchId = query.get('match', [None])[0]
+        if matchId is not None:
+            return self.workers[server.workerFor(matchId, self.workerCount)]
+        index = (self.quickJoins//2) % self.workerCount
+        self.quickJoins += 1
+        return self.workers[index]
+
+    async def peek(self, conn):
+        #the upgrade request without taking it off the socket, the worker
+        #reads it again for the handshake
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + PEEK_TIMEOUT
+        while loop.time() < deadline:
+            readable = loop.create_future()
+            #called until it is removed, the first call is the one that counts
+            loop.add_reader(conn.fileno(), lambda: readable.done() or readable.set_result(None))
+            try:
+                await asyncio.wait_for(readable, deadline - loop.time())
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                loop.remove_reader(conn.fileno())
+            try:
+                data = conn.recv(MAX_REQUEST, socket.MSG_PEEK)
+            except BlockingIOError:
+                continue
+            if not data:
+                return None
+            if b'\r\n\r\n' in data or len(data) >= MAX_REQUEST:
+                return data
+            #only part of it, wait for the rest instead of spinning on it
+            await asyncio.sleep(0.005)
+        return None
+
+    async def route(self, conn):
+        try:
+            request = await self.peek(conn)
+            worker = self.pick(request) if request is not None else None
+            if worker is not None and worker.handOff(conn):
+                self.stats['handedOff'] += 1
+            else:
+                self.stats['rejected'] += 1
+        finally:
+            #the worker has its own copy of the socket now
+            conn.close()
+
+    async def checkHealth(self):
+        while True:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            for worker in self.workers:
+                if not worker.isHealthy():
+                    print(f"WARNING: worker {worker.index} is not responding, restarting it")
+                    worker.stop()
+                    worker.start()
+                    self.stats['restarts'] += 1
+                else:
+                    worker.ping()
+
+    async def run(self, host, port):
+        loop = asyncio.get_running_loop()
+        for index in range(self.workerCount):
+            worker = Worker(index, loop)
+            worker.start()
+            self.workers.append(worker)
+
+        listener = socket.create_server((host, port), backlog=1024)
+        listener.setblocking(False)
+        print(f"Server started on ws://{host}:{port} ({server.modeName()} mode, {self.workerCount} workers), "
+              f"metrics on http://{host}:{port}/metrics?worker=<n>")
+        health = asyncio.create_task(self.checkHealth())
+        try:
+            while True:
+                conn, _ = await loop.sock_accept(listener)
+                conn.setblocking(False)
+                self.stats['accepted'] += 1
+                loop.create_task(self.route(conn))
+        finally:
+            health.cancel()
+            listener.close()
+            for worker in self.workers:
+                worker.stop()
+
+async def serveWorker(index, channel):
+    loop = asyncio.get_running_loop()
+    #the connections come from the supervisor. The server listens on an unnamed
+    #unix socket nobody connects to, it is there for its handshake and
+    #per-connection handler, and a server that isn't serving answers 503
+    idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    idle.bind('')
+    relay = await websockets.unix_serve(server.handler, sock=idle, process_request=server.serveMetrics,
+                                        max_size=server.MAX_FRAME)
+    def connection():
+        #websockets' own factory would pass max_size, this one has to
+        return ServerConnection(ServerProtocol(max_size=server.MAX_FRAME), relay)
+
+    done = loop.create_future()
+    def readChannel():
+        while True:
+            try:
+                message, fds, flags, address = socket.recv_fds(channel, 16, 8)
+            except BlockingIOError:
+                return
+            if not message:
+                #the supervisor is gone, so is the port
+                if not done.done():
+                    done.set_result(None)
+                return
+            if message == PING:
+                channel.send(PING)
+            for fd in fds:
+                sock = socket.socket(fileno=fd)
+                sock.setblocking(False)
+                loop.create_task(loop.connect_accepted_socket(connection, sock))
+
+    channel.setblocking(False)
+    loop.add_reader(channel.fileno(), readChannel)
+    tasks = server.startBackgroundTasks()
+    await done
+    for task in tasks:
+        task.cancel()
+    relay.close()
+
+def runWorker(index, channel):
+    print(f"INFO: worker {index} started, pid {os.getpid()}")
+    server.WORKER_INDEX = index
+    try:
+        asyncio.run(serveWorker(index, channel))
+    except KeyboardInterrupt:
+        pass
+
+def main(workers):
+    port = int(os.environ.get("PORT", 8765))
+    try:
+        asyncio.run(Supervisor(workers).run("0.0.0.0", port))
+    except KeyboardInterrupt:
+        pass